@@ -0,0 +1,133 @@
+# -*- coding: UTF8 -*-
+# Message aggregation on top of "sx127x" driver: several small
+# application messages are packed into one radio packet
+# Licenced by GPLv3
+#
+# Packet format (length-prefixed records):
+#   [AGG_MAGIC] [len1] [msg1...] [len2] [msg2...] ...
+#
+# Packet is sent when next message does not fit into `size` bytes or
+# when the oldest queued message waits longer than `deadline_ms`.
+# Each packet pays preamble and header once, so airtime per message
+# drops several times for short telemetry messages.
+
+from sx127x import ticks_ms, ticks_diff, MAX_PKT_LENGTH
+
+AGG_MAGIC = 0xA6 # first byte of aggregated packet
+
+
+class Aggregator:
+    def __init__(self, radio,
+                 size        = MAX_PKT_LENGTH, # maximum packet size [bytes]
+                 deadline_ms = 1000,           # maximum delay of message [ms]
+                 onMessage   = None,           # callback(radio, msg, crcOk)
+                 addr        = None):          # destination address (or None)
+        self.radio = radio
+        self._add = 0 if addr is None else 1 # address byte
+        self.size = min(size, MAX_PKT_LENGTH - self._add)
+        self.deadline = deadline_ms
+        self.addr = addr
+        self._buf = bytearray(self.size)
+        self._mv  = memoryview(self._buf)
+        self._len = 0    # bytes in buffer
+        self._t0  = 0    # ticks_ms of first message in buffer
+        self._airtime = 0 # sum of airtime of queued messages sent one by one
+        self._count = 0   # queued messages
+        self.stats = {'packets':  0, # sent packets
+                      'messages': 0, # sent messages
+                      'airtime':  0, # airtime of sent packets [us]
+                      'single':   0, # airtime if each message was sent alone [us]
+                      'failed':   0, # failed sends (TX timeout or abort)
+                      'dropped':  0, # messages dropped (buffer kept by failed send)
+                      'received': 0} # received messages
+        self._onMessage = onMessage
+        if onMessage:
+            radio.onReceive(self._handleOnReceive)
+
+
+    def put(self, msg):
+        """queue message (str/bytes up to `size - 2` bytes); send packet if
+           full; return False if message is dropped (packet is not sent)"""
+        if isinstance(msg, str):
+            msg = msg.encode()
+        n = len(msg)
+        if n > self.size - 2:
+            raise ValueError('Message too long')
+        if self._len + 1 + n > self.size and not self.flush():
+            self.stats['dropped'] += 1
+            return False
+        if self._len == 0:
+            self._buf[0] = AGG_MAGIC
+            self._len = 1
+            self._t0 = ticks_ms()
+        i = self._len
+        self._buf[i] = n
+        self._buf[i + 1:i + 1 + n] = msg
+        self._len = i + 1 + n
+        self._airtime += self.radio.airtime(n + self._add)
+        self._count += 1
+        if self._len + 1 >= self.size: # no room for next message
+            self.flush() # retried by next put()/poll() on failure
+        return True
+
+
+    def pending(self):
+        """get number of queued bytes"""
+        return self._len
+
+
+    def poll(self):
+        """send packet if deadline of oldest message expired; call it often;
+           return result of flush() or False if it is not time to send"""
+        if self._len and ticks_diff(ticks_ms(), self._t0) >= self.deadline:
+            return self.flush()
+        return False
+
+
+    def flush(self):
+        """send queued messages now; return result of send() of radio (True,
+           None if aborted, False on timeout; True if nothing is queued);
+           messages are kept on failure and sent again by next flush()"""
+        if not self._len:
+            return True
+        ok = self.radio.send(self._mv[:self._len], False, None, self.addr)
+        stats = self.stats
+        if not ok:
+            stats['failed'] += 1
+            self._t0 = ticks_ms() # retry after deadline
+            return ok
+        stats['packets']  += 1
+        stats['messages'] += self._count
+        stats['airtime']  += self.radio.airtime(self._len + self._add)
+        stats['single']   += self._airtime
+        self._len = 0
+        self._count = 0
+        self._airtime = 0
+        return ok
+
+
+    def gain(self):
+        """get airtime gain (airtime of single messages / real airtime)"""
+        airtime = self.stats['airtime']
+        return self.stats['single'] / airtime if airtime else 1.
+
+
+    def _handleOnReceive(self, radio, payload, crcOk):
+        # unpack records of aggregated packet into callbacks
+        size = len(payload)
+        if not size or payload[0] != AGG_MAGIC: # not aggregated packet
+            self.stats['received'] += 1
+            self._onMessage(radio, payload, crcOk)
+            return
+        i = 1
+        while i < size:
+            n = payload[i]
+            i += 1
+            if i + n > size:
+                break # broken record
+            self.stats['received'] += 1
+            self._onMessage(radio, payload[i:i + n], crcOk)
+            i += n
+
+
+#*** end of "aggregate.py" module ***#
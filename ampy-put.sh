@@ -1,10 +1,40 @@
 #!/bin/sh
 
 if mpy-cross -O3 main.py && \
-   mpy-cross -O3 sx127x.py
+   mpy-cross -O3 sx127x.py && \
+   mpy-cross -O3 -march=xtensa sx127x_native.py && \
+   mpy-cross -O3 tdma.py && \
+   mpy-cross -O3 gateway.py && \
+   mpy-cross -O3 scanner.py && \
+   mpy-cross -O3 aggregate.py && \
+   mpy-cross -O3 codec.py && \
+   mpy-cross -O3 multisf.py && \
+   mpy-cross -O3 capture.py && \
+   mpy-cross -O3 relay.py && \
+   mpy-cross -O3 tpc.py && \
+   mpy-cross -O3 energy.py && \
+   mpy-cross -O3 sniffer.py && \
+   mpy-cross -O3 rpc.py && \
+   mpy-cross -O3 tempcal.py && \
+   mpy-cross -O3 pktlog.py
 then
   ampy --port /dev/ttyUSB0 put main.py
   #ampy --port /dev/ttyUSB0 put sx127x.py
   ampy --port /dev/ttyUSB0 put sx127x.mpy
+  ampy --port /dev/ttyUSB0 put sx127x_native.mpy
+  ampy --port /dev/ttyUSB0 put tdma.mpy
+  ampy --port /dev/ttyUSB0 put gateway.mpy
+  ampy --port /dev/ttyUSB0 put scanner.mpy
+  ampy --port /dev/ttyUSB0 put aggregate.mpy
+  ampy --port /dev/ttyUSB0 put codec.mpy
+  ampy --port /dev/ttyUSB0 put multisf.mpy
+  ampy --port /dev/ttyUSB0 put capture.mpy
+  ampy --port /dev/ttyUSB0 put relay.mpy
+  ampy --port /dev/ttyUSB0 put tpc.mpy
+  ampy --port /dev/ttyUSB0 put energy.mpy
+  ampy --port /dev/ttyUSB0 put sniffer.mpy
+  ampy --port /dev/ttyUSB0 put rpc.mpy
+  ampy --port /dev/ttyUSB0 put tempcal.mpy
+  ampy --port /dev/ttyUSB0 put pktlog.mpy
 fi
 
@@ -1,4 +1,4 @@
 #!/bin/sh
 
-sudo ampy --port /dev/ttyUSB0 run test.py
+sudo ampy --port /dev/ttyUSB0 run bench.py
 
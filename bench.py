@@ -0,0 +1,740 @@
+# -*- coding: UTF8 -*-
+# Benchmark suite of "sx127x" driver
+# Licenced by GPLv3
+#
+# Every result is printed as one JSON line:
+#   {"bench": "reg_read", "value": 12345.6, "unit": "op/s", "port": "linux",
+#    "fake": true, ...}
+#
+# Run on host with fake SPI/Pin (look "fakehw.py"):
+#   $ python3 bench.py > new.jsonl
+#   $ micropython bench.py > new.jsonl
+#
+# Run on board with SX127x connected (RX benchmark needs other node
+# sending packets, for example "main.py" with `MODE = 1`):
+#   $ ampy --port /dev/ttyUSB0 put bench.py
+#   $ ampy --port /dev/ttyUSB0 run bench.py > new.jsonl
+#
+# Compare results of two commits (CPython):
+#   $ python3 bench.py --compare old.jsonl new.jsonl
+
+import sys
+import gc
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import fakehw
+    FAKE = fakehw.install() # use fake hardware if there is no real one
+except ImportError: # board without "fakehw.py"
+    FAKE = False
+
+import sx127x
+from sx127x import ticks_us, ticks_diff, sleep_ms
+
+# SF/BW grid for send()/packet rate benchmarks
+SF_LIST = (7, 8, 9, 10, 11, 12)
+BW_LIST = (125., 250., 500.)
+
+PAYLOAD_SIZE = 16 # typical telemetry packet [bytes]
+
+# default GPIO for fake board (no reset pin -> no reset delays)
+FAKE_GPIO = {'led': 2, 'reset': None, 'dio0': 4, 'cs': 15,
+             'sck': 14, 'mosi': 13, 'miso': 12}
+
+
+def result(bench, value, unit, **extra):
+    """print one benchmark result as JSON line"""
+    res = {'bench': bench, 'value': value, 'unit': unit,
+           'port': sys.platform, 'fake': FAKE}
+    for key in extra:
+        res[key] = extra[key]
+    print(json.dumps(res))
+
+
+def mem_free():
+    """get free heap [bytes] (or None on CPython)"""
+    try:
+        return gc.mem_free()
+    except AttributeError:
+        return None
+
+
+def spi_count():
+    """get number of SPI transactions (fake hardware only)"""
+    return fakehw.Board.current.chip.cs_count if FAKE else 0
+
+
+def radio(mode=sx127x.LORA):
+    if FAKE:
+        fakehw.Board()
+        return sx127x.RADIO(mode=mode, gpio=FAKE_GPIO)
+    return sx127x.RADIO(mode=mode)
+
+
+def bench_regs(tr, n=2000):
+    """register reads/writes per second"""
+    t = ticks_us()
+    for i in range(n):
+        tr.readReg(sx127x.REG_VERSION)
+    dt = ticks_diff(ticks_us(), t)
+    result('reg_read', n * 1e6 / dt, 'op/s')
+
+    t = ticks_us()
+    for i in range(n):
+        tr.writeReg(sx127x.REG_FIFO_ADDR_PTR, 0)
+    dt = ticks_diff(ticks_us(), t)
+    result('reg_write', n * 1e6 / dt, 'op/s')
+
+    t = ticks_us()
+    for i in range(n):
+        tr.readRegs(sx127x.REG_FRF_MSB, 3)
+    dt = ticks_diff(ticks_us(), t)
+    result('reg_burst_read3', n * 1e6 / dt, 'op/s')
+
+
+def bench_fifo(tr, n=100):
+    """FIFO bytes per second (LoRa FIFO data buffer)"""
+    buf = bytes(range(sx127x.MAX_PKT_LENGTH))
+    t = ticks_us()
+    for i in range(n):
+        tr.writeReg(sx127x.REG_FIFO_ADDR_PTR, 0)
+        tr.writeRegs(sx127x.REG_FIFO, buf)
+    dt = ticks_diff(ticks_us(), t)
+    result('fifo_write', n * len(buf) * 1e6 / dt, 'B/s')
+
+    t = ticks_us()
+    for i in range(n):
+        tr.writeReg(sx127x.REG_FIFO_ADDR_PTR, 0)
+        tr.readRegs(sx127x.REG_FIFO, len(buf))
+    dt = ticks_diff(ticks_us(), t)
+    result('fifo_read', n * len(buf) * 1e6 / dt, 'B/s')
+
+
+def bench_init(tr, n=5):
+    """duration of init()"""
+    for mode in (sx127x.LORA, sx127x.FSK):
+        t = ticks_us()
+        for i in range(n):
+            tr.init(mode=mode)
+        dt = ticks_diff(ticks_us(), t)
+        result('init', dt / n, 'us', mode=mode)
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_recover(tr, n=5):
+    """duration and SPI transactions of recover() versus init()"""
+    for mode in (sx127x.LORA, sx127x.FSK):
+        c = spi_count()
+        tr.init(mode=mode)
+        result('init_spi', spi_count() - c, 'op', mode=mode)
+        c = spi_count()
+        t = ticks_us()
+        for i in range(n):
+            tr.recover()
+        dt = ticks_diff(ticks_us(), t)
+        result('recover', dt / n, 'us', mode=mode)
+        result('recover_spi', (spi_count() - c) // n, 'op', mode=mode)
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_temp(tr, n=20):
+    """cost of chip temperature sample (LoRa: FSK modem switch)"""
+    for mode in (sx127x.LORA, sx127x.FSK):
+        tr.init(mode=mode)
+        c = spi_count()
+        t = ticks_us()
+        for i in range(n):
+            tr.getTemp()
+        dt = ticks_diff(ticks_us(), t)
+        result('get_temp', dt / n, 'us', mode=mode)
+        result('get_temp_spi', (spi_count() - c) // n, 'op', mode=mode)
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_send(tr, n=3):
+    """send() time versus airtime and packet rate at each SF/BW (LoRa)"""
+    payload = bytes(PAYLOAD_SIZE)
+    for bw in BW_LIST:
+        for sf in SF_LIST:
+            tr.setBW(bw)
+            tr.setSF(sf)
+            tr.setLDRO((1 << sf) / bw > 16.) # symbol time > 16 ms
+            airtime = tr.airtime(PAYLOAD_SIZE)
+            if not FAKE and airtime * n > 10000000:
+                n = 1 # do not wait too long on real hardware
+            spi = spi_count()
+            t = ticks_us()
+            for i in range(n):
+                tr.send(payload)
+            dt = ticks_diff(ticks_us(), t) // n
+            if FAKE and sf == SF_LIST[0] and bw == BW_LIST[0]:
+                result('send_spi', (spi_count() - spi) / n, 'op')
+            # fake chip sends at once: all time is CPU time
+            cpu = dt if FAKE else max(dt - airtime, 0)
+            result('send', dt, 'us', sf=sf, bw=bw, size=PAYLOAD_SIZE,
+                   airtime=airtime, cpu=cpu)
+            result('pkt_rate', 1e6 / (airtime + cpu), 'pkt/s', sf=sf, bw=bw,
+                   size=PAYLOAD_SIZE)
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_profile(tr, board=None, n=5):
+    """SPI transactions and airtime of send()/receive() in explicit header,
+       per-call implicit header and fixed length profile (LoRa SF7)"""
+    tr.setSF(7)
+    tr.setLDRO(False)
+    payload = bytes(PAYLOAD_SIZE)
+    tr.addProfile('bench', PAYLOAD_SIZE)
+    for header, fixed, profile in (('explicit', False, None),
+                                   ('implicit', True,  None),
+                                   ('profile',  True,  'bench')):
+        tr.send(payload, fixed, profile=profile) # switch header mode
+        spi = spi_count()
+        for i in range(n):
+            tr.send(payload, fixed, profile=profile)
+        if FAKE:
+            result('profile_send_spi', (spi_count() - spi) / n, 'op', header=header)
+        result('profile_airtime', tr.airtime(PAYLOAD_SIZE, fixed), 'us',
+               header=header)
+        if board and fixed:
+            tr.onReceive(lambda radio, payload, crcOk: None)
+            tr.receive(PAYLOAD_SIZE, profile)
+            spi = spi_count()
+            for i in range(n):
+                board.chip.inject(payload)
+            result('profile_rx_spi', (spi_count() - spi) / n, 'op', header=header)
+            tr.onReceive(None)
+            tr.standby() # stop listening (no RX re-arm by send())
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_listen(tr, n=5):
+    """SPI transactions and time of send() back to RX: send() and
+       receive() by caller versus RX re-arm by always-listening send()"""
+    payload = bytes(PAYLOAD_SIZE)
+    tr.setSF(7)
+    tr.setLDRO(False)
+    for name in ('manual', 'listen'):
+        tr.receive(0)
+        tr.send(payload)
+        spi = spi_count()
+        t = ticks_us()
+        for i in range(n):
+            if name == 'manual':
+                tr.standby()
+                tr.send(payload)
+                tr.receive(0)
+            else:
+                tr.send(payload)
+        dt = ticks_diff(ticks_us(), t) // n
+        if FAKE:
+            result('listen_spi', (spi_count() - spi) / n, 'op', rearm=name)
+            result('listen', dt, 'us', rearm=name)
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_rx(tr, board=None, n=50, timeout_ms=10000):
+    """DIO0-to-callback latency, handler time and heap per packet"""
+    lat = []
+    def on_receive(radio, payload, crcOk):
+        lat.append(ticks_diff(ticks_us(), radio.getRxTicks()))
+
+    tr.onReceive(on_receive)
+    tr.receive(0)
+    payload = bytes(PAYLOAD_SIZE)
+    gc.collect()
+    mem = mem_free()
+    spi = spi_count()
+    t = ticks_us()
+    if board: # fake board: inject packets
+        for i in range(n):
+            board.chip.inject(payload)
+    else: # real board: wait packets from other node
+        t0 = ticks_us()
+        while len(lat) < n and ticks_diff(ticks_us(), t0) < timeout_ms * 1000:
+            sleep_ms(1)
+        t = ticks_us()
+    dt = ticks_diff(ticks_us(), t)
+    spi = spi_count() - spi
+    tr.onReceive(None)
+    tr.standby()
+    gc.collect()
+    if not lat:
+        return
+    n = len(lat)
+    lat.sort()
+    result('rx_latency', sum(lat) / n, 'us', min=lat[0], max=lat[-1],
+           median=lat[n // 2])
+    if board:
+        result('rx_handler', dt / n, 'us')
+        result('rx_spi', spi / n, 'op')
+    if mem is not None:
+        result('rx_heap', (mem - mem_free()) / n, 'B')
+
+
+def bench_alloc(tr, board, n=50):
+    """allocated bytes per received packet (CPython: tracemalloc)"""
+    try:
+        import tracemalloc
+    except ImportError:
+        return
+    tr.onReceive(lambda radio, payload, crcOk: None)
+    tr.receive(0)
+    payload = bytes(PAYLOAD_SIZE)
+    tracemalloc.start()
+    for i in range(n):
+        board.chip.inject(payload)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tr.onReceive(None)
+    tr.standby()
+    result('rx_alloc_peak', peak, 'B')
+
+
+def bench_native(tr, n=2000):
+    """hot paths: pure Python versus native/viper (if port supports them)"""
+    impls = [('py', sx127x.putBE_py, sx127x.xfer_py, sx127x.waitFlags_py)]
+    if sx127x.NATIVE:
+        impls.append(('native', sx127x.putBE, sx127x.xfer, sx127x.waitFlags))
+    rates = {}
+    buf = bytearray(3)
+    reg = bytearray(2)
+    read = tr.readReg
+    for impl, putBE, xfer, waitFlags in impls:
+        t = ticks_us()
+        for i in range(n):
+            putBE(buf, i, 3)
+        dt = ticks_diff(ticks_us(), t)
+        rates['put_be', impl] = n * 1e6 / dt
+
+        t = ticks_us()
+        for i in range(n):
+            xfer(tr._spiXfer, tr._cs, reg, sx127x.REG_VERSION, 0)
+        dt = ticks_diff(ticks_us(), t)
+        rates['xfer', impl] = n * 1e6 / dt
+
+        # `RegVersion` bit 7 is never set: poll until timeout
+        polls = [0]
+        def counted(reg):
+            polls[0] += 1
+            return read(reg)
+        waitFlags(counted, sx127x.REG_VERSION, 0x80, 20000)
+        rates['wait_flags', impl] = polls[0] * 1e6 / 20000
+
+    for path in ('put_be', 'xfer', 'wait_flags'):
+        for impl, putBE, xfer, waitFlags in impls:
+            result('hot_' + path, rates[path, impl], 'op/s', impl=impl,
+                   speedup=rates[path, impl] / rates[path, 'py'])
+
+
+def bench_capture(tr, n=2000):
+    """maximum sustainable bitrate of continuous mode capture (capture.py)"""
+    from capture import Capture
+    cap = Capture(tr, bits=4096, frame_bits=64)
+    isr, dec = cap.maxBitrate(n)
+    result('capture_irq_limit', isr, 'bit/s')
+    result('capture_poll_limit', dec, 'bit/s')
+    result('capture_max_bitrate', min(isr, dec), 'bit/s')
+
+
+def bench_energy(tr, n=1000):
+    """cost of energy accounting hook per mode change (energy.py)"""
+    from energy import Energy
+    for hooked in (False, True):
+        energy = Energy(tr) if hooked else None
+        t = ticks_us()
+        for i in range(n):
+            tr.setMode(sx127x.MODE_STDBY)
+        dt = ticks_diff(ticks_us(), t)
+        if energy:
+            energy.close()
+        result('set_mode', dt / n, 'us', energy=hooked)
+
+
+def bench_sniffer(tr, n=200, size=32):
+    """cost and UART size of binary sniffer frame vs text output (sniffer.py)"""
+    from sniffer import Sniffer
+    class Null:
+        def write(self, buf): return len(buf)
+    snf = Sniffer(tr, Null(), size=1024)
+    payload = bytes(size)
+    t = ticks_us()
+    for i in range(n):
+        snf._handleOnReceive(tr, payload, True)
+        snf.poll()
+    dt = ticks_diff(ticks_us(), t)
+    frame = snf.bytes // n
+    t = ticks_us()
+    for i in range(n): # text of `on_receive()` in "main.py" (without print)
+        text = "*** Received message:\n%s\n^^^ CrcOk=%s, size=%d, RSSI=%s, SNR=%s\n\n" % (
+               ' '.join('%02X' % b for b in payload), True, len(payload),
+               tr.getPktRSSI(), tr.getSNR())
+    dtt = ticks_diff(ticks_us(), t)
+    tr.onReceive(None)
+    result('sniffer_frame', dt / n, 'us', size=size, text=dtt / n)
+    result('sniffer_uart_ratio', len(text) / frame, 'ratio', size=frame,
+           text=len(text))
+
+
+def bench_aggregate(tr, n=60, size=8):
+    """airtime per message with and without aggregation (LoRa)"""
+    from aggregate import Aggregator
+    agg = Aggregator(tr, deadline_ms=60000)
+    msg = bytes(size)
+    t = ticks_us()
+    for i in range(n):
+        agg.put(msg)
+    agg.flush()
+    dt = ticks_diff(ticks_us(), t)
+    stats = agg.stats
+    result('agg_airtime', stats['airtime'] / n, 'us', size=size)
+    result('agg_single_airtime', stats['single'] / n, 'us', size=size)
+    result('agg_msg_rate', n * 1e6 / stats['airtime'], 'msg/s', size=size)
+    if FAKE:
+        result('agg_cpu', dt / n, 'us', size=size)
+
+
+def bench_codec(n=200):
+    """encode/decode rate and size of telemetry payload (codec.py)"""
+    import codec
+    text = '{"temp":21.37,"hum":55.5,"bat":3.71,"seq":1234}'
+    schema = codec.Schema('<hHBH', ('temp', 'hum', 'bat', 'seq'),
+                          (100, 10, 50, 1))
+    values = {'temp': 21.37, 'hum': 55.5, 'bat': 3.71, 'seq': 1234}
+    series = [2137 + (i * 7) % 13 - 6 for i in range(32)]
+    words = codec.Dictionary(('{"', '":', ',"', 'temp', 'hum', 'bat', 'seq'))
+
+    t = ticks_us()
+    for i in range(n):
+        data = schema.pack(values)
+    dt = ticks_diff(ticks_us(), t)
+    result('codec_schema_pack', n * 1e6 / dt, 'op/s', size=len(data),
+           text=len(text))
+    t = ticks_us()
+    for i in range(n):
+        schema.unpack(data)
+    dt = ticks_diff(ticks_us(), t)
+    result('codec_schema_unpack', n * 1e6 / dt, 'op/s')
+
+    t = ticks_us()
+    for i in range(n):
+        data = codec.encodeDelta(series)
+    dt = ticks_diff(ticks_us(), t)
+    result('codec_delta_encode', n * len(series) * 1e6 / dt, 'val/s',
+           size=len(data), raw=2 * len(series))
+    t = ticks_us()
+    for i in range(n):
+        codec.decodeDelta(data)
+    dt = ticks_diff(ticks_us(), t)
+    result('codec_delta_decode', n * len(series) * 1e6 / dt, 'val/s')
+
+    t = ticks_us()
+    for i in range(n):
+        data = words.compress(text)
+    dt = ticks_diff(ticks_us(), t)
+    result('codec_dict_compress', n * len(text) * 1e6 / dt, 'B/s',
+           size=len(data), text=len(text))
+    t = ticks_us()
+    for i in range(n):
+        words.decompress(data)
+    dt = ticks_diff(ticks_us(), t)
+    result('codec_dict_decompress', n * len(text) * 1e6 / dt, 'B/s')
+
+
+def bench_flood(n=5):
+    """mesh relay flood efficiency on simulated boards (relay.py, fake only)"""
+    from relay import Relay
+    grid = set()
+    for i in range(9): # 3x3 grid
+        if i % 3 < 2: grid.add((i, i + 1))
+        if i < 6:     grid.add((i, i + 3))
+    for name, nodes, links in (('line', 6, set((i, i + 1) for i in range(5))),
+                               ('grid', 9, grid),
+                               ('full', 6, None)):
+        boards, relays = [], []
+        got = [0]
+        def on_receive(relay, origin, payload):
+            got[0] += 1
+        for i in range(nodes):
+            boards.append(fakehw.Board())
+            tr = sx127x.RADIO(gpio=FAKE_GPIO)
+            tr.setSF(7)
+            relays.append(Relay(tr, i, ttl=nodes, cache=32, delay_ms=(1, 20),
+                                duty=None, onReceive=on_receive))
+            tr.receive(0)
+        ether = fakehw.Ether(boards, links)
+        for k in range(n):
+            relays[0].send(bytes(PAYLOAD_SIZE))
+            busy = True
+            while busy:
+                busy = False
+                for relay in relays:
+                    relay.poll()
+                    if relay.pending():
+                        busy = True
+        dups = sum(relay.stats['dup'] for relay in relays)
+        result('flood_delivery', got[0] / (n * (nodes - 1)), 'ratio',
+               topology=name, nodes=nodes)
+        result('flood_tx', ether.tx / n, 'tx/pkt', topology=name, nodes=nodes)
+        result('flood_dup', dups / n, 'dup/pkt', topology=name, nodes=nodes)
+    result('relay_memory', relays[0].memory(), 'B')
+
+
+def bench_pktlog(tr, n=512, path='bench_log'):
+    """packet log (pktlog.py): records per second of receive callback with
+       batched page writes, write latency and headroom versus packet rate
+       of fastest LoRa setting"""
+    import os
+    import pktlog
+    log = pktlog.PacketLog(tr, path) # full pages only (default `flush_ms`)
+    payload = bytes(PAYLOAD_SIZE)
+    writes = []
+    t = ticks_us()
+    for i in range(n):
+        log._handleOnReceive(tr, payload, True) # DIO0 callback
+        t0 = ticks_us()
+        if log.poll():
+            writes.append(ticks_diff(ticks_us(), t0))
+    dt = ticks_diff(ticks_us(), t)
+    rate = n * 1e6 / dt
+    records = log.written # records written by page writes
+    tr.setBW(500.)
+    tr.setSF(7)
+    tr.setLDRO(False)
+    radio_rate = 1e6 / tr.airtime(PAYLOAD_SIZE)
+    writes.sort()
+    result('pktlog_rate', rate, 'rec/s', record=log.record)
+    result('pktlog_write', writes[len(writes) // 2], 'us', min=writes[0],
+           max=writes[-1], page=records // len(writes) * log.record)
+    result('pktlog_headroom', rate / radio_rate, 'ratio')
+    log.close()
+    for name in os.listdir(path):
+        os.remove(path + '/' + name)
+    os.rmdir(path)
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_loadsim(nodes=(10, 100)):
+    """gateway delivery, CPU and host time of driver RX path under load
+       (loadsim.py, fake only)"""
+    import loadsim
+    for n in nodes:
+        res = loadsim.simulate(n, duration=300.)
+        result('loadsim_pdr', res['pdr'], 'ratio', nodes=n)
+        result('loadsim_cpu', res['cpu'] * 100, '%', nodes=n)
+        result('loadsim_host', res['host_us'], 'us', nodes=n)
+
+
+def bench_gateway(tr, board, n=32, port=17000):
+    """packet forwarder (gateway.py) against local UDP server: delivered
+       packets, uplink datagrams, PUSH_ACK and TX_ACK of good, malformed and
+       failed (TX timeout) PULL_RESP, restored RX settings (fake only)"""
+    import socket
+    import gateway
+    addr = socket.getaddrinfo('127.0.0.1', port)[0][-1]
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(addr)
+    server.setblocking(False)
+    fwd = gateway.Forwarder(tr, '127.0.0.1', port, eui=bytes(8))
+    got = {'rxpk': 0, 'dgram': 0, 'acks': []}
+    client = []
+
+    def serve():
+        # answer datagrams of forwarder
+        while True:
+            try:
+                data, peer = server.recvfrom(2048)
+            except OSError:
+                return
+            if data[3] == gateway.PUSH_DATA:
+                got['dgram'] += 1
+                got['rxpk'] += len(json.loads(data[12:])['rxpk'])
+                server.sendto(data[:3] + bytes((gateway.PUSH_ACK,)), peer)
+            elif data[3] == gateway.PULL_DATA:
+                client[:] = [peer]
+                server.sendto(data[:3] + bytes((gateway.PULL_ACK,)), peer)
+            elif data[3] == gateway.TX_ACK:
+                got['acks'].append(json.loads(data[12:])['txpk_ack']['error'])
+
+    tr.receive(0)
+    payload = bytes(PAYLOAD_SIZE)
+    for i in range(n):
+        board.chip.inject(payload)
+        fwd.poll()
+        serve()
+    fwd.period = 0 # flush queue
+    fwd.poll()
+    serve()
+    fwd.poll() # PUSH_ACK
+    power, freq, iq = tr.getPowerCodes(), tr.getFrequency(), tr.getInvertIQ()
+    txpk = {'imme': True, 'freq': 434.5, 'powe': 14, 'datr': 'SF9BW125',
+            'codr': '4/6', 'ipol': True, 'size': 2, 'data': 'AQI='}
+    for body in (json.dumps({'txpk': txpk}), '{"txpk":{"imme":tr',
+                 '{"rxpk":[]}'):
+        server.sendto(b'\x02\x00\x01' + bytes((gateway.PULL_RESP,)) +
+                      body.encode(), client[0])
+    sleep_ms(10)
+    fwd.poll()
+    serve()
+    board.chip.wedged = True # TX never ends -> TX_ACK error
+    server.sendto(b'\x02\x00\x02' + bytes((gateway.PULL_RESP,)) +
+                  json.dumps({'txpk': txpk}).encode(), client[0])
+    sleep_ms(10)
+    fwd.poll()
+    serve()
+    board.chip.wedged = False
+    restored = tr.getPowerCodes() == power and tr.getFrequency() == freq and \
+               tr.getInvertIQ() == iq and tr.getMode() == sx127x.MODE_RX_CONTINUOUS
+    result('gateway_delivery', got['rxpk'] / n, 'ratio', packets=n)
+    result('gateway_datagrams', got['dgram'], 'dgram', packets=n,
+           batch=fwd.batch)
+    result('gateway_push_ack', fwd.stats['ackn'] / fwd.stats['dwnb'], 'ratio')
+    result('gateway_tx_ack', sum(1 for a, b in zip(got['acks'],
+           ('NONE', 'BAD_REQUEST', 'BAD_REQUEST', 'TX_FAILED')) if a == b) / 4.,
+           'ratio', restored=restored)
+    fwd.close()
+    server.close()
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_tdma(tr, board, size=8):
+    """TDMA node (tdma.py): slot fits payload of `size` bytes; oversized
+       packet and slot out of frame of beacon are rejected (fake only)"""
+    import tdma
+    tr.setSF(7)
+    tr.setBW(500.)
+    tr.setLDRO(False)
+    node = tdma.TDMA(tr, slot=2, slots=2, size=size, guard_us=1000)
+    slot = node.slotTime()
+
+    def beacon(slots):
+        tr.receive(0)
+        board.chip.inject(bytes((tdma.BEACON, 0, slots, (slot >> 16) & 0xFF,
+                                 (slot >> 8) & 0xFF, slot & 0xFF)))
+
+    beacon(2)
+    t = ticks_us()
+    ok = node.send(bytes(size)) is True
+    result('tdma_send', ticks_diff(ticks_us(), t), 'us', ok=ok,
+           slot=slot, frame=node.frameTime())
+    beacon(2)
+    big = node.send(bytes(4 * size)) is False # airtime > slot
+    beacon(1)
+    out = node.send(bytes(size)) is False # slot 2 of 1
+    result('tdma_reject', (big + out) / 2., 'ratio')
+    tr.onReceive(None)
+    tr.init(mode=sx127x.LORA)
+
+
+def bench_rpc(tr, n=10):
+    """RPC (rpc.py) on pty pair: batch of `n` snapshot() longer than frame
+       is split in several frames, too large result of one call is error
+       (host only)"""
+    import os, tty
+    import rpc
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    server = rpc.Server(tr, rpc.FdStream(master))
+    client = rpc.Client(slave)
+
+    def call(name, args, n=1):
+        batch = client.batch()
+        for i in range(n):
+            getattr(batch, name)(*args)
+        batch.send()
+        server.poll()
+        try:
+            return batch.wait(1.)
+        except rpc.RPCError as e:
+            return e
+
+    snaps = call('snapshot', (), n)
+    split = isinstance(snaps, list) and len(snaps) == n and \
+            all(len(snap) == 0x7F for snap in snaps)
+    large = call('readRegs', (0, 1100))
+    large = isinstance(large, rpc.RPCError) and 'too large' in str(large)
+    result('rpc_large', (split + large) / 2., 'ratio', calls=n)
+    tr.onReceive(None)
+    os.close(master)
+    os.close(slave)
+
+
+def run():
+    """run all benchmarks"""
+    tr = radio()
+    board = fakehw.Board.current if FAKE else None
+    bench_regs(tr)
+    bench_fifo(tr)
+    bench_init(tr)
+    bench_recover(tr)
+    bench_temp(tr)
+    bench_send(tr)
+    bench_profile(tr, board)
+    bench_listen(tr)
+    bench_rx(tr, board)
+    bench_native(tr)
+    bench_capture(tr)
+    bench_energy(tr)
+    bench_sniffer(tr)
+    bench_pktlog(tr)
+    bench_aggregate(tr)
+    bench_codec()
+    if board:
+        bench_alloc(tr, board)
+        bench_flood()
+        bench_loadsim()
+        bench_gateway(tr, board)
+        bench_tdma(tr, board)
+        bench_rpc(tr)
+
+
+def load(path):
+    """load JSON lines of results: {(bench, params): (value, unit)}"""
+    res = {}
+    for line in open(path):
+        if not line.startswith('{'):
+            continue # driver output
+        r = json.loads(line)
+        key = tuple(sorted((k, str(v)) for k, v in r.items()
+                           if k not in ('value', 'unit', 'port', 'fake',
+                                        'airtime', 'cpu', 'min', 'max',
+                                        'median', 'text', 'raw',
+                                        'speedup')))
+        res[key] = (r['value'], r['unit'])
+    return res
+
+
+def compare(old_path, new_path, threshold=0.1):
+    """print change of results; return number of regressions"""
+    old, new = load(old_path), load(new_path)
+    regressions = 0
+    for key in sorted(new):
+        if key not in old:
+            continue
+        (v0, unit), (v1, unit1) = old[key], new[key]
+        if not v0:
+            continue
+        change = (v1 - v0) / v0
+        better = change > 0 if unit.endswith('/s') or unit == 'ratio' else \
+                 change < 0
+        flag = ''
+        if abs(change) > threshold and not better:
+            flag = '  <-- REGRESSION'
+            regressions += 1
+        print("%-50s %12.1f -> %12.1f %-6s %+6.1f%%%s" % (
+              ' '.join(v for k, v in key), v0, v1, unit, change * 100, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--compare':
+        sys.exit(1 if compare(sys.argv[2], sys.argv[3]) else 0)
+    run()
+
+
+#*** end of "bench.py" module ***#
@@ -0,0 +1,184 @@
+# -*- coding: UTF8 -*-
+# Raw bitstream capture in FSK/OOK continuous mode on top of "sx127x"
+# driver (legacy OOK protocols: remote controls, meters, etc)
+# Licenced by GPLv3
+#
+# Chip outputs demodulated bits on DIO2/DATA synchronized by DIO1/DCLK
+# (bit synchronizer `BitSyncOn` must be on). Hard IRQ on DCLK rising
+# edge stores DATA bit to preallocated ring bit buffer (no allocation,
+# no SPI). poll() from main loop runs software sync word correlator
+# (with allowed bit errors) and cuts frames of fixed size after sync.
+#
+# maxBitrate() measures cost of IRQ handler and of poll() per bit; real
+# bitrate must be lower than both (IRQ latency of port is not counted).
+
+from machine import Pin
+from sx127x import ticks_us, ticks_diff, REG_DIO_MAPPING_1, REG_OOK_PEAK, \
+                   MODE_RX_CONTINUOUS
+
+# bit counter mask: `count + 1` stays small int (< 2^30) in hard IRQ
+COUNT_MASK = 0x1FFFFFFF
+
+
+class Capture:
+    def __init__(self, radio,
+                 dclk       = 0,      # DIO1/DCLK GPIO (IRQ)
+                 data       = 16,     # DIO2/DATA GPIO
+                 bits       = 4096,   # ring buffer size [bits] (multiple of 8)
+                 sync       = 0x2DD4, # sync word (MSB first)
+                 sync_bits  = 16,     # sync word size 1...30 [bits]
+                 frame_bits = 64,     # frame size after sync word [bits]
+                 max_errors = 0,      # allowed bit errors in sync word
+                 onFrame    = None):  # callback(capture, frame) on frame
+        self.radio = radio
+        self.pin_dclk = Pin(dclk, Pin.IN)
+        self.pin_data = Pin(data, Pin.IN)
+        self._data = self.pin_data.value # cached bound method for IRQ
+        self._size = bits & ~7
+        self._buf = bytearray(self._size >> 3)
+        self._head = 0  # next bit position in ring (IRQ)
+        self._count = 0 # bits stored by IRQ (small int, wraps in 2^29)
+        self._done = 0  # bits processed by poll()
+        self._sync = sync & ((1 << sync_bits) - 1)
+        self._mask = (1 << sync_bits) - 1
+        self._shift = 0
+        self.max_errors = max_errors
+        self.frame_bits = frame_bits
+        self._frame = bytearray((frame_bits + 7) >> 3)
+        self._bit = -1 # bit position in frame (-1 -> search sync)
+        self.onFrame = onFrame
+        self.frames = 0   # received frames
+        self.overruns = 0 # bits lost by ring overflow (poll() too slow)
+        self.limits = None # (IRQ, poll()) bit rate limits (look maxBitrate())
+
+
+    def begin(self):
+        """start RX in continuous mode and capture by DCLK IRQ (FSK/OOK)"""
+        radio = self.radio
+        radio.continuous(True)
+        radio.writeReg(REG_OOK_PEAK, radio.readReg(REG_OOK_PEAK) | 0x20) # `BitSyncOn`
+        # DIO1 -> DCLK (00), DIO2 -> DATA (00) in continuous mode
+        radio.writeReg(REG_DIO_MAPPING_1, radio.readReg(REG_DIO_MAPPING_1) & 0xC3)
+        self._done = self._count
+        self._bit = -1
+        self._shift = 0
+        try:
+            self.pin_dclk.irq(trigger=Pin.IRQ_RISING, handler=self._handleOnDclk,
+                              hard=True)
+        except TypeError: # port without `hard` argument (IRQ is hard anyway)
+            self.pin_dclk.irq(trigger=Pin.IRQ_RISING, handler=self._handleOnDclk)
+        radio.setMode(MODE_RX_CONTINUOUS)
+
+
+    def end(self):
+        """stop capture; return radio to packet mode (standby)"""
+        self.pin_dclk.irq(trigger=0, handler=None)
+        self.radio.standby()
+        self.radio.continuous(False)
+
+
+    def _handleOnDclk(self, pin):
+        # store DATA bit (hard IRQ: no allocation)
+        n = self._head
+        if self._data():
+            self._buf[n >> 3] |= 0x80 >> (n & 7)
+        else:
+            self._buf[n >> 3] &= ~(0x80 >> (n & 7))
+        n += 1
+        if n >= self._size:
+            n = 0
+        self._head = n
+        self._count = (self._count + 1) & COUNT_MASK
+
+
+    def pending(self):
+        """get number of captured bits not processed by poll()"""
+        return (self._count - self._done) & COUNT_MASK
+
+
+    def poll(self):
+        """correlate sync word and cut frames from new bits; call it often"""
+        while True: # consistent (count, head) pair if IRQ comes here
+            count, head = self._count, self._head
+            if count == self._count:
+                break
+        new = (count - self._done) & COUNT_MASK
+        if not new:
+            return 0
+        size = self._size
+        if new > size: # ring overflow: skip lost bits
+            self.overruns += new - size
+            new = size
+            self._bit = -1
+        i = head - new
+        if i < 0:
+            i += size
+        buf, frame = self._buf, self._frame
+        sync, mask, shift = self._sync, self._mask, self._shift
+        errors, nbits, pos = self.max_errors, self.frame_bits, self._bit
+        for k in range(new):
+            bit = (buf[i >> 3] >> (7 - (i & 7))) & 1
+            i += 1
+            if i >= size:
+                i = 0
+            if pos < 0: # search sync word
+                shift = ((shift << 1) | bit) & mask
+                x = shift ^ sync
+                if x and errors:
+                    e = 0
+                    while x and e <= errors:
+                        x &= x - 1
+                        e += 1
+                    x = e > errors
+                if not x:
+                    pos = 0
+                    for j in range(len(frame)):
+                        frame[j] = 0
+            else: # frame bits
+                if bit:
+                    frame[pos >> 3] |= 0x80 >> (pos & 7)
+                pos += 1
+                if pos >= nbits:
+                    pos = -1
+                    shift = 0
+                    self.frames += 1
+                    if self.onFrame:
+                        self.onFrame(self, bytes(frame))
+        self._shift, self._bit = shift, pos
+        self._done = count
+        return new
+
+
+    def maxBitrate(self, n=1000):
+        """measure (IRQ handler, poll()) bit rate limits [bit/s];
+           ring buffer content is lost: call it before begin()"""
+        n = min(n, self._size)
+        head, count, done = self._head, self._count, self._done
+        t = ticks_us()
+        for k in range(n):
+            self._handleOnDclk(None)
+        isr = ticks_diff(ticks_us(), t)
+        self._done = count # process bits just stored
+        onFrame, self.onFrame = self.onFrame, None
+        frames, bit, shift = self.frames, self._bit, self._shift
+        t = ticks_us()
+        self.poll()
+        dec = ticks_diff(ticks_us(), t)
+        self.onFrame, self.frames, self._bit, self._shift = onFrame, frames, bit, shift
+        self._head, self._count, self._done = head, count, done
+        self.limits = (n * 1e6 / max(isr, 1), n * 1e6 / max(dec, 1))
+        return self.limits
+
+
+    def report(self, bitrate=None):
+        """print bit rate limits (if measured by maxBitrate()) and counters"""
+        if self.limits:
+            isr, dec = self.limits
+            print("IRQ limit=%d bit/s  poll limit=%d bit/s  max=%d bit/s" % (
+                  isr, dec, min(isr, dec)))
+            if bitrate and bitrate > min(isr, dec):
+                print("WARNING: bitrate %d bit/s is not sustainable" % bitrate)
+        print("frames=%d  overruns=%d bits" % (self.frames, self.overruns))
+
+
+#*** end of "capture.py" module ***#
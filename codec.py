@@ -0,0 +1,177 @@
+# -*- coding: UTF8 -*-
+# Compact binary payload codec for "sx127x" driver
+# Licenced by GPLv3
+#
+# Airtime grows with payload size at given SF/BW, so every byte saved
+# is more packets per duty cycle:
+#  * Schema     - fixed struct packing of named (scaled) fields
+#  * varint     - LEB128 unsigned integers (7 bits per byte)
+#  * zigzag     - signed -> unsigned mapping for varint (0,-1,1,-2...)
+#  * delta      - time series as first value + zigzag varint deltas
+#  * Dictionary - substitution of frequent words by one byte codes
+#
+# All encoders return `bytearray` that may be passed to send() directly.
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+DICT_MAX   = 127  # maximum words in dictionary (codes 0x80...0xFE)
+DICT_ESC   = 0xFF # escape of literal byte >= 0x80
+
+
+class Schema:
+    def __init__(self, fmt, names=None, scales=None):
+        """fmt - struct format ("<hHB"), names - field names,
+           scales - multipliers of fields (fixed point: 100 -> 0.01 step)"""
+        self.fmt = fmt
+        self.size = struct.calcsize(fmt)
+        self.names = names
+        self.scales = scales
+
+
+    def pack(self, *values):
+        """pack values (or one dict by names) to bytearray"""
+        buf = bytearray(self.size)
+        self.packInto(buf, 0, *values)
+        return buf
+
+
+    def packInto(self, buf, offset, *values):
+        """pack values to preallocated buffer"""
+        if len(values) == 1 and isinstance(values[0], dict):
+            values = [values[0][name] for name in self.names]
+        if self.scales:
+            values = [int(round(v * s)) if s != 1 else v
+                      for v, s in zip(values, self.scales)]
+        struct.pack_into(self.fmt, buf, offset, *values)
+        return offset + self.size
+
+
+    def unpack(self, data, offset=0):
+        """unpack tuple of values"""
+        values = struct.unpack_from(self.fmt, data, offset)
+        if self.scales:
+            values = tuple(v / s if s != 1 else v
+                           for v, s in zip(values, self.scales))
+        return values
+
+
+    def unpackDict(self, data, offset=0):
+        """unpack dict of values by names"""
+        return dict(zip(self.names, self.unpack(data, offset)))
+
+
+def zigzag(n):
+    """signed integer -> unsigned (0,-1,1,-2... -> 0,1,2,3...)"""
+    return (n << 1) if n >= 0 else ((-n << 1) - 1)
+
+
+def unzigzag(n):
+    """unsigned integer -> signed (inverse of zigzag())"""
+    return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+
+def putVarint(buf, n):
+    """append unsigned integer to bytearray as varint"""
+    while n > 0x7F:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+    return buf
+
+
+def getVarint(data, offset=0):
+    """get (unsigned integer, next offset) from varint"""
+    n = shift = 0
+    while True:
+        b = data[offset]
+        offset += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, offset
+        shift += 7
+
+
+def encodeDelta(values, buf=None):
+    """encode integer time series: first value and deltas as zigzag varints"""
+    if buf is None:
+        buf = bytearray()
+    prev = 0
+    for v in values:
+        putVarint(buf, zigzag(v - prev))
+        prev = v
+    return buf
+
+
+def decodeDelta(data, offset=0, count=-1):
+    """decode integer time series (`count` values or up to end of data)"""
+    values = []
+    prev = 0
+    size = len(data)
+    while offset < size and count:
+        d, offset = getVarint(data, offset)
+        prev += unzigzag(d)
+        values.append(prev)
+        count -= 1
+    return values
+
+
+class Dictionary:
+    def __init__(self, words):
+        """words - up to 127 frequent str/bytes words (same list on both sides)"""
+        if len(words) > DICT_MAX:
+            raise ValueError('Too many words')
+        self.words = [w.encode() if isinstance(w, str) else bytes(w)
+                      for w in words]
+        # words by first byte (longest first) for greedy matching
+        self._index = {}
+        for code, word in enumerate(self.words):
+            self._index.setdefault(word[0], []).append((word, 0x80 + code))
+        for key in self._index:
+            self._index[key].sort(key=lambda wc: -len(wc[0]))
+
+
+    def compress(self, data):
+        """replace words by one byte codes; return bytearray"""
+        if isinstance(data, str):
+            data = data.encode()
+        out = bytearray()
+        index = self._index
+        i, size = 0, len(data)
+        while i < size:
+            b = data[i]
+            for word, code in index.get(b, ()):
+                n = len(word)
+                if data[i:i + n] == word:
+                    out.append(code)
+                    i += n
+                    break
+            else:
+                if b >= 0x80:
+                    out.append(DICT_ESC)
+                out.append(b)
+                i += 1
+        return out
+
+
+    def decompress(self, data):
+        """restore data compressed by compress(); return bytearray"""
+        out = bytearray()
+        words = self.words
+        i, size = 0, len(data)
+        while i < size:
+            b = data[i]
+            i += 1
+            if b < 0x80:
+                out.append(b)
+            elif b == DICT_ESC:
+                out.append(data[i])
+                i += 1
+            else:
+                out.extend(words[b - 0x80])
+        return out
+
+
+#*** end of "codec.py" module ***#
@@ -0,0 +1,155 @@
+# -*- coding: UTF8 -*-
+# Radio energy and state time accounting for "sx127x" driver
+# Licenced by GPLv3
+#
+# Energy object is hooked into driver (`radio.energy`): every mode
+# change (every `RegOpMode` write of driver: setMode(), modem switch,
+# getTemp()/calibration, recover(); end of TX in send(), end of RX
+# single on DIO0) adds time of previous state. TX time is counted per power level
+# (look getPower()). Counters are integer milliseconds + microseconds
+# in preallocated arrays, so accounting is cheap enough to leave on.
+#
+# Charge [mAh] = sum(time of state * current of state); currents are
+# typical values of SX1276 datasheet (set your module measurements).
+
+from array import array
+from sx127x import ticks_us, ticks_ms, ticks_diff, MODE_STDBY, MODE_TX, \
+                   MODE_RX_SINGLE
+
+# state names by mode (bits 2-0 of `RegOpMode`)
+STATES = ('sleep', 'stdby', 'fstx', 'tx', 'fsrx', 'rx', 'rxsingle', 'cad')
+
+# supply current by mode [mA] (TX - look TX_CURRENT)
+CURRENT = (0.0002, # sleep
+           1.6,    # standby
+           5.8,    # FSTX
+           0.,     # TX (by power level)
+           5.8,    # FSRX
+           11.5,   # RX continuous
+           11.5,   # RX single
+           11.5)   # CAD
+
+# TX supply current by power level: (dBm, mA), linear between points
+TX_CURRENT = ((2, 24.), (7, 28.), (10, 35.), (13, 44.), (17, 87.), (20, 120.))
+
+LONG_MS = 60000 # use `ticks_ms()` if state is longer [ms]
+
+
+def txCurrent(level, table=TX_CURRENT):
+    """get TX supply current of power level [mA]"""
+    if level <= table[0][0]:
+        return table[0][1]
+    for i in range(1, len(table)):
+        l1, i1 = table[i]
+        if level <= l1:
+            l0, i0 = table[i - 1]
+            return i0 + (i1 - i0) * (level - l0) / (l1 - l0)
+    return table[-1][1]
+
+
+class Energy:
+    def __init__(self, radio,
+                 current    = CURRENT,    # current by mode [mA]
+                 tx_current = TX_CURRENT, # TX current by level [(dBm, mA)]
+                 voltage    = 3.3):       # supply voltage [V]
+        self.radio = radio
+        self.current = current
+        self.tx_current = tx_current
+        self.voltage = voltage
+        self._ms = array('L', [0] * 8) # time by mode [ms]
+        self._us = array('H', [0] * 8) # time by mode [us] (< 1000)
+        self._tx = {}     # TX time by power level: level -> [ms, us]
+        self._level = 0   # TX power level of current TX [dBm]
+        self.packets = 0  # number of TX starts
+        self.last_tx = 0  # duration of last TX [us]
+        self.last_level = 0
+        self._state = radio.getMode()
+        self._t, self._tms = ticks_us(), ticks_ms()
+        radio.energy = self
+
+
+    def close(self):
+        """unhook from radio"""
+        self.update()
+        self.radio.energy = None
+
+
+    def mode(self, mode):
+        """account time of previous state; `mode` is new state (driver hook)"""
+        t, tms = ticks_us(), ticks_ms()
+        dms = ticks_diff(tms, self._tms)
+        dt = dms * 1000 if dms > LONG_MS else ticks_diff(t, self._t)
+        self._t, self._tms = t, tms
+        s = self._state
+        if s == MODE_TX:
+            acc = self._tx.get(self._level)
+            if acc is None:
+                acc = self._tx[self._level] = [0, 0]
+            us = acc[1] + dt
+            acc[0] += us // 1000
+            acc[1] = us % 1000
+            self.last_tx, self.last_level = dt, self._level
+        else:
+            us = self._us[s] + dt
+            self._ms[s] += us // 1000
+            self._us[s] = us % 1000
+        if mode == MODE_TX and s != MODE_TX:
+            self._level = self.radio.getPower()
+            self.packets += 1
+        self._state = mode
+
+
+    def rxDone(self):
+        """RX single is finished (driver hook)"""
+        if self._state == MODE_RX_SINGLE:
+            self.mode(MODE_STDBY)
+
+
+    def update(self):
+        """account time of current state up to now"""
+        self.mode(self._state)
+
+
+    def time(self, mode):
+        """get time in mode [s] (TX - all power levels)"""
+        if mode == MODE_TX:
+            return sum(acc[0] / 1e3 + acc[1] / 1e6 for acc in self._tx.values())
+        return self._ms[mode] / 1e3 + self._us[mode] / 1e6
+
+
+    def txTime(self):
+        """get TX time by power level {dBm: s}"""
+        return dict((level, acc[0] / 1e3 + acc[1] / 1e6)
+                    for level, acc in self._tx.items())
+
+
+    def charge(self):
+        """get consumed charge [mAh]"""
+        mAs = 0.
+        for s in range(8):
+            if s != MODE_TX:
+                mAs += self.time(s) * self.current[s]
+        for level, t in self.txTime().items():
+            mAs += t * txCurrent(level, self.tx_current)
+        return mAs / 3600.
+
+
+    def packetEnergy(self):
+        """get energy of last TX packet [mJ]"""
+        return self.last_tx * txCurrent(self.last_level, self.tx_current) * \
+               self.voltage / 1e6
+
+
+    def report(self):
+        """print time by state, charge and energy of last packet"""
+        self.update()
+        for s in range(8):
+            if s != MODE_TX:
+                print("%-9s %12.3f s" % (STATES[s], self.time(s)))
+        for level, t in sorted(self.txTime().items()):
+            print("tx %2d dBm %12.3f s" % (level, t))
+        print("charge=%.4f mAh  packets=%d  last packet=%.3f mJ" % (
+              self.charge(), self.packets, self.packetEnergy()))
+
+
+#*** end of "energy.py" module ***#
@@ -0,0 +1,432 @@
+# -*- coding: UTF8 -*-
+# Fake `machine.Pin`/`machine.SPI` with SX127x register model for running
+# "sx127x" driver without hardware (CPython or unix port of MicroPython)
+# Licenced by GPLv3
+#
+# Usage:
+#   import fakehw
+#   fakehw.install()      # register as `machine` module if there is no one
+#   board = fakehw.Board() # new board with SX1278 chip (made current)
+#   import sx127x
+#   tr = sx127x.RADIO(...) # Pin/SPI objects bind to current board
+#   board.chip.inject(b"Hello") # receive packet -> DIO0 -> callback
+#   fakehw.Ether([board1, board2]) # packets of one board go to others
+
+import sys
+
+# default GPIO numbers of signals (look "gpio" argument of `RADIO`)
+GPIO_DIO0  = 4
+GPIO_CS    = 15
+GPIO_RESET = 5
+
+# register defaults after reset (FSK/OOK page and common registers)
+_FSK_DEFAULTS = {
+    0x01: 0x09, 0x02: 0x1A, 0x03: 0x0B, 0x04: 0x00, 0x05: 0x52,
+    0x06: 0x6C, 0x07: 0x80, 0x08: 0x00, 0x09: 0x4F, 0x0A: 0x09,
+    0x0B: 0x2B, 0x0C: 0x20, 0x0D: 0x08, 0x0E: 0x02, 0x0F: 0x0A,
+    0x10: 0xFF, 0x12: 0x15, 0x13: 0x0B, 0x14: 0x28, 0x15: 0x0C,
+    0x16: 0x12, 0x1F: 0x40, 0x24: 0x07, 0x26: 0x03, 0x27: 0x93,
+    0x28: 0x55, 0x29: 0x55, 0x2A: 0x55, 0x2B: 0x55, 0x2C: 0x55,
+    0x2D: 0x55, 0x2E: 0x55, 0x2F: 0x55, 0x30: 0x90, 0x31: 0x40,
+    0x32: 0x40, 0x35: 0x1F, 0x38: 0x00, 0x39: 0xF5, 0x3A: 0x20,
+    0x3B: 0x82, 0x3C: 0x00, 0x3D: 0x02, 0x3E: 0x80, 0x3F: 0x40,
+    0x40: 0x00, 0x41: 0x00, 0x42: 0x12, 0x44: 0x2D, 0x4B: 0x09,
+    0x4D: 0x84, 0x5B: 0x00, 0x5D: 0x00, 0x61: 0x13, 0x62: 0x0E,
+    0x63: 0x5B, 0x64: 0xDB, 0x70: 0xD0}
+
+# LoRa page defaults (0x0D...0x3F)
+_LORA_DEFAULTS = {
+    0x0D: 0x00, 0x0E: 0x80, 0x0F: 0x00, 0x11: 0x00, 0x1D: 0x72,
+    0x1E: 0x70, 0x1F: 0x64, 0x20: 0x00, 0x21: 0x08, 0x22: 0x01,
+    0x23: 0xFF, 0x24: 0x00, 0x26: 0x04, 0x27: 0x00, 0x31: 0xC3,
+    0x33: 0x27, 0x37: 0x0A, 0x39: 0x12}
+
+
+class Board:
+    """fake board: GPIO pins and SPI bus with SX127x chip"""
+    current = None
+
+    def __init__(self, dio0=GPIO_DIO0, cs=GPIO_CS, reset=GPIO_RESET,
+                 select=True):
+        self.dio0  = dio0
+        self.cs    = cs
+        self.reset = reset
+        self.pins = {}
+        self.chip = SX127x(self)
+        if select:
+            Board.current = self
+
+    def select(self):
+        """make board current (new Pin/SPI objects bind to it)"""
+        Board.current = self
+        return self
+
+    def fire(self, gpio):
+        """rising edge on GPIO (run IRQ handler after SPI transaction)"""
+        if self.chip._selected:
+            if gpio not in self.chip._pending:
+                self.chip._pending.append(gpio)
+            return
+        pin = self.pins.get(gpio)
+        if pin:
+            pin._value = 1
+            if pin._handler:
+                pin._handler(pin)
+            pin._value = 0
+
+
+def _board():
+    if Board.current is None:
+        Board()
+    return Board.current
+
+
+class Pin:
+    IN  = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP   = 1
+    PULL_DOWN = 2
+    IRQ_RISING  = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = 0 if value is None else value
+        self._handler = None
+        self._board = _board()
+        self._board.pins[id] = self
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        v = 1 if v else 0
+        old, self._value = self._value, v
+        if self.id == self._board.cs and v != old:
+            self._board.chip.select(not v)
+        elif self.id == self._board.reset and old and not v: # NRESET low
+            self._board.chip.reset()
+
+    def on(self):  self.value(1)
+    def off(self): self.value(0)
+
+    def irq(self, trigger=0, handler=None, hard=False):
+        self._handler = handler if trigger else None
+
+
+class SPI:
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id=1, baudrate=1000000, **kw):
+        self.id = id
+        self.baudrate = baudrate
+        self._chip = _board().chip
+        self._chip.spi_clock = baudrate
+
+    def init(self, baudrate=None, **kw):
+        if baudrate:
+            self.baudrate = baudrate
+            self._chip.spi_clock = baudrate
+
+    def deinit(self):
+        pass
+
+    close = deinit
+
+    def write(self, buf):
+        chip = self._chip
+        for b in buf:
+            chip.transfer(b)
+
+    def read(self, n, write=0x00):
+        chip = self._chip
+        return bytes([chip.transfer(write) for i in range(n)])
+
+    def readinto(self, buf, write=0x00):
+        chip = self._chip
+        for i in range(len(buf)):
+            buf[i] = chip.transfer(write)
+
+    def write_readinto(self, out, buf):
+        chip = self._chip
+        for i in range(len(out)):
+            buf[i] = chip.transfer(out[i])
+
+
+class SX127x:
+    """SX127x register model (enough for driver tests and benchmarks)"""
+
+    def __init__(self, board):
+        self.board = board
+        self.onTx  = None # callback(chip, payload) on TX start
+        self.temp  = 25   # chip temperature [C]
+        self.rssi  = -110 # current RSSI [dBm]
+        self.activity = False # CAD detects preamble if True
+        self.cal_polls = 0    # `ImageCalRunning` is set for this number of reads
+        self.cs_count   = 0 # number of SPI transactions
+        self.byte_count = 0 # number of SPI bytes
+        self.tx_count   = 0 # number of transmitted packets
+        self.spi_clock = 0     # SPI clock [Hz] (set by `SPI`)
+        self.spi_max   = None  # read bit errors above this SPI clock [Hz]
+        self.reset()
+
+    def reset(self):
+        """power on reset"""
+        self.fsk  = bytearray(128)
+        self.lora = bytearray(128)
+        for a, v in _FSK_DEFAULTS.items():
+            self.fsk[a] = v
+        for a, v in _LORA_DEFAULTS.items():
+            self.lora[a] = v
+        self.data = bytearray(256) # LoRa FIFO data buffer
+        self.fifo = []             # FSK/OOK FIFO
+        self._addr = None
+        self._selected = False
+        self._pending = [] # IRQ lines to fire on end of SPI transaction
+        self.wedged = False # TX never ends if True (fault injection)
+        self._cal = 0 # reads of `RegImageCal` until calibration end
+
+    # --- SPI ---
+    def select(self, on):
+        self._selected = on
+        self._addr = None
+        if on:
+            self.cs_count += 1
+        else:
+            while self._pending:
+                self.board.fire(self._pending.pop(0))
+
+    def transfer(self, b):
+        self.byte_count += 1
+        if self._addr is None: # address byte
+            self._addr = b
+            return 0x00
+        addr = self._addr & 0x7F
+        if self._addr & 0x80:
+            self.write(addr, b)
+            value = 0x00
+        else:
+            value = self.read(addr)
+            if self.spi_max and self.spi_clock > self.spi_max:
+                value ^= 0x01 # MISO sampled too late
+        if addr: # address auto increment (except FIFO)
+            self._addr = (self._addr & 0x80) | ((addr + 1) & 0x7F)
+        return value
+
+    # --- registers ---
+    def isLora(self):
+        return bool(self.fsk[0x01] & 0x80)
+
+    def _page(self, addr):
+        if 0x0D <= addr <= 0x3F and self.isLora() and \
+           not (self.fsk[0x01] & 0x40): # `AccessSharedReg`
+            return self.lora
+        return self.fsk
+
+    def reg(self, addr):
+        """get register value without side effects"""
+        return self._page(addr)[addr]
+
+    def read(self, addr):
+        if addr == 0x00: # FIFO
+            if self.isLora():
+                ptr = self.lora[0x0D]
+                self.lora[0x0D] = (ptr + 1) & 0xFF
+                return self.data[ptr]
+            if self.fifo:
+                v = self.fifo.pop(0)
+                if not self.fifo:
+                    self.fsk[0x3F] = (self.fsk[0x3F] | 0x40) & ~0x04
+                return v
+            return 0x00
+        if addr == 0x11 and not self.isLora(): # RssiValue
+            return min(max(-2 * self.rssi, 0), 255)
+        if addr == 0x1B and self.isLora(): # RssiValue (LoRa)
+            return min(max(self.rssi + self._rssiOffset(), 0), 255)
+        if addr == 0x3B and not self.isLora() and self._cal: # `ImageCalRunning`
+            self._cal -= 1
+            return self.fsk[0x3B] | 0x20
+        if addr == 0x3C and not self.isLora(): # Temp
+            return (-self.temp) & 0xFF
+        return self._page(addr)[addr]
+
+    def write(self, addr, v):
+        lora = self.isLora()
+        if addr == 0x00: # FIFO
+            if lora:
+                ptr = self.lora[0x0D]
+                self.data[ptr] = v
+                self.lora[0x0D] = (ptr + 1) & 0xFF
+            elif len(self.fifo) < 64:
+                self.fifo.append(v)
+                self.fsk[0x3F] &= ~0x40 # `FifoEmpty`
+            return
+        if addr == 0x01:
+            self._opMode(v)
+            return
+        if lora and addr == 0x12: # RegIrqFlags: clear by 1
+            self.lora[0x12] &= ~v
+            return
+        if addr == 0x3B and not lora and (v & 0x40): # `ImageCalStart`
+            self.fsk[0x3B] = v & ~0x60
+            self.fsk[0x5B] = self.read(0x3C) # `FormerTemp`
+            self._cal = self.cal_polls
+            return
+        if addr in (0x42,): # read only
+            return
+        if not lora and addr in (0x3E, 0x3F): # RegIrqFlags1/2: status
+            if addr == 0x3F and v & 0x10: # `FifoOverrun` clears FIFO
+                self.fifo = []
+                self.fsk[0x3F] = (self.fsk[0x3F] | 0x40) & ~0x10
+            return
+        self._page(addr)[addr] = v
+
+    def _rssiOffset(self):
+        return 164 if self.fsk[0x01] & 0x08 else 157
+
+    def _opMode(self, v):
+        self.fsk[0x01] = v
+        mode = v & 0x07
+        if mode == 0b011: # TX
+            self._tx()
+        elif mode == 0b111 and self.isLora(): # CAD
+            flags = 0x04 | (0x01 if self.activity else 0x00) # CadDone/CadDetected
+            self.lora[0x12] |= flags
+            self.fsk[0x01] = (v & ~0x07) | 0b001
+            if (self.fsk[0x40] >> 6) == 0b10: # DIO0 -> CadDone
+                self.board.fire(self.board.dio0)
+        elif mode == 0b000 and not self.isLora(): # sleep clears FIFO
+            self.fifo = []
+            self.fsk[0x3F] |= 0x40 # `FifoEmpty`
+        elif mode in (0b010, 0b100, 0b101, 0b110) and not self.isLora():
+            self.fsk[0x3E] |= 0x10 # `PllLock`
+
+    def _tx(self):
+        self.tx_count += 1
+        if not self.isLora():
+            self.fsk[0x3F] &= ~0x08 # `PacketSent` is cleared on TX start
+        if self.wedged:
+            return
+        if self.isLora():
+            base = self.lora[0x0E]
+            size = self.lora[0x22]
+            payload = bytes(self.data[(base + i) & 0xFF] for i in range(size))
+            self.lora[0x12] |= 0x08 # `TxDone`
+            self.fsk[0x01] = (self.fsk[0x01] & ~0x07) | 0b001 # standby
+            fire = (self.fsk[0x40] >> 6) == 0b01 or (self.fsk[0x40] >> 6) == 0b00
+        else:
+            fifo = self.fifo
+            if self.fsk[0x30] & 0x80: # variable length
+                size = fifo[0] if fifo else 0
+                payload = bytes(fifo[1:1 + size])
+            else:
+                size = (self.fsk[0x31] & 0x07) << 8 | self.fsk[0x32]
+                payload = bytes(fifo[:size])
+            self.fifo = []
+            self.fsk[0x3F] = (self.fsk[0x3F] | 0x40 | 0x08) # FifoEmpty, PacketSent
+            fire = (self.fsk[0x40] >> 6) == 0b00
+        if self.onTx:
+            self.onTx(self, payload)
+        if fire:
+            self.board.fire(self.board.dio0)
+
+    # --- radio events ---
+    def inject(self, payload, rssi=-60, snr=8., crc=True, sw=None,
+               sync=None, fire=True):
+        """receive packet (LoRa/FSK/OOK); return True if chip accepts it"""
+        mode = self.fsk[0x01] & 0x07
+        if self.isLora():
+            if mode not in (0b101, 0b110): # RX continuous/single
+                return False
+            if sw is not None and sw != self.lora[0x39]:
+                return False
+            if self.lora[0x1D] & 0x01: # implicit header
+                size = self.lora[0x22]
+                payload = (bytes(payload) + bytes(size))[:size]
+            base = self.lora[0x0F]
+            for i, b in enumerate(payload):
+                self.data[(base + i) & 0xFF] = b
+            self.lora[0x10] = base
+            self.lora[0x13] = len(payload)
+            self.lora[0x25] = (base + len(payload)) & 0xFF
+            self.lora[0x19] = int(round(snr * 4)) & 0xFF
+            self.lora[0x1A] = min(max(rssi + self._rssiOffset(), 0), 255)
+            self.lora[0x12] |= 0x40 | (0x00 if crc else 0x20) # RxDone, CrcError
+            if mode == 0b110:
+                self.fsk[0x01] = (self.fsk[0x01] & ~0x07) | 0b001
+            dio0 = (self.fsk[0x40] >> 6) == 0b00
+        else:
+            if mode != 0b101:
+                return False
+            if self.fsk[0x27] & 0x10: # `SyncOn`
+                n = (self.fsk[0x27] & 0x07) + 1
+                if sync is not None and bytes(sync) != bytes(self.fsk[0x28:0x28 + n]):
+                    return False
+            cfg = self.fsk[0x30]
+            if cfg & 0x80: # variable length
+                data = [len(payload)] + list(payload)
+            else:
+                size = (self.fsk[0x31] & 0x07) << 8 | self.fsk[0x32]
+                data = (list(payload) + [0] * size)[:size]
+            filt = (cfg >> 1) & 0x03 # `AddressFiltering`
+            if filt:
+                a = data[1] if cfg & 0x80 else data[0]
+                if a != self.fsk[0x33] and not (filt == 2 and a == self.fsk[0x34]):
+                    return False
+            if not crc and (cfg & 0x10) and not (cfg & 0x08):
+                return False # `CrcAutoClearOff` = 0 -> drop
+            self.fifo = data[:64]
+            self.fsk[0x11] = min(max(-2 * rssi, 0), 255)
+            flags = 0x04 | (0x02 if crc else 0x00) # PayloadReady, CrcOk
+            self.fsk[0x3F] = (self.fsk[0x3F] & ~0x46) | flags
+            dio0 = (self.fsk[0x40] >> 6) == 0b00
+        if fire and dio0:
+            self.board.fire(self.board.dio0)
+        return True
+
+
+class Ether:
+    """shared air of several boards: packet sent by one chip is received
+       at once by chips in range (no airtime, no collisions)"""
+
+    def __init__(self, boards, links=None, rssi=-80):
+        self.boards = list(boards)
+        self.links = links # set of (i, j) board index pairs (None -> all)
+        self.rssi = rssi
+        self.tx = 0        # transmitted packets
+        self.delivered = 0 # packets accepted by receivers
+        for board in self.boards:
+            board.chip.onTx = self._tx
+
+    def inRange(self, i, j):
+        """check link between boards `i` and `j`"""
+        if i == j:
+            return False
+        if self.links is None:
+            return True
+        return (i, j) in self.links or (j, i) in self.links
+
+    def _tx(self, chip, payload):
+        self.tx += 1
+        i = [b.chip for b in self.boards].index(chip)
+        for j in range(len(self.boards)):
+            if self.inRange(i, j) and \
+               self.boards[j].chip.inject(payload, self.rssi):
+                self.delivered += 1
+
+
+def install():
+    """register this module as `machine` if there is no real one with Pin/SPI;
+       return True if fake hardware is used"""
+    try:
+        import machine
+        if hasattr(machine, 'Pin') and hasattr(machine, 'SPI'):
+            return False
+    except ImportError:
+        pass
+    sys.modules['machine'] = sys.modules[__name__]
+    return True
+
+
+#*** end of "fakehw.py" module ***#
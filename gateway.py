@@ -0,0 +1,270 @@
+# -*- coding: UTF8 -*-
+# LoRa gateway: packet forwarder with batched UDP uplink on top of
+# "sx127x" driver (Semtech UDP packet forwarder protocol, version 2)
+# Licenced by GPLv3
+#
+# Uplink:   PUSH_DATA {"rxpk":[...]} with several packets per datagram
+#           (server answers PUSH_ACK with the same token)
+# Downlink: PULL_DATA (keep alive) -> PULL_ACK,
+#           PULL_RESP {"txpk":{...}} -> TX_ACK {"txpk_ack":{...}}
+#
+# `tmst` is 32-bit microsecond counter: `ticks_us()` (wraps at 2^30 on
+# MicroPython) is extended by poll() and RX packets, so poll() must be
+# called at least once per half of ticks period (~9 minutes).
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+from sx127x import ticks_ms, ticks_us, ticks_diff, ticks_add, powerCodes
+
+# protocol version and packet identifiers
+PROTOCOL_VERSION = 2
+PUSH_DATA = 0x00
+PUSH_ACK  = 0x01
+PULL_DATA = 0x02
+PULL_RESP = 0x03
+PULL_ACK  = 0x04
+TX_ACK    = 0x05
+
+MAX_DATAGRAM = 1400 # maximum JSON part of uplink datagram [bytes]
+
+
+class Forwarder:
+    def __init__(self, radio, host, port=1700,
+                 eui          = None,  # gateway EUI (8 bytes)
+                 queue        = 16,    # RX queue size [packets]
+                 batch        = 4,     # maximum packets in one datagram
+                 period_ms    = 200,   # maximum delay of queued packet [ms]
+                 keepalive_ms = 10000, # PULL_DATA period [ms]
+                 onReceive    = None): # receive callback (after queuing)
+        self.radio = radio
+        self.addr  = socket.getaddrinfo(host, port)[0][-1]
+        self.sock  = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        if eui is None:
+            import machine
+            eui = (b'\x00' * 8 + bytes(machine.unique_id()))[-8:]
+        self._eui = bytes(eui)
+        self._queue = [None] * queue # ring of RX packets
+        self._head  = 0
+        self._count = 0
+        self.batch     = batch
+        self.period    = period_ms
+        self.keepalive = keepalive_ms
+        self._token    = 0
+        self._pushToken = -1 # last not acknowledged PUSH_DATA token
+        self._pulled   = None # ticks_ms of last PULL_DATA
+        self._ticks    = ticks_us() # last extended ticks_us()
+        self._tmst     = 0 # 32-bit counter [us] of `_ticks`
+        self._onReceive = onReceive
+        self.stats = {'rxnb':  0, # received packets
+                      'rxok':  0, # received packets with good CRC
+                      'rxfw':  0, # forwarded packets
+                      'drop':  0, # packets dropped by queue overflow
+                      'qmax':  0, # queue high water mark
+                      'dwnb':  0, # uplink datagrams
+                      'ackn':  0, # acknowledged uplink datagrams
+                      'late':  0, # downlinks too late to send
+                      'bad':   0, # malformed downlink requests
+                      'txnb':  0, # sent downlinks
+                      'txfail': 0} # downlinks failed (TX timeout/abort)
+        radio.onReceive(self._handleOnReceive)
+
+
+    def close(self):
+        """stop forwarding"""
+        self.radio.onReceive(None)
+        self.sock.close()
+
+
+    def _handleOnReceive(self, radio, payload, crcOk):
+        # timestamp and queue packet with metadata (called from DIO0 IRQ)
+        stats = self.stats
+        stats['rxnb'] += 1
+        if crcOk is not False:
+            stats['rxok'] += 1
+        n = len(self._queue)
+        if self._count < n:
+            self._queue[(self._head + self._count) % n] = (
+                radio.getRxTicks(), radio.getFrequency(),
+                radio.getSF(), radio.getBW(), radio.getCR(), radio.getBitrate(),
+                radio.getPktRSSI(), radio.getSNR(), crcOk, payload)
+            self._count += 1
+            if self._count > stats['qmax']:
+                stats['qmax'] = self._count
+        else:
+            stats['drop'] += 1 # backpressure: uplink too slow
+        if self._onReceive:
+            self._onReceive(radio, payload, crcOk)
+
+
+    def _header(self, ident):
+        self._token = (self._token + 1) & 0xFFFF
+        return bytes((PROTOCOL_VERSION, self._token >> 8, self._token & 0xFF,
+                      ident)) + self._eui
+
+
+    def _extend(self, ticks):
+        # `ticks_us()` value -> 32-bit `tmst` (ticks close to last one)
+        self._tmst = (self._tmst + ticks_diff(ticks, self._ticks)) & 0xFFFFFFFF
+        self._ticks = ticks
+        return self._tmst
+
+
+    def _local(self, tmst):
+        # 32-bit `tmst` -> `ticks_us()` value
+        delta = ((tmst - self._tmst + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        return ticks_add(self._ticks, delta)
+
+
+    def _rxpk(self, pkt):
+        ticks, freq, sf, bw, cr, bitrate, rssi, snr, crcOk, payload = pkt
+        rxpk = {'tmst': self._extend(ticks),
+                'chan': 0,
+                'rfch': 0,
+                'freq': freq / 1e6,
+                'stat': 0 if crcOk is None else 1 if crcOk else -1,
+                'rssi': int(rssi),
+                'size': len(payload),
+                'data': binascii.b2a_base64(payload).decode().strip()}
+        if sf is None: # FSK/OOK mode
+            rxpk['modu'] = 'FSK'
+            rxpk['datr'] = int(bitrate)
+        else: # LoRa mode
+            rxpk['modu'] = 'LORA'
+            rxpk['datr'] = 'SF%dBW%d' % (sf, int(bw))
+            rxpk['codr'] = '4/%d' % cr
+            rxpk['lsnr'] = snr
+        return json.dumps(rxpk)
+
+
+    def _push(self):
+        # pack queued packets into one PUSH_DATA datagram
+        n = len(self._queue)
+        parts = []
+        size = 0
+        while self._count and len(parts) < self.batch:
+            part = self._rxpk(self._queue[self._head])
+            if parts and size + len(part) > MAX_DATAGRAM:
+                break
+            parts.append(part)
+            size += len(part) + 1
+            self._queue[self._head] = None
+            self._head = (self._head + 1) % n
+            self._count -= 1
+        data = self._header(PUSH_DATA) + \
+               ('{"rxpk":[' + ','.join(parts) + ']}').encode()
+        self._pushToken = self._token
+        self.sock.sendto(data, self.addr)
+        self.stats['dwnb'] += 1
+        self.stats['rxfw'] += len(parts)
+
+
+    def _pull(self):
+        self._pulled = ticks_ms()
+        self.sock.sendto(self._header(PULL_DATA), self.addr)
+
+
+    def _downlink(self, txpk):
+        # send downlink packet and restore RX configuration
+        radio = self.radio
+        data = binascii.a2b_base64(txpk['data'])
+        f = int(round(txpk['freq'] * 1e6))
+        power = powerCodes(txpk['powe']) if 'powe' in txpk else None
+        datr = txpk.get('datr')
+        lora = radio.getSF() is not None and isinstance(datr, str)
+        if lora: # "SF7BW125", "4/5"
+            i = datr.index('BW')
+            sf, bw = int(datr[2:i]), float(datr[i + 2:])
+            cr = int(txpk['codr'][2:]) if 'codr' in txpk else None
+        ticks = None
+        if not txpk.get('imme', False):
+            ticks = self._local(txpk['tmst'])
+            if ticks_diff(ticks, ticks_us()) < 0:
+                self.stats['late'] += 1
+                return 'TOO_LATE'
+        saved = (radio.getFrequency(), radio.getSF(), radio.getBW(),
+                 radio.getCR(), radio.getPowerCodes(), radio.getInvertIQ())
+        radio.standby() # stop listening: no RX re-arm by send() on downlink
+        radio.setFrequency(f // 1000, f % 1000)
+        if power:
+            radio.setPowerCodes(power)
+        if lora:
+            radio.setSF(sf)
+            radio.setBW(bw)
+            if cr:
+                radio.setCR(cr)
+        radio.invertIQ(txpk.get('ipol', False))
+        ok = radio.send(data, False, ticks)
+        freq, sf, bw, cr, codes, iq = saved
+        radio.invertIQ(iq)
+        radio.setFrequency(freq // 1000, freq % 1000)
+        if power:
+            radio.setPowerCodes(codes)
+        if lora:
+            radio.setSF(sf)
+            radio.setBW(bw)
+            radio.setCR(cr)
+        radio.receive(0)
+        if not ok: # timeout (False) or aborted (None)
+            self.stats['txfail'] += 1
+            return 'TX_FAILED'
+        self.stats['txnb'] += 1
+        return 'NONE'
+
+
+    def _recv(self):
+        # handle datagrams from server
+        try:
+            data = self.sock.recv(2048)
+        except OSError:
+            return False
+        if len(data) < 4 or data[0] != PROTOCOL_VERSION:
+            return True
+        ident = data[3]
+        token = (data[1] << 8) | data[2]
+        if ident == PUSH_ACK:
+            if token == self._pushToken:
+                self.stats['ackn'] += 1
+        elif ident == PULL_RESP:
+            try:
+                txpk = json.loads(data[4:].decode())['txpk']
+                error = self._downlink(txpk)
+            except (ValueError, KeyError, TypeError, IndexError,
+                    OverflowError):
+                self.stats['bad'] += 1 # malformed or truncated request
+                error = 'BAD_REQUEST'
+            ack = bytes((PROTOCOL_VERSION, data[1], data[2], TX_ACK)) + self._eui
+            self.sock.sendto(ack + ('{"txpk_ack":{"error":"%s"}}' % error).encode(),
+                             self.addr)
+        return True
+
+
+    def poll(self):
+        """forward queued packets, handle downlinks and keep alive; call it often"""
+        self._extend(ticks_us())
+        while self._recv():
+            pass
+        if self._count:
+            oldest = self._queue[self._head][0]
+            if self._count >= self.batch or \
+               ticks_diff(ticks_us(), oldest) >= self.period * 1000:
+                self._push()
+        if self._pulled is None or \
+           ticks_diff(ticks_ms(), self._pulled) >= self.keepalive:
+            self._pull()
+
+
+#*** end of "gateway.py" module ***#
@@ -0,0 +1,418 @@
+# -*- coding: UTF8 -*-
+# Synthetic traffic generator and LoRa collision model for gateway
+# capacity planning (host only: CPython with fake SPI/Pin of "fakehw.py")
+# Licenced by GPLv3
+#
+# Every virtual node is `RADIO` of "sx127x" driver on own fake board:
+# packets are sent by send() of driver, time on air is airtime() of node
+# modem settings (SF, BW, CR, preamble, CRC, header). Simulation runs by
+# events in virtual time (packet start, packet end, end of gateway CPU
+# service), so hours of traffic take seconds.
+#
+# Channel model (one frequency, gateway `RADIO` in RX continuous):
+#  - packets of other SF or BW than gateway are orthogonal (no effect)
+#  - packet weaker than sensitivity of SF/BW is lost ("weak")
+#  - receiver locks on first packet; packet stronger by `capture` dB
+#    which starts in preamble of locked one takes receiver over, other
+#    packets starting while receiver is locked are lost ("busy")
+#  - locked packet overlapped by interferer not weaker than its power
+#    minus `capture` dB is received with CRC error ("collision")
+#  - received packet is injected to gateway chip: DIO0 handler of driver
+#    and callback run for it (host time of this path is measured)
+#
+# Gateway CPU model: every RxDone (CRC error too) takes `isr_us` +
+# `byte_us` * size + `callback_us`; RxDone while CPU is busy waits in
+# queue of `queue` entries (scheduler depth of MicroPython), next ones
+# are lost ("overrun").
+#
+# Usage:
+#   $ python3 loadsim.py                     # sweep of node count
+#   $ python3 loadsim.py --nodes 10,100,500 --period 30 --periodic
+#   $ python3 loadsim.py --json > new.jsonl  # look "bench.py --compare"
+
+import sys
+import gc
+import heapq
+import random
+import struct
+from math import log10
+from time import perf_counter
+
+import fakehw
+fakehw.install()
+import sx127x
+
+# GPIO of fake boards (no reset pin -> no reset delays)
+GPIO = {'led': 2, 'reset': None, 'dio0': 4, 'cs': 15,
+        'sck': 14, 'mosi': 13, 'miso': 12}
+
+# SX1276 sensitivity at BW 125 kHz by SF [dBm] (datasheet)
+SENSITIVITY = {6: -118., 7: -123., 8: -126., 9: -129., 10: -132.,
+               11: -133., 12: -136.}
+
+NOISE_FIGURE = 6. # receiver noise figure [dB]
+
+REASONS = ('weak', 'busy', 'collision', 'overrun')
+
+# event types
+EV_GEN, EV_START, EV_END, EV_DONE = 0, 1, 2, 3
+
+PACKET_HEADER = '<HI' # node number, sequence number
+
+
+def sensitivity(sf, bw):
+    """get receiver sensitivity of SF/BW [dBm]"""
+    return SENSITIVITY[sf] + 10 * log10(bw / 125.)
+
+
+def noiseFloor(bw):
+    """get noise floor of BW [dBm]"""
+    return -174. + 10 * log10(bw * 1e3) + NOISE_FIGURE
+
+
+def quiet(make):
+    """call `make()` without driver output (version print of init())"""
+    import io, contextlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        return make()
+
+
+def newRadio(sf, bw, power=14):
+    """new `RADIO` on new fake board"""
+    board = fakehw.Board()
+    def make():
+        tr = sx127x.RADIO(gpio=GPIO)
+        tr.setBW(bw)
+        tr.setSF(sf)
+        tr.setLDRO((1 << sf) / bw > 16.) # symbol time > 16 ms
+        tr.setPower(power)
+        return tr
+    return board, quiet(make)
+
+
+class Packet:
+    __slots__ = ('node', 'seq', 'size', 'gen', 'start', 'end', 'lock',
+                 'rssi', 'interf', 'lost', 'payload')
+
+    def __init__(self, node, seq, gen):
+        self.node = node
+        self.seq = seq
+        self.gen = gen       # time of generation [us]
+        self.start = 0       # TX start [us]
+        self.end = 0         # TX end [us]
+        self.lock = 0        # end of preamble [us]
+        self.rssi = 0.       # power at gateway [dBm]
+        self.interf = -999.  # strongest overlapping packet [dBm]
+        self.lost = None     # reason of loss (look REASONS)
+        self.payload = None
+
+
+class Node:
+    """virtual node: `RADIO` on own fake board and traffic source"""
+
+    def __init__(self, sim, number, sf, bw, power, loss, period, poisson, size):
+        self.sim = sim
+        self.number = number
+        self.sf, self.bw = sf, bw
+        self.rssi = power - loss       # power at gateway [dBm]
+        self.period = period * 1e6     # mean interval of packets [us]
+        self.poisson = poisson         # Poisson or periodic arrivals
+        self.size = max(size, struct.calcsize(PACKET_HEADER))
+        self.seq = 0
+        self.free = 0                  # end of last TX [us]
+        self._sent = None
+        self.board, self.radio = newRadio(sf, bw, power)
+        self.board.chip.onTx = self._onTx
+
+    def _onTx(self, chip, payload):
+        self._sent = payload
+
+    def interval(self):
+        """get time to next packet [us]"""
+        if self.poisson:
+            return self.sim.random.expovariate(1. / self.period)
+        return self.period
+
+    def send(self, pkt):
+        """send packet by driver; return time on air [us]"""
+        payload = bytearray(self.size)
+        struct.pack_into(PACKET_HEADER, payload, 0, self.number, pkt.seq)
+        self._sent = None
+        self.radio.send(payload)
+        pkt.payload = self._sent
+        pkt.size = len(self._sent)
+        return self.radio.airtime(pkt.size)
+
+
+class LoadSim:
+    def __init__(self,
+                 sf          = 7,      # gateway SF
+                 bw          = 125.,   # gateway BW [kHz]
+                 capture     = 6.,     # capture threshold [dB]
+                 isr_us      = 500,    # DIO0 handler CPU time [us]
+                 byte_us     = 20,     # CPU time per payload byte [us]
+                 callback_us = 2000,   # receive callback CPU time [us]
+                 queue       = 4,      # RxDone waiting for CPU
+                 seed        = 1):
+        self.random = random.Random(seed)
+        self.sf, self.bw = sf, bw
+        self.capture = capture
+        self.isr_us, self.byte_us, self.callback_us = isr_us, byte_us, callback_us
+        self.queue = queue
+        self.board, self.radio = newRadio(sf, bw)
+        self.radio.onReceive(self._onReceive)
+        self.radio.receive(0)
+        self.nodes = []
+        self._events = []
+        self._n = 0          # event sequence (order of equal times)
+        self._air = []       # packets on air of gateway channel
+        self._locked = None  # packet of receiver
+        self._pending = []   # RxDone waiting for CPU: (packet, crcOk)
+        self._serving = None # packet served by CPU
+        self._rx = None      # packet got by callback of driver
+        self.duration = 0    # simulated time [us]
+        self.reset()
+
+    def reset(self):
+        """clear counters"""
+        self.packets = []     # packets of gateway channel
+        self.foreign = 0      # packets of other SF/BW
+        self.delivered = 0
+        self.crc_errors = 0   # RxDone with CRC error
+        self.airtime = 0      # air time of gateway channel [us]
+        self.cpu = 0          # gateway CPU time [us]
+        self.host = 0.        # host time of driver RX path [s]
+        self.rx_done = 0      # RxDone served
+        self.latency = []     # generation to end of service [us]
+
+    def addNode(self, sf=None, bw=None, power=14, loss=120., period=60.,
+                poisson=True, size=16):
+        """add node (SF/BW of gateway by default); return `Node`;
+           `loss` - path loss to gateway [dB], `period` - mean interval [s]"""
+        node = Node(self, len(self.nodes), sf or self.sf, bw or self.bw,
+                    power, loss, period, poisson, size)
+        self.nodes.append(node)
+        return node
+
+    def _at(self, t, ev, obj):
+        self._n += 1
+        heapq.heappush(self._events, (t, self._n, ev, obj))
+
+    def run(self, duration=600.):
+        """simulate `duration` [s] of traffic; return results (look results())"""
+        rnd = self.random
+        end = duration * 1e6
+        self.duration = end
+        for node in self.nodes:
+            first = node.interval() if node.poisson else rnd.uniform(0, node.period)
+            self._at(first, EV_GEN, node)
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze() # nodes are static: cheap collect() of driver
+        events = self._events
+        while events:
+            t, n, ev, obj = heapq.heappop(events)
+            if ev == EV_GEN:
+                if t < end:
+                    self._gen(t, obj)
+            elif ev == EV_START:
+                self._start(t, obj)
+            elif ev == EV_END:
+                self._end(t, obj)
+            else:
+                self._done(t)
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        return self.results()
+
+    def _gen(self, t, node):
+        # new packet of node: TX at once or after current TX of node
+        pkt = Packet(node, node.seq, t)
+        node.seq += 1
+        start = max(t, node.free)
+        node.free = start + node.radio.airtime(node.size)
+        self._at(start, EV_START, pkt)
+        self._at(t + node.interval(), EV_GEN, node)
+
+    def _start(self, t, pkt):
+        node = pkt.node
+        air = node.send(pkt)
+        pkt.start, pkt.end = t, t + air
+        if node.sf != self.sf or node.bw != self.bw:
+            self.foreign += 1 # orthogonal
+            return
+        self.packets.append(pkt)
+        self.airtime += air
+        pkt.rssi = node.rssi
+        for other in self._air:
+            if other.rssi > pkt.interf: pkt.interf = other.rssi
+            if pkt.rssi > other.interf: other.interf = pkt.rssi
+        self._air.append(pkt)
+        self._at(pkt.end, EV_END, pkt)
+        if pkt.rssi < sensitivity(node.sf, node.bw):
+            pkt.lost = 'weak'
+            return
+        locked = self._locked
+        if locked is None:
+            pass
+        elif t < locked.lock and pkt.rssi >= locked.rssi + self.capture:
+            locked.lost = 'collision' # receiver is captured by stronger packet
+        else:
+            pkt.lost = 'busy'
+            return
+        tsym = (1 << node.sf) * 1000. / node.bw
+        pkt.lock = t + (node.radio.getPreamble() + 4.25) * tsym
+        self._locked = pkt
+
+    def _end(self, t, pkt):
+        self._air.remove(pkt)
+        if self._locked is not pkt:
+            return
+        self._locked = None
+        crcOk = pkt.interf <= pkt.rssi - self.capture
+        if not crcOk:
+            pkt.lost = 'collision'
+        if self._serving is None:
+            self._serve(t, pkt, crcOk)
+        elif len(self._pending) < self.queue:
+            self._pending.append((pkt, crcOk))
+        else:
+            pkt.lost = 'overrun'
+
+    def _serve(self, t, pkt, crcOk):
+        # RxDone: DIO0 handler and callback of driver, CPU busy
+        chip = self.board.chip
+        snr = min(max(pkt.rssi - noiseFloor(self.bw), -32.), 31.75)
+        self._rx = None
+        t0 = perf_counter()
+        chip.inject(pkt.payload, int(pkt.rssi), snr, crc=crcOk)
+        self.host += perf_counter() - t0
+        self.rx_done += 1
+        service = self.isr_us + self.byte_us * pkt.size + self.callback_us
+        self.cpu += service
+        self._serving = pkt
+        self._at(t + service, EV_DONE, None)
+
+    def _onReceive(self, radio, payload, crcOk):
+        if not crcOk:
+            self.crc_errors += 1
+            return
+        number, seq = struct.unpack_from(PACKET_HEADER, payload)
+        self._rx = (number, seq)
+
+    def _done(self, t):
+        pkt = self._serving
+        self._serving = None
+        if pkt.lost is None and self._rx == (pkt.node.number, pkt.seq):
+            self.delivered += 1
+            self.latency.append(t - pkt.gen)
+        if self._pending:
+            self._serve(t, *self._pending.pop(0))
+
+    def results(self):
+        """get results: dict of delivery ratio, losses, latency [us],
+           channel load and gateway CPU utilization"""
+        sent = len(self.packets)
+        lost = dict((r, 0) for r in REASONS)
+        for pkt in self.packets:
+            if pkt.lost:
+                lost[pkt.lost] += 1
+        lat = sorted(self.latency)
+        def pct(p):
+            return lat[min(int(p * len(lat)), len(lat) - 1)] if lat else 0
+        duration = float(self.duration or 1)
+        res = {'nodes': len(self.nodes), 'sent': sent,
+               'delivered': self.delivered, 'foreign': self.foreign,
+               'pdr': self.delivered / float(sent) if sent else 0.,
+               'load': self.airtime / duration, # Erlang
+               'cpu': self.cpu / duration,
+               'crc_errors': self.crc_errors,
+               'host_us': self.host * 1e6 / self.rx_done if self.rx_done else 0.,
+               'latency_p50': pct(.5), 'latency_p90': pct(.9),
+               'latency_p99': pct(.99), 'latency_max': lat[-1] if lat else 0}
+        for r in REASONS:
+            res[r] = lost[r]
+        return res
+
+
+def simulate(nodes, sf=7, bw=125., sfs=None, power=14, loss=(90., 140.),
+             period=60., poisson=True, size=16, duration=600., seed=1, **kw):
+    """run one simulation of `nodes` nodes with random path loss in range
+       `loss` and random SF of `sfs` (SF of gateway by default); return
+       results (look LoadSim.results())"""
+    sim = LoadSim(sf, bw, seed=seed, **kw)
+    rnd = sim.random
+    for i in range(nodes):
+        sim.addNode(rnd.choice(sfs) if sfs else sf, bw, power,
+                    rnd.uniform(*loss), period, poisson, size)
+    return sim.run(duration)
+
+
+def table(res, header=False):
+    """print results as table row"""
+    if header:
+        print("%6s %7s %6s %7s %7s %6s %6s %6s %6s %6s %6s %8s %8s %8s %6s" % (
+              'nodes', 'sent', 'other', 'pdr', 'load', 'weak', 'busy', 'coll', 'ovrun',
+              'crc', 'cpu%', 'p50ms', 'p90ms', 'p99ms', 'hostus'))
+    print("%6d %7d %6d %7.3f %7.3f %6d %6d %6d %6d %6d %6.1f %8.1f %8.1f %8.1f %6.0f" % (
+          res['nodes'], res['sent'], res['foreign'], res['pdr'], res['load'], res['weak'],
+          res['busy'], res['collision'], res['overrun'], res['crc_errors'],
+          res['cpu'] * 100, res['latency_p50'] / 1e3, res['latency_p90'] / 1e3,
+          res['latency_p99'] / 1e3, res['host_us']))
+
+
+def jsonLines(res, **extra):
+    """print results as JSON lines of "bench.py" format"""
+    import json
+    for bench, key, unit in (('loadsim_pdr', 'pdr', 'ratio'),
+                             ('loadsim_cpu', 'cpu', '%'),
+                             ('loadsim_latency_p50', 'latency_p50', 'us'),
+                             ('loadsim_latency_p99', 'latency_p99', 'us'),
+                             ('loadsim_host', 'host_us', 'us')):
+        r = {'bench': bench, 'value': res[key] * (100 if unit == '%' else 1),
+             'unit': unit, 'port': sys.platform, 'fake': True,
+             'nodes': res['nodes']}
+        r.update(extra)
+        print(json.dumps(r))
+
+
+def main(argv):
+    import argparse
+    p = argparse.ArgumentParser(description="LoRa gateway load simulator")
+    p.add_argument('--nodes', default='10,50,100,200,500',
+                   help="node counts of sweep")
+    p.add_argument('--sf', type=int, default=7, help="gateway SF")
+    p.add_argument('--bw', type=float, default=125., help="BW [kHz]")
+    p.add_argument('--sfs', default=None, help="SF list of nodes (gateway SF)")
+    p.add_argument('--power', type=int, default=14, help="node TX power [dBm]")
+    p.add_argument('--loss', default='90,140', help="path loss range [dB]")
+    p.add_argument('--period', type=float, default=60., help="packet interval [s]")
+    p.add_argument('--periodic', action='store_true', help="periodic (not Poisson)")
+    p.add_argument('--size', type=int, default=16, help="payload size [bytes]")
+    p.add_argument('--duration', type=float, default=600., help="simulated time [s]")
+    p.add_argument('--capture', type=float, default=6., help="capture threshold [dB]")
+    p.add_argument('--isr-us', type=int, default=500, help="DIO0 handler time [us]")
+    p.add_argument('--byte-us', type=int, default=20, help="time per byte [us]")
+    p.add_argument('--callback-us', type=int, default=2000, help="callback time [us]")
+    p.add_argument('--queue', type=int, default=4, help="RxDone queue depth")
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--json', action='store_true', help="JSON lines output")
+    a = p.parse_args(argv)
+    loss = tuple(float(x) for x in a.loss.split(','))
+    sfs = [int(x) for x in a.sfs.split(',')] if a.sfs else None
+    for i, n in enumerate(int(x) for x in a.nodes.split(',')):
+        res = simulate(n, a.sf, a.bw, sfs, a.power, loss, a.period,
+                       not a.periodic, a.size, a.duration, a.seed,
+                       capture=a.capture, isr_us=a.isr_us, byte_us=a.byte_us,
+                       callback_us=a.callback_us, queue=a.queue)
+        if a.json:
+            jsonLines(res, sf=a.sf, period=a.period)
+        else:
+            table(res, header=i == 0)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
+
+
+#*** end of "loadsim.py" module ***#
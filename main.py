@@ -43,7 +43,10 @@ elif wifi == 2:
 
 def on_receive(tr, payload, crcOk):
     tr.blink()
-    payload_string = payload.decode()
+    try:
+        payload_string = payload.decode()
+    except UnicodeError: # binary payload (look "codec.py")
+        payload_string = ' '.join('%02X' % b for b in payload)
     #payload_string = str(payload)
     rssi = tr.getPktRSSI()
     snr  = tr.getSNR()
@@ -82,8 +85,14 @@ else: # FSK/OOK mode
     tr.setFixedLen(False)  # fixed packet size or variable
     tr.setDcFree(0)        # 0=Off, 1=Manchester, 2=Whitening
 
+tr.saveConfig() # config restored by recover() on TX timeout
+
 tr.dump()
 
+# radio energy accounting (print by `meter.report()`)
+#import energy
+#meter = energy.Energy(tr, voltage=3.3)
+
 tr.collect()
 
 # LOOK HERE and CHANGE!!!
@@ -92,30 +101,126 @@ MODE = 1 # transmitter
 #MODE = 2 # receiver
 #MODE = 3 # morse transmitter in continuous mode
 #MODE = 4 # beeper
+#MODE = 5 # TDMA gateway (send beacons and receive)
+#MODE = 6 # TDMA node (send in own slot)
+#MODE = 7 # LoRa gateway (forward packets to UDP server, set wifi = 2)
+#MODE = 8 # band scanner (RSSI spectrum sweep)
+#MODE = 9 # binary telemetry transmitter (look "codec.py")
+#MODE = 10 # multi-SF receiver (CAD cycling over SF7...SF12)
+#MODE = 11 # raw OOK bitstream capture in continuous mode (FSK/OOK)
+#MODE = 12 # sniffer (binary frames to UART, look "sniffer.py")
+
+GATEWAY_SERVER = "192.168.0.254" # UDP server (MODE = 7)
+
+TDMA_SLOT = 1 # node slot number 1...8 (MODE = 6)
 
 # implicit header (LoRa) or fixed packet length (FSK/OOK)
 #FIXED = True
 FIXED = False
 
+# fixed length message type of "Hello" (precomputed registers, look addProfile())
+if FIXED:
+    tr.addProfile('hello', 5)
+HELLO = 'hello' if FIXED else None
+
 if MODE == 1:
     # transmitter
     while True:
         tr.blink()
-        tr.send("Hello", FIXED)
+        tr.send("Hello", profile=HELLO)
         time.sleep_ms(1900)
 
 elif MODE == 2:
     # reseiver
     tr.onReceive(on_receive) # set the receive callback
 
-    # go into receive mode
-    if FIXED:
-        tr.receive(6) # implicit header / fixed size: 6=size("Hello!")
-    else:
-        tr.receive(0) # explicit header / variable packet size
+    # go into receive mode: implicit header / fixed size of profile or
+    # explicit header / variable packet size
+    tr.receive(profile=HELLO)
 
     time.sleep(-1) # wait interrupt
 
+elif MODE == 5 or MODE == 6:
+    # TDMA gateway/node
+    import tdma
+    sched = tdma.TDMA(tr, slot=0 if MODE == 5 else TDMA_SLOT,
+                      slots=8, size=16, onReceive=on_receive)
+    tr.receive(0)
+    while True:
+        if MODE == 5:
+            sched.poll()
+        elif sched.send("Hello"):
+            tr.blink()
+        time.sleep_ms(1)
+
+elif MODE == 7:
+    # LoRa gateway (Semtech UDP packet forwarder protocol)
+    import gateway
+    fwd = gateway.Forwarder(tr, GATEWAY_SERVER, 1700, onReceive=on_receive)
+    tr.receive(0)
+    while True:
+        fwd.poll()
+        time.sleep_ms(10)
+
+elif MODE == 8:
+    # band scanner (433.050...434.790 MHz ISM band)
+    import scanner
+    scan = scanner.Scanner(tr, 433050, 434790, rx_bw=25., samples=8)
+    while True:
+        scan.sweep()
+        scan.report()
+        time.sleep_ms(1000)
+
+elif MODE == 9:
+    # binary telemetry: 7 bytes instead of ~40 bytes of JSON text
+    import codec
+    schema = codec.Schema('<hHBH', ('temp', 'hum', 'bat', 'seq'),
+                          (100, 10, 50, 1))
+    if FIXED:
+        tr.addProfile('telemetry', schema.size)
+    seq = 0
+    while True:
+        tr.blink()
+        tr.send(schema.pack(21.37, 55.5, 3.71, seq),
+                profile='telemetry' if FIXED else None)
+        seq = (seq + 1) & 0xFFFF
+        time.sleep_ms(1900)
+
+elif MODE == 10:
+    # multi-SF receiver (LoRa mode only)
+    import multisf
+    msf = multisf.MultiSF(tr, (7, 8, 9, 10, 11, 12), onReceive=on_receive)
+    msf.begin()
+    t = time.ticks_ms()
+    while True:
+        msf.poll()
+        if time.ticks_diff(time.ticks_ms(), t) >= 60000:
+            t = time.ticks_ms()
+            msf.report()
+
+elif MODE == 11:
+    # raw bitstream capture (DIO1/DCLK -> GPIO0, DIO2/DATA -> GPIO16)
+    import capture
+    def on_frame(cap, frame):
+        tr.blink()
+        print("*** Frame:", ' '.join('%02X' % b for b in frame))
+    cap = capture.Capture(tr, dclk=0, data=16, sync=0x2DD4, sync_bits=16,
+                          frame_bits=64, max_errors=1, onFrame=on_frame)
+    cap.maxBitrate()
+    cap.report(tr.getBitrate())
+    cap.begin()
+    while True:
+        cap.poll()
+        time.sleep_ms(5)
+
+elif MODE == 12:
+    # sniffer: binary frames to UART1 TX (GPIO2 on ESP8266), no text
+    import sniffer
+    snf = sniffer.Sniffer(tr, 1, baudrate=921600)
+    tr.receive(0)
+    while True:
+        snf.poll()
+
 
 msg = "-- --- ..." # "MOS"
 pause   = 2000 # ms
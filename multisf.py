@@ -0,0 +1,175 @@
+# -*- coding: UTF8 -*-
+# Multi-SF LoRa listener by fast CAD cycling on top of "sx127x" driver
+# Licenced by GPLv3
+#
+# Radio runs CAD on each SF of the list in turn. When CAD detects a
+# preamble radio locks on this SF in RX single mode; packet is received
+# by DIO0 (`RxDone`) handler of driver, then cycling is resumed from
+# next SF. Per-SF registers (`RegModemConfig2/3`, detection optimize and
+# threshold) are read back from driver setters once by begin() and are
+# written on hop only if they differ.
+#
+# Counters per SF:
+#   cads    - CAD runs
+#   detects - CAD detected preamble
+#   hits    - packets received after detection
+#   misses  - detection without packet (RX timeout or CRC error)
+#
+# SF6 is not supported (implicit header only).
+
+from array import array
+from sx127x import ticks_us, ticks_diff, MAX_PKT_LENGTH, \
+                   REG_OP_MODE, REG_IRQ_FLAGS, REG_MODEM_CONFIG_2, \
+                   REG_MODEM_CONFIG_3, REG_DETECT_OPTIMIZE, \
+                   REG_DETECTION_THRESHOLD, REG_SYMB_TIMEOUT, MODES_MASK, \
+                   MODE_STDBY, MODE_RX_SINGLE, MODE_CAD, IRQ_RX_TIMEOUT, \
+                   IRQ_CAD_DONE, IRQ_CAD_DETECTED
+
+
+class MultiSF:
+    def __init__(self, radio,
+                 sfs       = (7, 8, 9, 10, 11, 12), # SF list (7...12)
+                 symbols   = 16,    # RX single timeout after CAD [symbols]
+                 onReceive = None): # receive callback(radio, payload, crcOk)
+        self.radio = radio
+        self.sfs = [min(max(sf, 7), 12) for sf in sfs]
+        self.symbols = min(max(symbols, 4), 0x3FF)
+        n = len(self.sfs)
+        self.cads    = array('L', [0] * n)
+        self.detects = array('L', [0] * n)
+        self.hits    = array('L', [0] * n)
+        self.misses  = array('L', [0] * n)
+        self._onReceive = onReceive
+        self._cfg = None   # precomputed registers per SF
+        self._i = 0        # index of current SF
+        self._rx = False   # RX single after CAD detection
+        self._rxDone = False
+        self._t0 = 0
+
+
+    def begin(self):
+        """precompute per-SF registers and start CAD cycling"""
+        radio = self.radio
+        sf, ldro = radio.getSF(), radio.getLDRO()
+        bw = radio.getBW()
+        rd = radio.readReg
+        self._cfg = []
+        self._window = [] # maximum RX single duration [us]
+        for s in self.sfs:
+            l = (1 << s) / bw > 16. # symbol time > 16 ms
+            radio.setSF(s)
+            radio.setLDRO(l)
+            cfg2 = (rd(REG_MODEM_CONFIG_2) & ~0x03) | (self.symbols >> 8)
+            self._cfg.append((cfg2, rd(REG_MODEM_CONFIG_3),
+                              rd(REG_DETECT_OPTIMIZE), rd(REG_DETECTION_THRESHOLD),
+                              s, l))
+            self._window.append(radio.airtime(MAX_PKT_LENGTH) +
+                                int(self.symbols * (1 << s) * 1000 / bw))
+        self._sf, self._ldro = sf, ldro # restored by end()
+        radio.setMode(MODE_STDBY)
+        radio.writeReg(REG_SYMB_TIMEOUT, self.symbols & 0xFF)
+        self._opMode = rd(REG_OP_MODE) & ~MODES_MASK
+        self._regs = (None, None, None, None) # force full write
+        radio.onReceive(self._handleOnReceive)
+        self._i = len(self.sfs) - 1
+        self._next()
+
+
+    def end(self):
+        """stop cycling; restore SF of radio"""
+        radio = self.radio
+        radio.setMode(MODE_STDBY)
+        radio.writeReg(REG_IRQ_FLAGS, IRQ_RX_TIMEOUT | IRQ_CAD_DONE | IRQ_CAD_DETECTED)
+        radio.onReceive(self._onReceive)
+        radio.setSF(self._sf)
+        radio.setLDRO(self._ldro)
+        self._cfg = None
+
+
+    def _apply(self, i):
+        # write registers of SF which differ from current
+        wr = self.radio.writeReg
+        cfg, regs = self._cfg[i], self._regs
+        if cfg[0] != regs[0]: wr(REG_MODEM_CONFIG_2,      cfg[0])
+        if cfg[1] != regs[1]: wr(REG_MODEM_CONFIG_3,      cfg[1])
+        if cfg[2] != regs[2]: wr(REG_DETECT_OPTIMIZE,     cfg[2])
+        if cfg[3] != regs[3]: wr(REG_DETECTION_THRESHOLD, cfg[3])
+        self._regs = cfg
+
+
+    def _next(self):
+        # hop to next SF and start CAD
+        i = self._i + 1
+        if i >= len(self.sfs):
+            i = 0
+        self._i = i
+        self._apply(i)
+        self.cads[i] += 1
+        self._setMode(MODE_CAD)
+
+
+    def _setMode(self, mode):
+        # fast mode change by one register write
+        radio = self.radio
+        radio.writeReg(REG_OP_MODE, self._opMode | mode)
+        if radio.energy:
+            radio.energy.mode(mode)
+
+
+    def _handleOnReceive(self, radio, payload, crcOk):
+        # packet received in RX single (called from DIO0 IRQ)
+        if crcOk is False:
+            self.misses[self._i] += 1
+        else:
+            self.hits[self._i] += 1
+        self._rxDone = True
+        if self._onReceive:
+            self._onReceive(radio, payload, crcOk)
+
+
+    def poll(self):
+        """run CAD/RX state machine; call it often; return SF of RX or None"""
+        radio = self.radio
+        i = self._i
+        if self._rx: # locked on SF
+            flags = radio.readReg(REG_IRQ_FLAGS)
+            if not self._rxDone:
+                if not flags & IRQ_RX_TIMEOUT and \
+                   ticks_diff(ticks_us(), self._t0) < self._window[i]:
+                    return self.sfs[i] # receiving
+                radio.writeReg(REG_IRQ_FLAGS, IRQ_RX_TIMEOUT)
+                if radio.energy:
+                    radio.energy.rxDone()
+                self.misses[i] += 1
+            self._rx = False
+            self._next()
+            return None
+
+        flags = radio.readReg(REG_IRQ_FLAGS)
+        if not flags & IRQ_CAD_DONE:
+            return None # CAD in progress
+        radio.writeReg(REG_IRQ_FLAGS, IRQ_CAD_DONE | IRQ_CAD_DETECTED)
+        if radio.energy:
+            radio.energy.mode(MODE_STDBY) # standby automatically after CAD
+        if flags & IRQ_CAD_DETECTED: # lock on SF
+            self.detects[i] += 1
+            cfg = self._cfg[i]
+            radio.setCachedSF(cfg[4], cfg[5]) # getSF()/airtime() of radio
+            self._rxDone = False
+            self._rx = True
+            self._t0 = ticks_us()
+            self._setMode(MODE_RX_SINGLE)
+            return self.sfs[i]
+        self._next()
+        return None
+
+
+    def report(self):
+        """print per-SF counters"""
+        for i in range(len(self.sfs)):
+            print("SF%-2d  cads=%-8d detects=%-6d hits=%-6d misses=%d" % (
+                  self.sfs[i], self.cads[i], self.detects[i], self.hits[i],
+                  self.misses[i]))
+
+
+#*** end of "multisf.py" module ***#
@@ -0,0 +1,334 @@
+# -*- coding: UTF8 -*-
+# Append-only packet log on flash with batched writes and rotation for
+# "sx127x" driver
+# Licenced by GPLv3
+#
+# Receive callback packs every packet to fixed size record in RAM ring
+# (no file access in IRQ); poll() from main loop writes full page of
+# records (`page` bytes, flash block) by one write() to current log
+# file, pending records after `flush_ms`. If ring is full record is
+# dropped (counted).
+#
+# Log is set of `files` files of `file_records` records ("pkt0.log",
+# "pkt1.log", ...); when current file is full, oldest file is truncated
+# and reused (rotation). Index file "pkt.idx" keeps file number, first
+# sequence number and first time of every file (rewritten when new file
+# is started; rebuilt from first records if lost). Record of sequence
+# number is found by seek, record of time by binary search in file.
+#
+# Record format (little endian, `record` bytes):
+#   seq    4  sequence number (continues after restart)
+#   time   4  `time.time()` of receive [s]
+#   rssi   2  packet RSSI [0.25 dBm] (signed)
+#   snr    1  SNR [0.25 dB] (signed, LoRa)
+#   flags  1  bit 0 - CRC checked, bit 1 - CRC ok, bit 2 - truncated
+#   length 1  payload size (before truncation to `record` - 14 bytes)
+#   check  1  sum of other record bytes (mod 256)
+#   payload
+#
+# Usage:
+#   log = pktlog.PacketLog(tr, 'log')
+#   tr.receive(0)
+#   while True: log.poll()
+#   for seq, t, rssi, snr, crc, payload in log.replay(seq=100): ...
+
+import os
+import struct
+from time import time
+from sx127x import ticks_ms, ticks_us, ticks_diff
+
+RECORD_HEADER = '<IIhbBBB'
+HEADER_SIZE   = struct.calcsize(RECORD_HEADER) # 14 bytes
+CHECK_OFFSET  = HEADER_SIZE - 1
+INDEX_ENTRY   = '<BII' # file number, first sequence number, first time
+INDEX_SIZE    = struct.calcsize(INDEX_ENTRY)
+
+FLAG_CRC_CHECKED = 0x01
+FLAG_CRC_OK      = 0x02
+FLAG_TRUNCATED   = 0x04
+
+
+def exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+class PacketLog:
+    def __init__(self, radio,
+                 path         = 'log', # directory of log files
+                 record       = 64,    # record size [bytes]
+                 page         = 4096,  # batched write size [bytes]
+                 pages        = 2,     # RAM ring size [pages]
+                 file_records = 1024,  # records per file
+                 files        = 4,     # number of files (rotation)
+                 flush_ms     = 10000, # maximum delay of pending records [ms]
+                 onReceive    = None): # chained receive callback
+        self.radio = radio
+        self.path = path
+        self.record = max(record, HEADER_SIZE + 1)
+        self.per_page = max(page // self.record, 1) # records per write
+        self.file_records = max(file_records, self.per_page)
+        self.files = min(max(files, 2), 255)
+        self.flush_ms = flush_ms
+        self._cap = max(pages, 1) * self.per_page # ring size [records]
+        self._wrap = 2 * self._cap # wrap of head/tail counters (full ring)
+        self._buf = bytearray(self._cap * self.record)
+        self._mv = memoryview(self._buf)
+        self._zero = bytes(self.record)
+        self._head = 0 # write counter (receive callback)
+        self._tail = 0 # read counter (poll())
+        self._t = ticks_ms() # last write to file
+        self._f = None # current file
+        self._file = 0 # number of current file
+        self._count = 0 # records in current file
+        self.index = [] # [file, first seq, first time] from oldest file
+        self.seq = 0 # sequence number of next record
+        self.records = 0 # records put to ring
+        self.dropped = 0 # records dropped by ring overflow
+        self.written = 0 # records written to files
+        self.writes = 0 # file writes
+        self.write_us = 0 # duration of last write [us]
+        self.write_max = 0 # maximum duration of write [us]
+        self._onReceive = onReceive
+        self._load()
+        radio.onReceive(self._handleOnReceive)
+
+
+    def _name(self, n):
+        return '%s/pkt%d.log' % (self.path, n)
+
+
+    def _load(self):
+        # read index, continue sequence numbers and current file
+        if not exists(self.path):
+            os.mkdir(self.path)
+        self.index = self._readIndex() or self._scanIndex()
+        if not self.index:
+            self._start(0)
+            return
+        n = self.index[-1][0]
+        name = self._name(n)
+        size = os.stat(name)[6]
+        count = size // self.record
+        last = None
+        if count:
+            f = open(name, 'rb')
+            f.seek((count - 1) * self.record)
+            last = f.read(self.record)
+            f.close()
+        if last and self._check(last):
+            self.seq = struct.unpack_from('<I', last)[0] + 1
+        else: # torn write: skip rest of file
+            self.seq = self.index[-1][1] + max(count - 1, 0)
+            count = self.file_records
+        if size % self.record or count >= self.file_records:
+            self._start((n + 1) % self.files)
+        else:
+            self._f = open(name, 'ab')
+            self._count = count
+            self._file = n
+
+
+    def _readIndex(self):
+        # index file -> [[file, first seq, first time], ...] (or None)
+        try:
+            f = open(self.path + '/pkt.idx', 'rb')
+            data = f.read()
+            f.close()
+        except OSError:
+            return None
+        if not data or len(data) % INDEX_SIZE:
+            return None
+        index = [list(struct.unpack_from(INDEX_ENTRY, data, i))
+                 for i in range(0, len(data), INDEX_SIZE)]
+        for entry in index:
+            if not exists(self._name(entry[0])):
+                return None
+        return index
+
+
+    def _scanIndex(self):
+        # rebuild index by first records of files
+        index = []
+        for n in range(self.files):
+            try:
+                f = open(self._name(n), 'rb')
+                rec = f.read(self.record)
+                f.close()
+            except OSError:
+                continue
+            if len(rec) == self.record and self._check(rec):
+                seq, t = struct.unpack_from('<II', rec)
+                index.append([n, seq, t])
+        index.sort(key=lambda entry: entry[1])
+        self._writeIndex(index)
+        return index
+
+
+    def _writeIndex(self, index):
+        f = open(self.path + '/pkt.idx', 'wb')
+        for entry in index:
+            f.write(struct.pack(INDEX_ENTRY, *entry))
+        f.close()
+
+
+    def _check(self, rec):
+        # check sum of record
+        return (sum(rec) - 2 * rec[CHECK_OFFSET]) & 0xFF == 0
+
+
+    def _start(self, n):
+        # truncate file `n` and make it current (rotation)
+        if self._f:
+            self._f.close()
+        self.index = [entry for entry in self.index if entry[0] != n]
+        self._f = open(self._name(n), 'wb')
+        self._count = 0
+        self._file = n
+
+
+    def pending(self):
+        """get number of records not written to file"""
+        return (self._head - self._tail) % self._wrap
+
+
+    def _handleOnReceive(self, radio, payload, crcOk):
+        # pack record to ring (called from DIO0 IRQ)
+        head = self._head
+        if (head - self._tail) % self._wrap == self._cap: # full ring
+            self.dropped += 1
+        else:
+            rec = self.record
+            off = (head % self._cap) * rec
+            size = len(payload)
+            n = min(size, rec - HEADER_SIZE)
+            flags = (0 if crcOk is None else FLAG_CRC_CHECKED |
+                     (FLAG_CRC_OK if crcOk else 0)) | \
+                    (FLAG_TRUNCATED if n < size else 0)
+            buf = self._buf
+            struct.pack_into(RECORD_HEADER, buf, off, self.seq, int(time()),
+                             int(radio.getPktRSSI() * 4),
+                             int(radio.getSNR() * 4), flags, min(size, 255), 0)
+            off += HEADER_SIZE
+            buf[off:off + n] = payload if n == size else payload[:n]
+            buf[off + n:off - HEADER_SIZE + rec] = self._zero[:rec - HEADER_SIZE - n]
+            buf[off - 1] = sum(self._mv[off - HEADER_SIZE:off - HEADER_SIZE + rec]) & 0xFF
+            self.seq += 1
+            self.records += 1
+            self._head = (head + 1) % self._wrap # publish record
+        if self._onReceive:
+            self._onReceive(radio, payload, crcOk)
+
+
+    def poll(self):
+        """write page of records to file if it is full (or pending records
+           after `flush_ms`); call it often; return written records"""
+        n = self.pending()
+        if n < self.per_page and \
+           not (n and ticks_diff(ticks_ms(), self._t) >= self.flush_ms):
+            return 0
+        return self._write(min(n, self.per_page))
+
+
+    def flush(self):
+        """write all pending records"""
+        while self.pending():
+            self._write(self.pending())
+
+
+    def _write(self, n):
+        # write `n` records (not more than to end of ring/file) by one write()
+        tail, rec = self._tail, self.record
+        i = tail % self._cap
+        n = min(n, self._cap - i, self.file_records - self._count)
+        if not self._count: # first record of file -> index
+            seq, t = struct.unpack_from('<II', self._buf, i * rec)
+            self.index.append([self._file, seq, t])
+            self._writeIndex(self.index)
+        t0 = ticks_us()
+        self._f.write(self._mv[i * rec:(i + n) * rec])
+        self._f.flush()
+        dt = ticks_diff(ticks_us(), t0)
+        self.write_us = dt
+        if dt > self.write_max:
+            self.write_max = dt
+        self.writes += 1
+        self.written += n
+        self._t = ticks_ms()
+        self._tail = (tail + n) % self._wrap
+        self._count += n
+        if self._count >= self.file_records:
+            self._start((self._file + 1) % self.files)
+        return n
+
+
+    def close(self):
+        """write pending records, close file, unhook from radio"""
+        self.flush()
+        self._f.close()
+        self._f = None
+        self.radio.onReceive(self._onReceive)
+
+
+    def _find(self, f, count, since):
+        # binary search of first record with time >= `since` in file
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * self.record)
+            if struct.unpack('<I', f.read(8)[4:])[0] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+    def replay(self, seq=None, since=None):
+        """iterate records from sequence number `seq` or time `since` [s]
+           (all by default): tuples (seq, time, rssi, snr, crc, payload),
+           `crc` is None if not checked; pending records are written first"""
+        self.flush()
+        index = self.index
+        k = 0
+        for i in range(len(index)):
+            if (seq is not None and index[i][1] <= seq) or \
+               (since is not None and index[i][2] <= since):
+                k = i
+        rec = self.record
+        for i in range(k, len(index)):
+            n = index[i][0]
+            f = open(self._name(n), 'rb')
+            count = self._count if n == self._file else \
+                    os.stat(self._name(n))[6] // rec
+            start = 0
+            if i == k:
+                if seq is not None:
+                    start = min(max(seq - index[i][1], 0), count)
+                elif since is not None:
+                    start = self._find(f, count, since)
+            f.seek(start * rec)
+            for j in range(start, count, self.per_page):
+                data = f.read(min(self.per_page, count - j) * rec)
+                for off in range(0, len(data) - rec + 1, rec):
+                    r = data[off:off + rec]
+                    if not self._check(r):
+                        continue
+                    s, t, rssi, snr, flags, size = \
+                        struct.unpack_from(RECORD_HEADER, r)[:6]
+                    yield (s, t, rssi / 4., snr / 4.,
+                           (flags & FLAG_CRC_OK == FLAG_CRC_OK) if flags & 1 else None,
+                           r[HEADER_SIZE:HEADER_SIZE + min(size, rec - HEADER_SIZE)])
+            f.close()
+
+
+    def report(self):
+        """print counters"""
+        print("records=%d  written=%d  dropped=%d  writes=%d  write=%d us (max %d us)  seq=%d" % (
+              self.records, self.written, self.dropped, self.writes,
+              self.write_us, self.write_max, self.seq))
+
+
+#*** end of "pktlog.py" module ***#
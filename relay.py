@@ -0,0 +1,206 @@
+# -*- coding: UTF8 -*-
+# Store-and-forward mesh relay (managed flooding) on top of "sx127x" driver
+# Licenced by GPLv3
+#
+# Packet format:
+#   [origin] [seq] [ttl] [payload...]
+#
+# Every node delivers new packets to callback and rebroadcasts them with
+# `ttl - 1` after random delay (nodes which heard the same packet do not
+# transmit at the same time). If the same packet is heard again while
+# own rebroadcast is pending, rebroadcast is cancelled (neighbour has
+# already covered the area). Duplicates are found by fixed-size
+# set-associative cache of (origin, seq) with LRU replacement.
+# Forwarding queue is limited by duty cycle (airtime budget).
+#
+# Memory is allocated once: cache about `4 * cache` bytes, queue
+# `queue * (MAX_PKT_LENGTH + 8)` bytes (look memory()).
+
+from array import array
+try:
+    import urandom as random
+except ImportError:
+    import random
+
+from sx127x import ticks_ms, ticks_diff, ticks_add, MAX_PKT_LENGTH
+
+HEADER_SIZE = 3 # origin, seq, ttl
+DUTY_WINDOW = 10 # airtime budget window [s]
+
+
+# fixed-size set-associative cache of 16-bit keys (LRU in set)
+class DupCache:
+    def __init__(self, size=64, ways=4):
+        sets = 1
+        while sets * ways < size:
+            sets <<= 1
+        self._mask = sets - 1
+        self._ways = ways
+        self._keys   = array('H', [0] * (sets * ways))
+        self._stamps = array('H', [0] * (sets * ways)) # 0 -> empty slot
+        self._now = 0
+
+
+    def check(self, key):
+        """return True if key is known; add key (evict LRU of set) if not"""
+        now = self._now + 1
+        if now > 0xFFFF:
+            now = 1
+        self._now = now
+        ways = self._ways
+        base = (((key * 0x9E37) >> 8) & self._mask) * ways
+        keys, stamps = self._keys, self._stamps
+        victim, age = base, -1
+        for i in range(base, base + ways):
+            s = stamps[i]
+            if s and keys[i] == key:
+                stamps[i] = now # refresh
+                return True
+            a = 0x10000 if not s else (now - s) & 0xFFFF
+            if a > age:
+                victim, age = i, a
+        keys[victim] = key
+        stamps[victim] = now
+        return False
+
+
+    def memory(self):
+        """get size of cache arrays [bytes]"""
+        return 4 * len(self._keys)
+
+
+class Relay:
+    def __init__(self, radio,
+                 addr,                # node address (origin) 0...255
+                 ttl       = 3,       # hop limit of own packets
+                 cache     = 64,      # duplicate cache size [packets]
+                 queue     = 4,       # forwarding queue size [packets]
+                 delay_ms  = (20, 200), # random rebroadcast delay [ms]
+                 duty      = 0.1,     # maximum airtime/time (None - no limit)
+                 onReceive = None):   # callback(relay, origin, payload)
+        self.radio = radio
+        self.addr = addr & 0xFF
+        self.ttl = ttl
+        self._seq = 0
+        self._cache = DupCache(cache)
+        self._delay = delay_ms
+        self.duty = duty
+        self._credit = 1e6 * DUTY_WINDOW * duty if duty else 0. # airtime budget [us]
+        self._t = ticks_ms() # time of last budget update
+        # preallocated queue slots: due time, key, size, packet
+        self._due  = [0] * queue
+        self._key  = array('H', [0] * queue)
+        self._size = array('H', [0] * queue) # 0 -> free slot
+        self._pkt  = [bytearray(MAX_PKT_LENGTH) for i in range(queue)]
+        self._onReceive = onReceive
+        self.stats = {'rx':   0, # received relay packets
+                      'new':  0, # new packets delivered to callback
+                      'dup':  0, # duplicates
+                      'supp': 0, # rebroadcasts cancelled by duplicate
+                      'drop': 0, # packets dropped by queue overflow
+                      'wait': 0, # transmissions deferred by duty cycle
+                      'tx':   0, # own packets sent
+                      'fwd':  0, # packets queued to forward
+                      'sent': 0} # transmissions
+        radio.onReceive(self._handleOnReceive)
+
+
+    def memory(self):
+        """get size of preallocated buffers [bytes]"""
+        n = len(self._size)
+        return self._cache.memory() + n * (MAX_PKT_LENGTH + 8)
+
+
+    def _enqueue(self, key, header, payload, delay):
+        # put packet to free queue slot; return False if queue is full
+        for i in range(len(self._size)):
+            if not self._size[i]:
+                pkt = self._pkt[i]
+                n = min(len(payload), MAX_PKT_LENGTH - HEADER_SIZE)
+                pkt[0:HEADER_SIZE] = header
+                pkt[HEADER_SIZE:HEADER_SIZE + n] = payload[:n]
+                self._size[i] = HEADER_SIZE + n
+                self._key[i] = key
+                self._due[i] = ticks_add(ticks_ms(), delay)
+                return True
+        self.stats['drop'] += 1
+        return False
+
+
+    def send(self, payload):
+        """queue own packet to flood (str/bytes); return False if queue is full"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self._seq = (self._seq + 1) & 0xFF
+        key = (self.addr << 8) | self._seq
+        self._cache.check(key) # do not forward own packet back
+        if self._enqueue(key, bytes((self.addr, self._seq, self.ttl)), payload, 0):
+            self.stats['tx'] += 1
+            return True
+        return False
+
+
+    def _handleOnReceive(self, radio, payload, crcOk):
+        # deliver new packet and schedule rebroadcast (called from DIO0 IRQ)
+        if crcOk is False or len(payload) < HEADER_SIZE:
+            return
+        stats = self.stats
+        stats['rx'] += 1
+        origin, seq, ttl = payload[0], payload[1], payload[2]
+        key = (origin << 8) | seq
+        if self._cache.check(key): # duplicate
+            stats['dup'] += 1
+            for i in range(len(self._size)):
+                if self._size[i] and self._key[i] == key:
+                    self._size[i] = 0 # neighbour has rebroadcast it
+                    stats['supp'] += 1
+            return
+        stats['new'] += 1
+        if self._onReceive:
+            self._onReceive(self, origin, payload[HEADER_SIZE:])
+        if ttl > 1:
+            dmin, dmax = self._delay
+            delay = dmin + random.getrandbits(16) % (dmax - dmin + 1)
+            if self._enqueue(key, bytes((origin, seq, ttl - 1)),
+                             payload[HEADER_SIZE:], delay):
+                stats['fwd'] += 1
+
+
+    def pending(self):
+        """get number of queued packets"""
+        n = 0
+        for size in self._size:
+            if size: n += 1
+        return n
+
+
+    def poll(self):
+        """send due packets within airtime budget; call it often"""
+        now = ticks_ms()
+        if self.duty is not None: # refill budget (up to DUTY_WINDOW of airtime)
+            full = 1e6 * DUTY_WINDOW * self.duty
+            self._credit = min(self._credit +
+                               ticks_diff(now, self._t) * 1000 * self.duty, full)
+            self._t = now
+        best = -1
+        for i in range(len(self._size)): # earliest due packet
+            if self._size[i] and ticks_diff(now, self._due[i]) >= 0 and \
+               (best < 0 or ticks_diff(self._due[i], self._due[best]) < 0):
+                best = i
+        if best < 0:
+            return False
+        size = self._size[best]
+        airtime = self.radio.airtime(size)
+        if self.duty is not None:
+            if self._credit < airtime and self._credit < full:
+                self.stats['wait'] += 1
+                return False
+            self._credit -= airtime
+        self._size[best] = 0
+        self.stats['sent'] += 1
+        self.radio.send(memoryview(self._pkt[best])[:size])
+        self.radio.receive(0)
+        return True
+
+
+#*** end of "relay.py" module ***#
@@ -0,0 +1,507 @@
+# -*- coding: UTF8 -*-
+# Host control of "sx127x" driver by batched binary RPC over UART/USB
+# serial: on-device server and CPython client
+# Licenced by GPLv3
+#
+# Frame (both directions):
+#   magic  2  0xA5 0x5B
+#   type   1  'Q' - request, 'R' - response, 'P' - part of response
+#             (more frames of seq follow), 'E' - RX event
+#   seq    1  request number (response has seq of its request, event 0)
+#   length 2  body size (little endian)
+#   body   length bytes (encoded value, look encode())
+#   sum    1  sum of bytes from `type` to end of body (mod 256)
+#
+# Request body is list of calls [[method, [args...]], ...] where method is
+# index in METHODS; response body is list of results [[status, value]]
+# (status 0 - ok, 1 - error text) in order of calls; results longer than
+# MAX_BODY are sent in several frames ('P'... 'R'), one result longer than
+# MAX_BODY is error "Response too large". Several calls in one
+# request are one round trip (batch); client may send next requests
+# before responses (pipeline), server answers in order. Received packets
+# are sent as events [ticks, rssi, snr, crcOk, payload] if stream is on.
+#
+# Device:
+#   srv = rpc.Server(tr, 1, baudrate=115200) # UART1 (or object with read/write)
+#   while True: srv.poll()
+#
+# Host (CPython):
+#   c = rpc.Client('/dev/ttyUSB0', 115200)
+#   c.setFrequency(434000)              # one call - one round trip
+#   with c.batch() as b:                # several calls - one round trip
+#       b.setSF(7); b.setBW(125.); b.getSF()
+#   print(b.results)                    # [None, None, 7]
+#   c.stream(True); c.receive(0)
+#   for ticks, rssi, snr, crcOk, payload in c.events(timeout=10.): ...
+#
+# Test without hardware (fake SPI/Pin on pty pair):
+#   $ python3 rpc.py fake               # prints pty name for client
+
+import struct
+
+RPC_MAGIC   = b'\xA5\x5B'
+RPC_VERSION = 1
+MAX_BODY    = 1024 # maximum body size [bytes]
+
+# methods by index (server methods first, then `RADIO` methods)
+SERVER_METHODS = ('hello', 'stats', 'snapshot', 'stream')
+METHODS = SERVER_METHODS + (
+    'init', 'reset', 'version', 'setMode', 'getMode', 'lora', 'fsk', 'ook',
+    'isLora', 'getModulation', 'sleep', 'standby', 'setFrequency',
+    'getFrequency', 'setPower', 'getPower', 'setHighPower', 'setOCP',
+    'setLnaBoost', 'setRamp', 'enableCRC', 'setSF', 'getSF', 'setBW',
+    'getBW', 'setCR', 'getCR', 'setLDRO', 'setPreamble', 'setSW',
+    'setSyncWord', 'setAddress', 'setImplicitHeaderMode', 'invertIQ',
+    'setBitrate', 'getBitrate', 'setFdev', 'setRxBW', 'setAfcBW',
+    'enableAFC', 'setFixedLen', 'setDcFree', 'setPllBW', 'rxCalibrate',
+    'airtime', 'send', 'receive', 'getPktRSSI', 'getRSSI', 'getSNR',
+    'getFEI', 'getAFC', 'getRxGain', 'getIrqFlags', 'getRejected',
+    'readReg', 'writeReg', 'readRegs', 'writeRegs', 'getPreamble')
+
+
+def encode(value, out):
+    """append encoded value (None, bool, int32, float, bytes, str, list,
+       tuple, dict) to bytearray `out`; return `out`"""
+    if value is None:
+        out.append(0x4E) # 'N'
+    elif value is True or value is False:
+        out.append(0x54 if value else 0x46) # 'T'/'F'
+    elif isinstance(value, int):
+        out.append(0x69) # 'i'
+        out.extend(struct.pack('<i', value))
+    elif isinstance(value, float):
+        out.append(0x64) # 'd'
+        out.extend(struct.pack('<d', value))
+    elif isinstance(value, str):
+        value = value.encode()
+        out.append(0x73) # 's'
+        out.extend(struct.pack('<H', len(value)))
+        out.extend(value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out.append(0x62) # 'b'
+        out.extend(struct.pack('<H', len(value)))
+        out.extend(value)
+    elif isinstance(value, (list, tuple)):
+        out.append(0x6C) # 'l'
+        out.extend(struct.pack('<H', len(value)))
+        for item in value:
+            encode(item, out)
+    elif isinstance(value, dict):
+        out.append(0x6D) # 'm'
+        out.extend(struct.pack('<H', len(value)))
+        for key in value:
+            encode(key, out)
+            encode(value[key], out)
+    else:
+        raise ValueError('Can not encode %s' % type(value))
+    return out
+
+
+def decode(buf, i=0):
+    """decode value from `buf` at `i`; return (value, next index)"""
+    tag = buf[i]
+    i += 1
+    if tag == 0x4E: return None, i
+    if tag == 0x54: return True, i
+    if tag == 0x46: return False, i
+    if tag == 0x69: return struct.unpack_from('<i', buf, i)[0], i + 4
+    if tag == 0x64: return struct.unpack_from('<d', buf, i)[0], i + 8
+    n = buf[i] | (buf[i + 1] << 8)
+    i += 2
+    if tag == 0x62: return bytes(buf[i:i + n]), i + n
+    if tag == 0x73: return bytes(buf[i:i + n]).decode(), i + n
+    if tag == 0x6C:
+        items = []
+        for k in range(n):
+            item, i = decode(buf, i)
+            items.append(item)
+        return items, i
+    if tag == 0x6D:
+        items = {}
+        for k in range(n):
+            key, i = decode(buf, i)
+            items[key], i = decode(buf, i)
+        return items, i
+    raise ValueError('Bad tag 0x%02X' % tag)
+
+
+def frame(type, seq, body):
+    """make frame of type ('Q', 'R', 'E'), seq and encoded body"""
+    out = bytearray(RPC_MAGIC)
+    out.append(ord(type))
+    out.append(seq & 0xFF)
+    out.extend(struct.pack('<H', len(body)))
+    out.extend(body)
+    out.append(sum(memoryview(out)[2:]) & 0xFF)
+    return out
+
+
+def parse(buf):
+    """find frames in `buf`; return (list of (type, seq, body), used bytes)
+       (garbage before frames is skipped; body is None if header has length
+       more than MAX_BODY)"""
+    frames = []
+    i, size = 0, len(buf)
+    while True:
+        j = i
+        while j < size - 1 and (buf[j] != 0xA5 or buf[j + 1] != 0x5B):
+            j += 1
+        if j >= size - 1:
+            return frames, j if size and buf[-1] == 0xA5 else size
+        if size - j < 7:
+            return frames, j # wait rest of header
+        n = buf[j + 4] | (buf[j + 5] << 8)
+        if n > MAX_BODY:
+            frames.append((chr(buf[j + 2]), buf[j + 3], None))
+            i = j + 1
+            continue
+        if size - j < n + 7:
+            return frames, j # wait rest of frame
+        if sum(memoryview(buf)[j + 2:j + n + 6]) & 0xFF != buf[j + n + 6]:
+            i = j + 1 # false magic
+            continue
+        frames.append((chr(buf[j + 2]), buf[j + 3], bytes(buf[j + 6:j + n + 6])))
+        i = j + n + 7
+
+
+def _list(items):
+    # body of encoded list of encoded `items`
+    out = bytearray()
+    out.append(0x6C) # 'l'
+    out.extend(struct.pack('<H', len(items)))
+    for item in items:
+        out.extend(item)
+    return out
+
+
+class RPCError(Exception):
+    pass
+
+
+class Server:
+    def __init__(self, radio,
+                 uart,               # UART id or object with read()/write()
+                 baudrate = 115200,  # baudrate if `uart` is id
+                 events   = 16):     # maximum queued RX events
+        if isinstance(uart, int):
+            from machine import UART
+            uart = UART(uart, baudrate=baudrate, timeout=0)
+        self.radio = radio
+        self.uart = uart
+        self._buf = b''
+        self._events = []
+        self.max_events = events
+        self._stream = False # send RX events
+        self.counters = {'requests': 0, # request frames
+                         'calls':    0, # executed calls
+                         'errors':   0, # calls raised exception
+                         'events':   0, # RX events sent
+                         'dropped':  0} # RX events dropped (queue full)
+        radio.onReceive(self._handleOnReceive)
+
+
+    def _handleOnReceive(self, radio, payload, crcOk):
+        # queue RX event (called from DIO0 IRQ), sent by poll()
+        if not self._stream:
+            return
+        if len(self._events) >= self.max_events:
+            self.counters['dropped'] += 1
+            return
+        self._events.append((radio.getRxTicks(), radio.getPktRSSI(),
+                             radio.getSNR(), crcOk, payload))
+
+
+    # server methods (look SERVER_METHODS)
+    def hello(self):
+        """get (protocol version, number of methods)"""
+        return RPC_VERSION, len(METHODS)
+
+    def stats(self):
+        """get counters of server"""
+        return self.counters
+
+    def snapshot(self):
+        """get all registers 0x01...0x7F"""
+        return self.radio.readRegs(0x01, 0x7F)
+
+    def stream(self, on=True):
+        """on/off sending RX events"""
+        self._stream = on
+        if not on:
+            self._events = []
+
+
+    def _call(self, calls):
+        # execute calls of request; return list of encoded results
+        radio, counters = self.radio, self.counters
+        items = []
+        for method, args in calls:
+            counters['calls'] += 1
+            try:
+                name = METHODS[method]
+                obj = self if method < len(SERVER_METHODS) else radio
+                value = getattr(obj, name)(*args)
+                status = 0
+            except Exception as e:
+                counters['errors'] += 1
+                value, status = '%s: %s' % (type(e).__name__, e), 1
+            item = encode((status, value), bytearray())
+            if len(item) > MAX_BODY - 3: # does not fit in frame
+                counters['errors'] += 1
+                item = encode((1, 'Response too large (%d bytes)' % len(item)),
+                              bytearray())
+            items.append(item)
+        return items
+
+
+    def _respond(self, seq, items):
+        # send encoded results by frames of MAX_BODY ('P'... 'R')
+        k, size = 0, 3
+        for i in range(len(items)):
+            if size + len(items[i]) > MAX_BODY:
+                self.uart.write(frame('P', seq, _list(items[k:i])))
+                k, size = i, 3
+            size += len(items[i])
+        self.uart.write(frame('R', seq, _list(items[k:])))
+
+
+    def poll(self):
+        """read requests, execute them, send responses and RX events; call
+           it often; return number of requests"""
+        data = self.uart.read(256)
+        if data:
+            self._buf += data
+        frames, used = parse(self._buf)
+        if used:
+            self._buf = self._buf[used:]
+        n = 0
+        for type, seq, body in frames:
+            if type != 'Q' or body is None:
+                continue
+            self.counters['requests'] += 1
+            try:
+                items = self._call(decode(body)[0])
+            except Exception as e: # bad request
+                items = [encode((1, 'Bad request: %s' % e), bytearray())]
+            self._respond(seq, items)
+            n += 1
+        while self._events:
+            self.uart.write(frame('E', 0, encode(self._events.pop(0), bytearray())))
+            self.counters['events'] += 1
+        return n
+
+
+class Batch:
+    """calls collected and sent as one request (look Client.batch())"""
+    def __init__(self, client):
+        self._client = client
+        self._calls = []
+        self.seq = None
+        self.results = None
+
+    def __getattr__(self, name):
+        if name not in METHODS:
+            raise AttributeError(name)
+        method = METHODS.index(name)
+        def call(*args):
+            self._calls.append((method, args))
+        return call
+
+    def send(self):
+        """send request without waiting response (pipeline); return seq"""
+        self.seq = self._client.request(self._calls)
+        return self.seq
+
+    def wait(self, timeout=None):
+        """wait response; return results (raise RPCError on first error)"""
+        if self.seq is None:
+            self.send()
+        self.results = self._client.response(self.seq, timeout)
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.wait()
+
+
+class Client:
+    """host side (CPython): methods of `RADIO` and server by RPC"""
+    def __init__(self, port, baudrate=115200, timeout=2.):
+        import os
+        if isinstance(port, int): # file descriptor
+            self._fd = port
+        else:
+            self._fd = os.open(port, os.O_RDWR | os.O_NOCTTY)
+            self._raw(baudrate)
+        self.timeout = timeout
+        self._seq = 0
+        self._buf = bytearray()
+        self._responses = {}
+        self._parts = {} # results of 'P' frames by seq
+        self._events = []
+        self.onReceive = None # callback(client, payload, crcOk, meta) on event
+
+
+    def _raw(self, baudrate):
+        # raw mode of serial port
+        import termios, tty
+        tty.setraw(self._fd)
+        attr = termios.tcgetattr(self._fd)
+        speed = getattr(termios, 'B%d' % baudrate)
+        attr[4] = attr[5] = speed
+        termios.tcsetattr(self._fd, termios.TCSANOW, attr)
+
+
+    def close(self):
+        import os
+        os.close(self._fd)
+
+
+    def request(self, calls):
+        """send request of calls [(method index, args)]; return seq"""
+        import os
+        self._seq = (self._seq % 255) + 1 # 0 - events
+        body = encode([(method, list(args)) for method, args in calls],
+                      bytearray())
+        if len(body) > MAX_BODY:
+            raise RPCError('Request too long (%d bytes)' % len(body))
+        os.write(self._fd, frame('Q', self._seq, body))
+        return self._seq
+
+
+    def _read(self, timeout):
+        # read frames (one read) to responses/events; return False on timeout
+        import os, select
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return False
+        self._buf.extend(os.read(self._fd, 4096))
+        frames, used = parse(self._buf)
+        del self._buf[:used]
+        for type, seq, body in frames:
+            if type == 'R' or type == 'P':
+                results = self._parts.pop(seq, [])
+                if body is None or results is None:
+                    results = None # too large (longer than MAX_BODY)
+                else:
+                    results += decode(body)[0]
+                if type == 'R':
+                    self._responses[seq] = results
+                else:
+                    self._parts[seq] = results
+            elif type == 'E' and body is not None:
+                value = decode(body)[0]
+                if self.onReceive:
+                    ticks, rssi, snr, crcOk, payload = value
+                    self.onReceive(self, payload, crcOk,
+                                   {'ticks': ticks, 'rssi': rssi, 'snr': snr})
+                else:
+                    self._events.append(tuple(value))
+        return True
+
+
+    def response(self, seq, timeout=None):
+        """wait response of request; return results of calls"""
+        import time
+        timeout = self.timeout if timeout is None else timeout
+        end = time.time() + timeout
+        while seq not in self._responses:
+            left = end - time.time()
+            if left <= 0 or not self._read(left):
+                raise RPCError('Timeout of request %d' % seq)
+        values = self._responses.pop(seq)
+        if values is None:
+            raise RPCError('Response of request %d too large (more than %d '
+                           'bytes)' % (seq, MAX_BODY))
+        results = []
+        for status, value in values:
+            if status:
+                raise RPCError(value)
+            results.append(value)
+        return results
+
+
+    def batch(self):
+        """get batch of calls (one round trip)"""
+        return Batch(self)
+
+
+    def events(self, timeout=0.):
+        """get received RX events [(ticks, rssi, snr, crcOk, payload)]"""
+        import time
+        end = time.time() + timeout
+        while not self._events:
+            left = end - time.time()
+            if left <= 0 or not self._read(left):
+                break
+        while self._read(0): # rest of input
+            pass
+        events, self._events = self._events, []
+        return events
+
+
+    def __getattr__(self, name):
+        if name not in METHODS:
+            raise AttributeError(name)
+        method = METHODS.index(name)
+        def call(*args):
+            return self.response(self.request([(method, args)]))[0]
+        return call
+
+
+class FdStream:
+    """stream of file descriptor (not blocking read) for host Server"""
+    def __init__(self, fd):
+        self.fd = fd
+
+    def read(self, n):
+        import os, select
+        if select.select([self.fd], [], [], 0)[0]:
+            return os.read(self.fd, n)
+        return None
+
+    def write(self, buf):
+        import os
+        return os.write(self.fd, bytes(buf))
+
+
+def fake(gpio={'led': 2, 'reset': None, 'dio0': 4, 'cs': 15,
+               'sck': 14, 'mosi': 13, 'miso': 12}):
+    """run server with fake SPI/Pin on pty pair (CPython); return
+       (server, client port name)"""
+    import os, tty, fakehw
+    fakehw.install()
+    board = fakehw.Board()
+    import sx127x
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    radio = sx127x.RADIO(gpio=gpio)
+    server = Server(radio, FdStream(master))
+    server.board = board # inject packets by `server.board.chip.inject()`
+    return server, os.ttyname(slave)
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'fake':
+        import time
+        server, name = fake()
+        print("fake SX127x on %s" % name)
+        while True:
+            if not server.poll():
+                time.sleep(0.001)
+    elif len(sys.argv) > 1:
+        c = Client(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 115200)
+        with c.batch() as b:
+            b.hello(); b.version(); b.getFrequency(); b.getModulation()
+            b.getSF(); b.getBW(); b.getPower(); b.stats()
+        print(b.results)
+    else:
+        print("usage: python3 rpc.py fake | PORT [BAUDRATE]")
+        sys.exit(1)
+
+
+#*** end of "rpc.py" module ***#
@@ -0,0 +1,130 @@
+# -*- coding: UTF8 -*-
+# Fast RSSI spectrum sweep (band scanner) on top of "sx127x" driver
+# Licenced by GPLv3
+#
+# Chip works in FSK RX mode with `FastHopOn`: new frequency is applied
+# by one burst write of precomputed FRF code (MSB/MID/LSB) without
+# FS mode. Resolution is set by RX channel filter BW (look `setRxBW()`).
+# RSSI samples of bin are read one RSSI update period apart.
+
+from array import array
+import sx127x
+from sx127x import ticks_us, ticks_diff, FSTEP, RX_BW_TABLE, getRxBw, \
+                   REG_FRF_MSB, REG_RSSI_VALUE, REG_RSSI_CONFIG, \
+                   MODE_RX_CONTINUOUS
+
+RSSI_SMOOTHING = 0 # `RssiSmoothing`: 0 -> 2 samples (fastest) ... 7 -> 256 samples
+
+
+class Scanner:
+    def __init__(self, radio,
+                 start_kHz = 433050, # first bin center [kHz]
+                 stop_kHz  = 434790, # last bin center [kHz]
+                 step_kHz  = None,   # bin step [kHz] (None -> RX BW)
+                 rx_bw     = 10.4,   # RX BW 2.6...250 kHz (resolution)
+                 samples   = 8,      # RSSI samples per bin
+                 settle_us = None):  # PLL/RSSI settle time after hop [us]
+        self.radio = radio
+        m, e = getRxBw(rx_bw)
+        for mm, ee, bw in RX_BW_TABLE:
+            if mm == m and ee == e:
+                self.rx_bw = bw # real RX BW [kHz]
+                break
+        if step_kHz is None:
+            step_kHz = self.rx_bw
+        self.start = start_kHz
+        self.step  = step_kHz
+        self.bins  = max(int((stop_kHz - start_kHz) / step_kHz) + 1, 1)
+        self.samples = samples
+        # RSSI update period: 2^(RssiSmoothing+1) samples of 1/(4*RxBw) [us]
+        self.period = int((2 << RSSI_SMOOTHING) * 1000 / (4 * self.rx_bw)) + 1
+        if settle_us is None: # PLL lock + two RSSI sample periods
+            settle_us = 50 + 2 * self.period
+        self.settle = settle_us
+
+        # precomputed FRF codes
+        self._frf = []
+        for i in range(self.bins):
+            code = int(round((start_kHz + i * step_kHz) * 1000 / FSTEP))
+            self._frf.append(bytes(((code >> 16) & 0xFF,
+                                    (code >>  8) & 0xFF,
+                                     code        & 0xFF)))
+
+        # preallocated buffers [dBm]
+        self._rssi = array('b', bytes(samples)) # samples of one bin
+        self.max   = array('b', bytes(self.bins))
+        self.avg   = array('b', bytes(self.bins))
+        self.elapsed = 0 # duration of last sweep [us]
+        self._mode = None
+
+
+    def begin(self):
+        """switch radio to FSK RX with fast hopping (LoRa/OOK mode is saved)"""
+        radio = self.radio
+        self._mode = radio.getModulation()
+        if self._mode != sx127x.FSK:
+            radio.init(mode=sx127x.FSK)
+        radio.setFrequency(self.start) # select LF/HF band
+        radio.setRxBW(self.rx_bw)
+        radio.enableAFC(False)
+        radio.writeReg(REG_RSSI_CONFIG,
+                       (radio.readReg(REG_RSSI_CONFIG) & ~0x07) | RSSI_SMOOTHING)
+        radio.setFastHop(True)
+        radio.setMode(MODE_RX_CONTINUOUS)
+
+
+    def end(self):
+        """restore radio mode (configuration by `pars` of radio)"""
+        radio = self.radio
+        radio.setFastHop(False)
+        radio.standby()
+        radio.init(mode=self._mode)
+        self._mode = None
+
+
+    def sweep(self):
+        """sweep band once; results in `max` and `avg` arrays [dBm]"""
+        if self._mode is None:
+            self.begin()
+        radio = self.radio
+        frf, rssi = self._frf, self._rssi
+        n, settle, period = self.samples, self.settle, self.period
+        t0 = ticks_us()
+        for i in range(self.bins):
+            radio.writeRegs(REG_FRF_MSB, frf[i]) # hop (applied on LSB write)
+            t = ticks_us()
+            while ticks_diff(ticks_us(), t) < settle:
+                pass
+            for j in range(n):
+                if j: # wait next RSSI update
+                    while ticks_diff(ticks_us(), t) < period:
+                        pass
+                t = ticks_us()
+                rssi[j] = -(radio.readReg(REG_RSSI_VALUE) >> 1) # -0.5 dB steps
+            top = total = rssi[0]
+            for j in range(1, n):
+                v = rssi[j]
+                total += v
+                if v > top: top = v
+            self.max[i] = top
+            self.avg[i] = (2 * total + n) // (2 * n) # rounded
+        self.elapsed = ticks_diff(ticks_us(), t0)
+        return self.max, self.avg
+
+
+    def rate(self):
+        """get sweep rate of last sweep [bins/s]"""
+        return self.bins * 1e6 / self.elapsed if self.elapsed else 0.
+
+
+    def report(self):
+        """print max/avg RSSI per bin and sweep rate"""
+        for i in range(self.bins):
+            print("%10.3f kHz  max=%4d  avg=%4d dBm  %s" % (
+                  self.start + i * self.step, self.max[i], self.avg[i],
+                  '#' * max((self.max[i] + 130) // 4, 0)))
+        print("bins=%d  RX BW=%.1f kHz  sweep=%d ms  rate=%.0f bins/s" % (
+              self.bins, self.rx_bw, self.elapsed // 1000, self.rate()))
+
+
+#*** end of "scanner.py" module ***#
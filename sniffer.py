@@ -0,0 +1,270 @@
+# -*- coding: UTF8 -*-
+# Binary packet sniffer output over UART for "sx127x" driver and host
+# decoder to pcap (LoRaTap) or CSV
+# Licenced by GPLv3
+#
+# Receive callback packs every packet to compact binary frame in
+# preallocated output ring (no text formatting in receive path); poll()
+# from main loop drains ring to UART by non-blocking writes. If ring is
+# full frame is dropped (counted), receive is never stalled by UART.
+#
+# Frame format (little endian, 21 bytes + payload):
+#   magic   2  0xA5 0x5A
+#   version 1  FRAME_VERSION
+#   length  1  payload size N
+#   ticks   4  `ticks_us()` of DIO0 edge (wraps at 2^30)
+#   rssi    2  packet RSSI [0.25 dBm] (signed)
+#   snr     1  SNR [0.25 dB] (signed, LoRa)
+#   flags   1  bit 0 - CRC checked, bit 1 - CRC ok, bits 3-2 - modem
+#              (0 - LoRa, 1 - FSK, 2 - OOK)
+#   freq    4  RF frequency [Hz]
+#   sf      1  SF (0 - FSK/OOK)
+#   bw      2  BW [0.1 kHz] (0 - FSK/OOK)
+#   cr      1  CR denominator (0 - FSK/OOK)
+#   payload N
+#   sum     1  sum of bytes from `version` to end of payload (mod 256)
+#
+# Device (UART1 TX or UART0 detached from REPL by `os.dupterm(None, 1)`):
+#   snf = sniffer.Sniffer(tr, 1, baudrate=921600)
+#   tr.receive(0)
+#   while True: snf.poll()
+#
+# Host (CPython, serial port by "pyserial" or capture file):
+#   $ python3 sniffer.py pcap /dev/ttyUSB0 out.pcap 921600
+#   $ python3 sniffer.py csv capture.bin out.csv
+
+import struct
+
+FRAME_MAGIC   = b'\xA5\x5A'
+FRAME_VERSION = 1
+FRAME_HEADER  = '<BBIhbBIBHB' # after magic: version ... cr
+HEADER_SIZE   = 2 + struct.calcsize(FRAME_HEADER) # 20 bytes
+MAX_FRAME     = HEADER_SIZE + 255 + 1
+
+LINKTYPE_LORATAP = 270 # pcap link type of LoRaTap header
+TICKS_PERIOD = 1 << 30 # `ticks_us()` period of MicroPython
+
+
+class Sniffer:
+    def __init__(self, radio,
+                 uart,             # UART object (with write()) or UART id
+                 baudrate  = 115200, # baudrate if `uart` is id
+                 size      = 4096,   # output ring size [bytes]
+                 chunk     = 128,    # maximum UART write by poll() [bytes]
+                 onReceive = None):  # chained receive callback
+        if isinstance(uart, int):
+            from machine import UART
+            uart = UART(uart, baudrate=baudrate)
+        self.radio = radio
+        self.uart = uart
+        self._ring = bytearray(size)
+        self._mv = memoryview(self._ring)
+        self._head = 0 # write position (receive callback)
+        self._tail = 0 # read position (poll())
+        self._frame = bytearray(MAX_FRAME)
+        self._frame[0:2] = FRAME_MAGIC
+        self._fmv = memoryview(self._frame)
+        self.chunk = chunk
+        self._onReceive = onReceive
+        self.frames  = 0 # frames put to ring
+        self.dropped = 0 # frames dropped by ring overflow
+        self.bytes   = 0 # bytes written to UART
+        radio.onReceive(self._handleOnReceive)
+
+
+    def free(self):
+        """get free space of ring [bytes]"""
+        return (self._tail - self._head - 1) % len(self._ring)
+
+
+    def pending(self):
+        """get number of bytes not written to UART"""
+        return (self._head - self._tail) % len(self._ring)
+
+
+    def _handleOnReceive(self, radio, payload, crcOk):
+        # pack frame and put it to ring (called from DIO0 IRQ)
+        n = min(len(payload), 255)
+        size = HEADER_SIZE + n + 1
+        if size > self.free():
+            self.dropped += 1
+        else:
+            frame = self._frame
+            modem = radio.getModulation()
+            lora = modem == 0
+            flags = (modem << 2) | (0 if crcOk is None else
+                                    1 | (2 if crcOk else 0))
+            struct.pack_into(FRAME_HEADER, frame, 2, FRAME_VERSION, n,
+                             radio.getRxTicks(),
+                             int(radio.getPktRSSI() * 4),
+                             int(radio.getSNR() * 4), flags,
+                             radio.getFrequency(),
+                             radio.getSF() if lora else 0,
+                             int(radio.getBW() * 10) if lora else 0,
+                             radio.getCR() if lora else 0)
+            frame[HEADER_SIZE:HEADER_SIZE + n] = payload[:n]
+            frame[HEADER_SIZE + n] = sum(self._fmv[2:HEADER_SIZE + n]) & 0xFF
+            self._put(size)
+            self.frames += 1
+        if self._onReceive:
+            self._onReceive(radio, payload, crcOk)
+
+
+    def _put(self, size):
+        # copy frame to ring (by two slices on wrap)
+        ring, head = self._ring, self._head
+        k = min(size, len(ring) - head)
+        ring[head:head + k] = self._fmv[:k]
+        if k < size:
+            ring[0:size - k] = self._fmv[k:size]
+        self._head = (head + size) % len(ring) # publish frame
+
+
+    def poll(self):
+        """write pending bytes to UART (not blocking); return written bytes"""
+        head, tail = self._head, self._tail
+        if head == tail:
+            return 0
+        end = min(head if head > tail else len(self._ring), tail + self.chunk)
+        n = self.uart.write(self._mv[tail:end]) or 0
+        self._tail = (tail + n) % len(self._ring)
+        self.bytes += n
+        return n
+
+
+    def flush(self):
+        """write all pending bytes to UART"""
+        while self.pending():
+            self.poll()
+
+
+def decode(buf):
+    """decode frames from start of `buf`; return (frames, used bytes);
+       frame is dict (`ticks`, `rssi`, `snr`, `crc`, `freq`, `sf`, `bw`,
+       `cr`, `modem`, `payload`), garbage before magic is skipped"""
+    frames = []
+    i = 0
+    while True:
+        j = buf.find(FRAME_MAGIC, i)
+        if j < 0:
+            return frames, max(i, len(buf) - 1, 0) # keep possible 0xA5
+        if len(buf) - j < HEADER_SIZE + 1:
+            return frames, j # wait rest of frame
+        version, n, ticks, rssi, snr, flags, freq, sf, bw, cr = \
+            struct.unpack_from(FRAME_HEADER, buf, j + 2)
+        if version != FRAME_VERSION:
+            i = j + 1
+            continue
+        end = j + HEADER_SIZE + n
+        if len(buf) <= end:
+            return frames, j
+        if sum(buf[j + 2:end]) & 0xFF != buf[end]: # false magic
+            i = j + 1
+            continue
+        frames.append({'ticks': ticks, 'rssi': rssi / 4., 'snr': snr / 4.,
+                       'crc': (flags & 2 == 2) if flags & 1 else None,
+                       'modem': (flags >> 2) & 3, 'freq': freq, 'sf': sf,
+                       'bw': bw / 10., 'cr': cr,
+                       'payload': bytes(buf[j + HEADER_SIZE:end])})
+        i = end + 1
+
+
+class Clock:
+    """unwrap device ticks to host time [us] (time of first frame)"""
+    def __init__(self, start_us):
+        self.start = start_us
+        self.ticks = None
+        self.us = 0
+
+    def __call__(self, ticks):
+        if self.ticks is not None:
+            self.us += (ticks - self.ticks) % TICKS_PERIOD
+        self.ticks = ticks
+        return self.start + self.us
+
+
+def loraTap(frame, sw=0x12):
+    """get LoRaTap v0 header (15 bytes) of decoded frame"""
+    bw = frame['bw']
+    return struct.pack('>BBHIBBBBBbB', 0, 0, 15, frame['freq'],
+                       int(round(bw / 125.)) if bw else 0, frame['sf'],
+                       min(max(int(round(frame['rssi'])) + 139, 0), 255),
+                       0, 0, min(max(int(frame['snr'] * 4), -128), 127), sw)
+
+
+class PcapWriter:
+    """pcap file of LoRaTap packets"""
+    def __init__(self, f, sw=0x12):
+        self.f = f
+        self.sw = sw
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535,
+                            LINKTYPE_LORATAP))
+
+    def write(self, frame, us):
+        data = loraTap(frame, self.sw) + frame['payload']
+        self.f.write(struct.pack('<IIII', us // 1000000, us % 1000000,
+                                 len(data), len(data)) + data)
+
+
+class CsvWriter:
+    """CSV file of packets"""
+    def __init__(self, f):
+        self.f = f
+        f.write(b'time_us,freq_hz,sf,bw_khz,cr,rssi,snr,crc,size,payload\n')
+
+    def write(self, frame, us):
+        crc = frame['crc']
+        self.f.write(('%d,%d,%d,%g,%d,%g,%g,%s,%d,%s\n' % (
+            us, frame['freq'], frame['sf'], frame['bw'], frame['cr'],
+            frame['rssi'], frame['snr'], '' if crc is None else int(crc),
+            len(frame['payload']), frame['payload'].hex())).encode())
+
+
+def convert(fmt, src, dst, baudrate=115200):
+    """decode frames from `src` (serial port or file) to `dst` file in
+       `fmt` format ("pcap" or "csv"); stop by EOF or Ctrl+C"""
+    import time
+    if src.startswith('/dev/') or src.startswith('COM'):
+        import serial # pyserial
+        inp = serial.Serial(src, baudrate, timeout=0.1)
+    else:
+        inp = open(src, 'rb')
+    out = open(dst, 'wb')
+    writer = PcapWriter(out) if fmt == 'pcap' else CsvWriter(out)
+    clock = None
+    buf = bytearray()
+    count = 0
+    try:
+        while True:
+            data = inp.read(4096)
+            if not data:
+                if not hasattr(inp, 'in_waiting'): # EOF of file
+                    break
+                continue
+            buf += data
+            frames, used = decode(buf)
+            del buf[:used]
+            for frame in frames:
+                if clock is None:
+                    clock = Clock(int(time.time() * 1e6))
+                writer.write(frame, clock(frame['ticks']))
+                count += 1
+            out.flush()
+    except KeyboardInterrupt:
+        pass
+    out.close()
+    inp.close()
+    return count
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 4 or sys.argv[1] not in ('pcap', 'csv'):
+        print("usage: python3 sniffer.py pcap|csv INPUT OUTPUT [BAUDRATE]")
+        sys.exit(1)
+    n = convert(sys.argv[1], sys.argv[2], sys.argv[3],
+                int(sys.argv[4]) if len(sys.argv) > 4 else 115200)
+    print("%d frames" % n)
+
+
+#*** end of "sniffer.py" module ***#
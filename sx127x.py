@@ -4,19 +4,79 @@
 # Licenced by GPLv3
 
 from machine import Pin, SPI
-from time import sleep_ms
+
+try:
+    from time import sleep_ms, sleep_us, ticks_ms, ticks_us, ticks_diff, ticks_add
+    MICROPYTHON = True
+except ImportError: # CPython (with fake `machine` module, look "fakehw.py")
+    from time import sleep, perf_counter
+    MICROPYTHON = False
+    TICKS_MAX    = (1 << 30) - 1 # same period of ticks as in MicroPython
+    TICKS_PERIOD =  1 << 30
+
+    def sleep_ms(ms): sleep(ms / 1000.)
+    def sleep_us(us): sleep(us / 1000000.)
+    def ticks_ms():   return int(perf_counter() * 1000.) & TICKS_MAX
+    def ticks_us():   return int(perf_counter() * 1000000.) & TICKS_MAX
+    def ticks_add(ticks, delta): return (ticks + delta) & TICKS_MAX
+
+    def ticks_diff(ticks1, ticks2):
+        diff = (ticks1 - ticks2) & TICKS_MAX
+        return diff - TICKS_PERIOD if diff >= TICKS_PERIOD // 2 else diff
 
 import gc
+import sys
+
+# pure Python versions of hot paths (look "sx127x_native.py")
+def putBE_py(buf, value, size):
+    """put `value` to `buf` as `size` bytes big endian; return buf"""
+    for i in range(size - 1, -1, -1):
+        buf[i] = value & 0xFF
+        value >>= 8
+    return buf
+
+def xfer_py(write_readinto, cs, buf, address, value):
+    """one register SPI transaction by 2 bytes buffer; return read value"""
+    buf[0] = address
+    buf[1] = value
+    cs(0)
+    write_readinto(buf, buf)
+    value = buf[1]
+    cs(1)
+    return value
+
+def waitFlags_py(read, reg, mask, timeout_us):
+    """poll register until any of `mask` bits set; return False on timeout"""
+    t = ticks_us()
+    while not (read(reg) & mask):
+        if timeout_us >= 0 and ticks_diff(ticks_us(), t) >= timeout_us:
+            return False
+    return True
+
+try: # native/viper versions if port has native code emitter
+    from sx127x_native import putBE, xfer, waitFlags
+    NATIVE = True
+except (ImportError, SyntaxError): # CPython or no emitter (or no file)
+    putBE, xfer, waitFlags = putBE_py, xfer_py, waitFlags_py
+    NATIVE = False
+
 gc.collect()
 
-# ATTENTION PLEASE: select ESP8266 or ESP32
-#ESP32 = True
-ESP32 = False
+# MicroPython port: "esp8266", "esp32", "rp2", "pyboard", "linux"...
+PORT  = sys.platform
+ESP32 = PORT == 'esp32'
+
+# debug print in DIO0 handler (slow: text output may stall next RX)
+DEBUG = False
 
 # onboard LED active level
 LED_ON = 1 if ESP32 else 0
 
-MICROPYTHON = True
+# SPI clock [Hz]
+SPI_MAX_BAUDRATE = 10000000 # SX127x limit
+SPI_BAUDRATES = (10000000, 8000000, 6000000, 5000000, 4000000, 2000000,
+                 1000000, 500000) # steps of autotune (look spiAutotune())
+SPI_PATTERN = b'\x55\xAA\x00\xFF\x0F\xF0\x5A\xA5' # autotune test bytes
 
 # Common registers
 REG_FIFO      = 0x00 # FIFO read/write access
@@ -113,11 +173,13 @@ REG_FIFO_RX_BYTE_ADDR    = 0x25 # Address of last byte written in FIFO
 REG_IRQ_FLAGS_MASK = 0x11 # Optional IRQ flag mask
 REG_IRQ_FLAGS      = 0x12 # IRQ flags
 REG_RX_NB_BYTES    = 0x13 # Number of received bytes
+REG_MODEM_STAT     = 0x18 # Live LoRa modem status
 REG_PKT_SNR_VALUE  = 0x19 # SNR of last packet
 REG_PKT_RSSI_VALUE = 0x1A # RSSI of last packet
 REG_LR_RSSI_VALUE  = 0x1B # Current RSSI
 REG_MODEM_CONFIG_1 = 0x1D # Modem PHY config 1
 REG_MODEM_CONFIG_2 = 0x1E # Modem PHY config 2
+REG_SYMB_TIMEOUT   = 0x1F # RX single timeout [symbols] (LSB)
 REG_PREAMBLE_MSB   = 0x20 # Size of preamble (MSB)
 REG_PREAMBLE_LSB   = 0x21 # Size of preamble (LSB)
 REG_PAYLOAD_LENGTH = 0x22 # LoRa TM payload length
@@ -129,6 +191,10 @@ REG_INVERT_IQ           = 0x33 # Invert LoRa I and Q signals
 REG_DETECTION_THRESHOLD = 0x37 # LoRa detection threshold for SF=6
 REG_SYNC_WORD           = 0x39 # LoRa Sync Word
 
+REG_LR_FEI_MSB = 0x28 # Estimated frequency error, bits 19-16 (LoRa)
+REG_LR_FEI_MID = 0x29 # Estimated frequency error, bits 15-8 (LoRa)
+REG_LR_FEI_LSB = 0x2A # Estimated frequency error, bits 7-0 (LoRa)
+
 # Modes, REG_OP_MODE register (look `RegOpMode` in datasheeet)
 # bits 2-0
 MODE_SLEEP         = 0b000 # (0) Sleep
@@ -162,10 +228,18 @@ PA_SELECT = 0x80 # bit 7: `PaSelect`
 IRQ_TX_DONE           = 0x08 # `TxDone`
 IRQ_RX_DONE           = 0x40 # `RxDone`
 IRQ_PAYLOAD_CRC_ERROR = 0x20 # `PayloadCrcError`
+IRQ_RX_TIMEOUT        = 0x80 # `RxTimeout`
+IRQ_CAD_DONE          = 0x04 # `CadDone`
+IRQ_CAD_DETECTED      = 0x01 # `CadDetected`
 
 # REG_IRQn_FLAGS (`RegIrqFlagsN` in datasheet) bits (FSK/OOK)
 IRQ1_RX_READY    = 0x40 # bit 6: `RxReady`
 IRQ1_TX_READY    = 0x20 # bit 5: `TxReady`
+IRQ1_PREAMBLE_DETECT    = 0x02 # bit 1: `PreambleDetect`
+IRQ1_SYNC_ADDRESS_MATCH = 0x01 # bit 0: `SyncAddressMatch`
+
+# REG_MODEM_STAT bits (LoRa)
+STAT_RX_BUSY = 0x0F # `HeaderInfoValid`, `RxOnGoing`, `SignalSynchronized`, `SignalDetected`
 
 IRQ2_FIFO_FULL     = 0x80 # bit 7: `FifoFull`
 IRQ2_FIFO_EMPTY    = 0x40 # bit 6: `FifoEmpty`
@@ -186,10 +260,31 @@ IRQ_RX_DONE_MASK = 0x40 # bit 6: `RxDoneMask`
 FIFO_TX_BASE_ADDR = 0x00 # 0x80 FIXME
 FIFO_RX_BASE_ADDR = 0x00 
 
+# REG_PACKET_CONFIG_1 bits 2-1 `AddressFiltering` (FSK/OOK)
+ADDR_FILTER_OFF       = 0b00 # none
+ADDR_FILTER_NODE      = 0b01 # must match `NodeAddress`
+ADDR_FILTER_BROADCAST = 0b10 # must match `NodeAddress` or `BroadcastAddress`
+
+# Sync Word (FSK/OOK)
+FSK_SYNC_WORD = b'\x69\x81\x7E\x96' # 1...8 bytes
+
 # Constants
 FXOSC = 32e6          # 32 MHz
 FSTEP = FXOSC / 2**19 # 61.03515625 Hz
 MAX_PKT_LENGTH = 255  # maximum packet length [bytes]
+FSK_FIFO_SIZE  = 64   # FIFO size [bytes] (FSK/OOK)
+
+# Deadlines of wait loops [us] (look recover())
+TX_TIMEOUT_MARGIN = 20000 # TX deadline is 2 * airtime + margin
+CAL_TIMEOUT       = 50000 # image calibration (about 10 ms)
+
+# driver attributes cached from config registers: saved with registers by
+# saveConfig() and restored by recover()
+CONFIG_ATTRS = ('_mode', '_freq', '_sf', '_ldro', '_bw', '_cr', '_crc',
+                '_implicitHeaderMode', '_preamble', '_bitrate', '_fixedLen',
+                '_syncSize', '_nodeAddr', '_broadcastAddr', '_addrFilter',
+                '_pa', '_dac', '_ocp', '_paCodes', '_profile', '_profileLen',
+                '_base')
 
 # RADIO class mode
 LORA = 0
@@ -226,6 +321,38 @@ RX_BW_TABLE = (
   (0b00, 1, 250.0))
 
 
+def ocpCode(trim_mA=100., on=True):
+    """get `RegOcp` code of OCP current trimming (45...240 mA)"""
+    if trim_mA <= 120.:
+        OcpTrim = round((trim_mA - 45.) / 5.)
+    else:
+        OcpTrim = round((trim_mA + 30.) / 10.)
+    OcpTrim = min(max(int(OcpTrim), 0), 27)
+    return OcpTrim | 0x20 if on else OcpTrim # `OcpOn`
+
+
+def powerCodes(level, PA_BOOST=True, MaxPower=7):
+    """get (RegPaConfig, RegPaDac, RegOcp) codes of TX power level [dBm]:
+       2...20 dBm on PA_BOOST pin (high power mode above 17 dBm),
+       0...15 dBm on RFO pin"""
+    if PA_BOOST:
+        # Pout = 17 - (15 - OutputPower) dBm (+3 dB in high power mode)
+        level = min(max(level, 2), 20)
+        if level > 17:
+            return PA_SELECT | (level - 5), 0x87, ocpCode(140.)
+        return PA_SELECT | (level - 2), 0x84, ocpCode(100.)
+    # Pout = 10.8 + 0.6 * MaxPower - (15 - OutputPower) dBm
+    MaxPower = min(max(MaxPower, 0), 7)
+    return (MaxPower << 4) | min(max(level, 0), 15), 0x84, ocpCode(100.)
+
+
+def powerLevel(pa_config, pa_dac=0x84):
+    """get TX power level [dBm] of `RegPaConfig`/`RegPaDac` codes"""
+    if pa_config & PA_SELECT: # PA_BOOST
+        return (pa_config & 0x0F) + (5 if (pa_dac & 0x07) == 0x07 else 2)
+    return int(round(10.8 + 0.6 * ((pa_config >> 4) & 0x07) - 15 + (pa_config & 0x0F)))
+
+
 def getRxBw(bw=10.4):
     for m, e, v in RX_BW_TABLE:
         if bw <= v:
@@ -233,6 +360,43 @@ def getRxBw(bw=10.4):
     return RX_BW_TABLE[-1][:2]
 
 
+def spiOpen(gpio, hardware=True, baudrate=None):
+    """open SPI bus of port on `gpio` pins (hardware SPI if port can route
+       them, else software SPI); return (spi, name, baudrate)"""
+    sck, mosi, miso = gpio['sck'], gpio['mosi'], gpio['miso']
+    if hardware:
+        if baudrate is None: baudrate = 5000000 # 5MHz
+        if PORT == 'esp8266':
+            if (sck, mosi, miso) == (14, 13, 12): # HSPI has fixed pins
+                return SPI(1, baudrate=baudrate, polarity=0, phase=0), \
+                       'HSPI', baudrate
+        elif PORT == 'esp32':
+            # VSPI/HSPI on own IO_MUX pins, else HSPI by GPIO matrix
+            id = 2 if (sck, mosi, miso) == (18, 23, 19) else 1
+            return SPI(id, baudrate=baudrate, polarity=0, phase=0,
+                       sck=Pin(sck), mosi=Pin(mosi), miso=Pin(miso)), \
+                   'HSPI' if id == 1 else 'VSPI', baudrate
+        elif PORT == 'rp2':
+            for id in (0, 1): # SPI block is selected by pins
+                try:
+                    return SPI(id, baudrate=baudrate, polarity=0, phase=0,
+                               sck=Pin(sck), mosi=Pin(mosi), miso=Pin(miso)), \
+                           'SPI%d' % id, baudrate
+                except ValueError:
+                    pass
+        else:
+            return SPI(1, baudrate=baudrate, polarity=0, phase=0), 'SPI1', baudrate
+        baudrate = None # no hardware SPI on these pins
+    if baudrate is None: baudrate = 500000 # 500kHz
+    try: # new ports (SPI(-1) is deprecated)
+        from machine import SoftSPI
+        return SoftSPI(baudrate=baudrate, polarity=0, phase=0, sck=Pin(sck),
+                       mosi=Pin(mosi), miso=Pin(miso)), 'SoftSPI', baudrate
+    except ImportError:
+        return SPI(-1, baudrate=baudrate, polarity=0, phase=0, sck=Pin(sck),
+                   mosi=Pin(mosi), miso=Pin(miso)), 'SPI(-1)', baudrate
+
+
 class RADIO:
     def __init__(self,
                  mode = LORA, # 0 - LoRa, 1 - FSK, 2 - OOK
@@ -255,7 +419,11 @@ class RADIO:
                          'afc_bw':            2.6,  # 2.6...250 kHz
                          'afc':              False, # AFC on/off
                          'fixed':            False, # fixed packet size or variable
-                         'dcfree':           0},    # 0=None, 1=Manchester or 2=Whitening
+                         'dcfree':           0,     # 0=None, 1=Manchester or 2=Whitening
+                         'sync':  FSK_SYNC_WORD,    # Sync Word 1...8 bytes
+                         # address filtering (LoRa - by software, FSK/OOK - by hardware):
+                         'node_addr':        None,  # node address 0...255 or None
+                         'broadcast_addr':   None}, # broadcast address 0...255 or None
                  gpio = {'led':    2,    # blue LED GPIO number on board
                          'reset':  5,    # reset pin from GPIO5 (or may be None)
                          'dio0':   4,    # DIO0 line to GPIO4
@@ -265,6 +433,7 @@ class RADIO:
                          'miso':   12},  # SPI MISO
                  spi_hardware = True,
                  spi_baudrate = None,
+                 spi_autotune = False, # find highest reliable SPI clock
                  onReceive    = None): # receive callback
 
         # init GPIO
@@ -280,27 +449,49 @@ class RADIO:
         self.pin_cs.value(1)
 
         # init SPI
-        if spi_hardware:
-            if spi_baudrate == None: spi_baudrate = 5000000 # 5MHz
-            if ESP32:
-                self.spi = SPI(1, baudrate=spi_baudrate, polarity=0, phase=0,
-                               sck=Pin(14), mosi=Pin(13), miso=Pin(12))
-            else:
-                self.spi = SPI(1, baudrate=spi_baudrate, polarity=0, phase=0)
-        else:
-            if spi_baudrate == None: spi_baudrate = 500000 # 500kHz
-            self.spi = SPI(-1, baudrate=spi_baudrate, polarity=0, phase=0,
-                           sck=Pin(gpio['sck']),
-                           mosi=Pin(gpio['mosi']),
-                           miso=Pin(gpio['miso']))
-                           #bits=8, firstbit=SPI.MSB, # FIXME
-                           #sck=Pin(gpio['sck'], Pin.OUT, Pin.PULL_DOWN),
-                           #mosi=Pin(gpio['mosi'], Pin.OUT, Pin.PULL_UP),
-                           #miso=Pin(gpio['miso'], Pin.IN, Pin.PULL_UP))
+        self.spi, self.spi_name, self.spi_baudrate = \
+            spiOpen(gpio, spi_hardware, spi_baudrate)
         self.spi.init()
+        self._spiXfer = self.spi.write_readinto # cached bound methods
+        self._cs      = self.pin_cs.value
+        self._reg     = bytearray(2) # register access buffer
+        self._regIsr  = bytearray(2) # register access buffer of DIO0 handler
+        self._code2   = bytearray(2) # multi-byte register codes
+        self._code3   = bytearray(3)
         self.onReceive(onReceive)        
-        #self._lock = False
+        self._rxTicks = 0 # `ticks_us()` on DIO0 edge of last RX packet
+        self._rxAddr = None # destination address of last RX packet
+        self._rejected = 0 # packets rejected by address
+        self._paCodes = None # cached (RegPaConfig, RegPaDac, RegOcp) codes
+        self._pa  = 0x4F # `RegPaConfig` (reset value)
+        self._dac = 0x84 # `RegPaDac` (reset value)
+        self._ocp = 0x2B # `RegOcp` (reset value)
+        self.energy = None # energy accounting (look "energy.py")
+        self._shadow = None # config registers of last init()/saveConfig()
+        self._calOp = None # `RegOpMode` to restore after calibration
+        self._calT = 0
+        self._calTemp = None # chip temperature of last calibration [C]
+        self.temp_offset = 0 # calibration of getTemp() [C]
+        self._profiles = {} # fixed length message types (look addProfile())
+        self._profile = None # profile of current registers
+        self._profileLen = 0 # `RegPayloadLength` of profile
+        self._base = None # CRC, CR/header mode or fixed length to restore after profile
+        self.faults = {'tx':      0, # TxDone/PacketSent timeout
+                       'fifo':    0, # FifoEmpty timeout (FSK/OOK)
+                       'cal':     0, # image calibration timeout
+                       'spi':     0, # bad `RegVersion` on recovery
+                       'recover': 0} # recover() runs
+        self._txBusy = False # send() owns SPI and FIFO (DIO0 handler defers)
+        self._rxPending = None # `ticks_us()` of DIO0 edge deferred by send()
+        self._txData = False # TX data in FIFO: DIO0 edge is TX end
+        self._listen = None # (size, profile) of receive(): RX after send()
+        self._length = None # payload length register value (None - unknown)
+        self.arbitration = {'deferred': 0, # TX waited for packet on air
+                            'aborted':  0, # TX aborted by packet on air
+                            'pending':  0} # RX packet read by send() before TX
         self.reset()
+        if spi_autotune:
+            self.spiAutotune()
         self._mode = 0 # LoRa mode by default
         self.init(mode, pars)
 
@@ -321,13 +512,69 @@ class RADIO:
 
     def readReg(self, address, byteorder='big', signed=False):
         """read 8-bit register by SPI"""
-        response = self.spiTransfer(address & 0x7F) 
-        return int.from_bytes(response, byteorder)        
+        return xfer(self._spiXfer, self._cs, self._reg, address & 0x7F, 0)
         
 
     def writeReg(self, address, value):
         """write 8-bit register by SPI"""
-        self.spiTransfer(address | 0x80, value)
+        xfer(self._spiXfer, self._cs, self._reg, address | 0x80, value)
+
+
+    def readRegs(self, address, size):
+        """read `size` registers from `address` by one SPI transaction (burst)"""
+        self.pin_cs.value(0)
+        self.spi.write(bytes([address & 0x7F]))
+        data = self.spi.read(size)
+        self.pin_cs.value(1)
+        return data
+
+
+    def writeRegs(self, address, buf):
+        """write registers from `address` by one SPI transaction (burst)"""
+        self.pin_cs.value(0)
+        self.spi.write(bytes([address | 0x80]))
+        self.spi.write(buf)
+        self.pin_cs.value(1)
+
+
+    def _spiVerify(self, rounds):
+        # check register access on current SPI clock
+        for r in range(rounds): # reads first (bad clock may corrupt writes)
+            if self.readReg(REG_VERSION) != 0x12:
+                return False
+        for r in range(rounds):
+            pattern = SPI_PATTERN[r & 7:] + SPI_PATTERN[:r & 7]
+            self.writeRegs(REG_SYNC_VALUE_1, pattern) # burst
+            if self.readRegs(REG_SYNC_VALUE_1, 8) != pattern:
+                return False
+            for i in range(8): # one register transactions
+                value = pattern[i] ^ 0xFF
+                self.writeReg(REG_SYNC_VALUE_1 + i, value)
+                if self.readReg(REG_SYNC_VALUE_1 + i) != value:
+                    return False
+        return True
+
+
+    def spiAutotune(self, baudrates=SPI_BAUDRATES, rounds=4):
+        """set highest SPI clock [Hz] which passes write/read verify of sync
+           value registers (FSK page, restored); return it"""
+        op = self.readReg(REG_OP_MODE)
+        if op & 0x80: # LoRa: FSK page by `AccessSharedReg`
+            self.writeReg(REG_OP_MODE, op | 0x40)
+        saved = self.readRegs(REG_SYNC_VALUE_1, 8)
+        best = min(baudrates)
+        for baudrate in baudrates:
+            if baudrate <= SPI_MAX_BAUDRATE:
+                self.spi.init(baudrate=baudrate)
+                if self._spiVerify(rounds):
+                    best = baudrate
+                    break
+        self.spi.init(baudrate=best)
+        self.writeRegs(REG_SYNC_VALUE_1, saved)
+        self.writeReg(REG_OP_MODE, op)
+        self.spi_baudrate = best
+        print("SX127x SPI: %s %d Hz (%s)" % (self.spi_name, best, PORT))
+        return best
 
 
     def led(self, on=True):
@@ -363,7 +610,14 @@ class RADIO:
 
     def setMode(self, mode):
         """set mode"""
-        self.writeReg(REG_OP_MODE, (self.readReg(REG_OP_MODE) & ~MODES_MASK) | mode)
+        self._writeOpMode((self.readReg(REG_OP_MODE) & ~MODES_MASK) | mode)
+
+
+    def _writeOpMode(self, op):
+        # write `RegOpMode` (modem and mode) with energy accounting
+        self.writeReg(REG_OP_MODE, op)
+        if self.energy:
+            self.energy.mode(op & MODES_MASK)
 
 
     def getMode(self):
@@ -375,17 +629,22 @@ class RADIO:
         """switch to LoRa mode"""
         mode  = self.readReg(REG_OP_MODE) # read mode
         sleep = (mode & ~MODES_MASK) | MODE_SLEEP
-        self.writeReg(REG_OP_MODE, sleep) # go to sleep
+        self._writeOpMode(sleep) # go to sleep
         if lora:
             sleep |= MODE_LONG_RANGE 
             mode  |= MODE_LONG_RANGE
         else:
             sleep &= ~MODE_LONG_RANGE 
             mode  &= ~MODE_LONG_RANGE
-        self.writeReg(REG_OP_MODE, sleep) # write "long range" bit
-        self.writeReg(REG_OP_MODE, mode)  # restore old mode
+        self._writeOpMode(sleep) # write "long range" bit
+        self._writeOpMode(mode)  # restore old mode
         
 
+    def getModulation(self):
+        """get RADIO class mode: 0 - LoRa, 1 - FSK, 2 - OOK"""
+        return self._mode
+
+
     def isLora(self):
         """check LoRa (or FSK/OOK) mode"""
         mode = self.readReg(REG_OP_MODE) # read mode
@@ -396,28 +655,31 @@ class RADIO:
         """switch to FSK mode"""
         self.lora(not fsk)
         if fsk:
-            self.writeReg(REG_OP_MODE, (self.readReg(REG_OP_MODE) & ~MODES_MASK2) | MODE_FSK)
+            self._writeOpMode((self.readReg(REG_OP_MODE) & ~MODES_MASK2) | MODE_FSK)
 
 
     def ook(self, ook=True):
         """switch to OOK mode"""
         self.lora(not ook)
         if ook:
-            self.writeReg(REG_OP_MODE, (self.readReg(REG_OP_MODE) & ~MODES_MASK2) | MODE_OOK)
+            self._writeOpMode((self.readReg(REG_OP_MODE) & ~MODES_MASK2) | MODE_OOK)
 
 
     def sleep(self):
         """switch to Sleep Mode:"""
+        self._listen = None
         self.setMode(MODE_SLEEP)
 
 
     def standby(self):
         """switch ro Standby mode"""
+        self._listen = None
         self.setMode(MODE_STDBY)
 
 
     def tx(self, on=True):
         """on/off TX mode (off = standby)"""
+        self._listen = None
         if on: self.setMode(MODE_TX)
         else:  self.setMode(MODE_STDBY)
 
@@ -425,12 +687,15 @@ class RADIO:
     def rx(self, on=True):
         """on/off RX (continuous) mode (off = standby)"""
         if on: self.setMode(MODE_RX_CONTINUOUS)
-        else:  self.setMode(MODE_STDBY)
+        else:
+            self._listen = None
+            self.setMode(MODE_STDBY)
 
 
     def cad(self, on=True):
         """on/off CAD (LoRa) mode (off = standby)"""
         if self._mode == 0: # LoRa mode
+            self._listen = None
             if on: self.setMode(MODE_CAD)
             else:  self.setMode(MODE_STDBY)
 
@@ -439,6 +704,10 @@ class RADIO:
         """init chip"""
         if mode is not None: self._mode = mode
         if pars: self._pars = pars
+        profiles, self._profiles = self._profiles, {} # recompute at end
+        self._profile = None
+        self._listen = None
+        self._length = None
             
         # check version
         version = self.version()
@@ -462,6 +731,9 @@ class RADIO:
         
         # enable/disable CRC
         self.enableCRC(self._pars["crc"])
+
+        # set node/broadcast address filtering
+        self.setAddress(self._pars.get('node_addr'), self._pars.get('broadcast_addr'))
         
         if self._mode == 0:
             # set LoRaTM options
@@ -483,8 +755,8 @@ class RADIO:
                           self.readReg(REG_MODEM_CONFIG_3) | 0x04) # `AgcAutoOn`
             
             # set base addresses
-            self.writeReg(REG_FIFO_TX_BASE_ADDR, FIFO_TX_BASE_ADDR)
-            self.writeReg(REG_FIFO_RX_BASE_ADDR, FIFO_RX_BASE_ADDR)
+            self.writeRegs(REG_FIFO_TX_BASE_ADDR,
+                           bytes((FIFO_TX_BASE_ADDR, FIFO_RX_BASE_ADDR)))
 
             # set DIO0 mapping (`RxDone`)
             self.writeReg(REG_DIO_MAPPING_1, 0x00)
@@ -501,12 +773,9 @@ class RADIO:
             self.setDcFree(   self._pars["dcfree"])
             
             self.writeReg(REG_RSSI_TRESH, 0xFF) # default
-            self.writeReg(REG_PREAMBLE_LSB, 8) # 3 by default
+            self.setPreamble(8) # 3 by default
             
-            self.writeReg(REG_SYNC_VALUE_1, 0x69) # 0x01 by default
-            self.writeReg(REG_SYNC_VALUE_2, 0x81) # 0x01 by default
-            self.writeReg(REG_SYNC_VALUE_3, 0x7E) # 0x01 by default
-            self.writeReg(REG_SYNC_VALUE_4, 0x96) # 0x01 by default
+            self.setSyncWord(self._pars.get('sync', FSK_SYNC_WORD)) # 0x01 by default
 
             # set `DataMode` to Packet (and reset PayloadLength(10:8) to 0)
             self.writeReg(REG_PACKET_CONFIG_2, 0x40)
@@ -521,19 +790,21 @@ class RADIO:
             #    in TxPacket - `PacketSent`
             self.writeReg(REG_DIO_MAPPING_1, 0x00)
 
-            # RSSI and IQ callibrate
-            self.rxCalibrate()
+        # RSSI and IQ callibrate (image calibration on RF frequency)
+        self.rxCalibrate()
+
+        self._profiles = profiles
+        self._updateProfiles()
 
         self.standby() 
+        self.saveConfig()
 
 
     def setFrequency(self, freq_kHz, freq_Hz=0):
         """set RF frequency [kHz * 1000 + Hz]"""
         self._freq = int(freq_kHz) * 1000 + freq_Hz # kHz + Hz -> Hz
         freq_code = int(round(self._freq / FSTEP))
-        self.writeReg(REG_FRF_MSB, (freq_code >> 16) & 0xFF)
-        self.writeReg(REG_FRF_MID, (freq_code >>  8) & 0xFF)
-        self.writeReg(REG_FRF_LSB,  freq_code        & 0xFF)
+        self.writeRegs(REG_FRF_MSB, putBE(self._code3, freq_code, 3))
         mode = self.readReg(REG_OP_MODE)
         if self._freq < 600000000: # LF <= 525 < _600_ < 779 <= HF [MHz]
             mode |=  MODE_LOW_FREQ_MODE_ON # LF
@@ -544,38 +815,51 @@ class RADIO:
 
     def setPower(self, level, PA_BOOST=True, MaxPower=7):
         """set TX Power level 2...17 dBm, select PA_BOOST pin"""
-        MaxPower = min(max(MaxPower, 0), 7)
-        if PA_BOOST:
-            # Select PA_BOOST pin: Pout is limited to ~17..20 dBm
-            # Pout = 17 - (15 - OutputPower) dBm
-            OutputPower = min(max(level - 2, 0), 15)
-            self.writeReg(REG_PA_CONFIG, PA_SELECT | OutputPower)
-        else:
-            # Select RFO pin: Pout is limited to ~14..15 dBm
-            # Pmax = 10.8 + 0.6 * MaxPower  [dBm]
-            # Pout = Pmax - (15 - OutputPower)) = 0...15 dBm if MaxPower=7
-            OutputPower = min(max(level, 0), 15)
-            self.writeReg(REG_PA_CONFIG, (MaxPower << 4) | OutputPower)
+        # Select PA_BOOST pin: Pout is limited to ~17..20 dBm
+        # Select RFO pin: Pout is limited to ~14..15 dBm
+        if PA_BOOST: level = min(level, 17) # +20 dBm by setHighPower()
+        self._paCodes = None
+        self._pa = powerCodes(level, PA_BOOST, MaxPower)[0]
+        self.writeReg(REG_PA_CONFIG, self._pa)
+
+
+    def setPowerCodes(self, codes):
+        """set TX power by codes of powerCodes(); only changed registers
+           are written (one SPI transaction if level is in the same mode)"""
+        old = self._paCodes
+        if old is None or old[1] != codes[1]:
+            self.writeReg(REG_PA_DAC, codes[1])
+        if old is None or old[2] != codes[2]:
+            self.writeReg(REG_OCP, codes[2])
+        if old is None or old[0] != codes[0]:
+            self.writeReg(REG_PA_CONFIG, codes[0])
+        self._paCodes = codes
+        self._pa, self._dac, self._ocp = codes
+
+
+    def getPower(self):
+        """get TX power level [dBm] (by last written codes)"""
+        return powerLevel(self._pa, self._dac)
+
+
+    def getPowerCodes(self):
+        """get (RegPaConfig, RegPaDac, RegOcp) codes of TX power (by last
+           written codes) to restore it by setPowerCodes()"""
+        return self._pa, self._dac, self._ocp
             
     
     def setHighPower(self, on=True):
         """set high power on PA_BOOST up to +20 dBm"""
-        if on: # +3dB
-            self.writeReg(REG_PA_DAC, 0x87) # power on PA_BOOST pin up to +20 dBm
-        else:
-            self.writeReg(REG_PA_DAC, 0x84) # default mode
+        self._paCodes = None
+        self._dac = 0x87 if on else 0x84 # +3dB or default mode
+        self.writeReg(REG_PA_DAC, self._dac) # power on PA_BOOST pin up to +20 dBm
 
 
     def setOCP(self, trim_mA=100., on=True):
         """set trimming of OCP current (45...240 mA)"""
-        if trim_mA <= 120.:
-            OcpTrim = round((trim_mA - 45.) / 5.)
-        else:
-            OcpTrim = round((trim_mA + 30.) / 10.)
-        OcpTrim = min(max(OcpTrim, 0), 27)
-        if on:
-            OcpTrim |= 0x20 # `OcpOn`
-        self.writeReg(REG_OCP, OcpTrim)
+        self._paCodes = None
+        self._ocp = ocpCode(trim_mA, on)
+        self.writeReg(REG_OCP, self._ocp)
 
     
     def setLnaBoost(self, LnaBoost=True):
@@ -600,6 +884,7 @@ class RADIO:
     def enableCRC(self, crc=True, crcAutoClearOff=True):
         """enable/disable CRC (and set CrcAutoClearOff in FSK/OOK mode)"""
         self._crc = crc
+        self._profile = None
         if self._mode == 0: # LoRa mode
             reg = self.readReg(REG_MODEM_CONFIG_2)
             reg = (reg | 0x04) if crc else (reg & ~0x04) # `RxPayloadCrcOn`
@@ -644,6 +929,55 @@ class RADIO:
             return 0.
         
 
+    def getFEI(self):
+        """get frequency error of last packet [Hz] (LoRa/FSK/OOK)"""
+        if self._mode == 0: # LoRa mode: 20-bit `FreqError`
+            msb, mid, lsb = self.readRegs(REG_LR_FEI_MSB, 3)
+            fei = ((msb & 0x0F) << 16) | (mid << 8) | lsb
+            if fei & 0x80000: fei -= 0x100000
+            return fei * (1 << 24) / FXOSC * self._bw / 500.
+        else: # FSK/OOK mode: 16-bit `FeiValue`
+            msb, lsb = self.readRegs(REG_FEI_MSB, 2)
+            fei = (msb << 8) | lsb
+            if fei & 0x8000: fei -= 0x10000
+            return fei * FSTEP
+
+
+    def getAFC(self):
+        """get AFC frequency correction [Hz] (FSK/OOK)"""
+        if self._mode:
+            msb, lsb = self.readRegs(REG_AFC_MSB, 2)
+            afc = (msb << 8) | lsb
+            if afc & 0x8000: afc -= 0x10000
+            return afc * FSTEP
+        return 0.
+
+
+    def getFrequency(self):
+        """get RF frequency [Hz]"""
+        return self._freq
+
+
+    def getSF(self):
+        """get Spreading Factor 6...12 (LoRa)"""
+        return self._sf if self._mode == 0 else None
+
+
+    def getBW(self):
+        """get signal Band Width [kHz] (LoRa)"""
+        return self._bw if self._mode == 0 else None
+
+
+    def getCR(self):
+        """get Coding Rate denominator 5...8 (LoRa)"""
+        return self._cr if self._mode == 0 else None
+
+
+    def getBitrate(self):
+        """get bitrate [bit/s] (FSK/OOK)"""
+        return self._bitrate if self._mode else None
+
+
     def getIrqFlags(self):
         """get IRQ flags for debug"""
         if self._mode == 0: # LoRa mode
@@ -651,8 +985,7 @@ class RADIO:
             self.writeReg(REG_IRQ_FLAGS, irqFlags)
             return irqFlags
         else: # FSK/OOK mode
-            irqFlags1 = self.readReg(REG_IRQ_FLAGS_1)
-            irqFlags2 = self.readReg(REG_IRQ_FLAGS_2)
+            irqFlags1, irqFlags2 = self.readRegs(REG_IRQ_FLAGS_1, 2)
             return (irqFlags2 << 8) | irqFlags1
 
     
@@ -676,21 +1009,43 @@ class RADIO:
             self.writeReg(REG_INVERT_IQ, reg)
 
 
+    def getInvertIQ(self):
+        """check IQ channels are inverted (LoRa)"""
+        return self._mode == 0 and bool(self.readReg(REG_INVERT_IQ) & 0x40)
+
+
     def setSF(self, sf=10):
         """set Spreading Factor 6...12 (LoRa)"""
         if self._mode == 0:
             sf = min(max(sf, 6), 12)
+            self._sf = sf
             self.writeReg(REG_DETECT_OPTIMIZE,     0xC5 if sf == 6 else 0xC3)
             self.writeReg(REG_DETECTION_THRESHOLD, 0x0C if sf == 6 else 0x0A)
             self.writeReg(REG_MODEM_CONFIG_2,
                           (self.readReg(REG_MODEM_CONFIG_2) & 0x0F) | ((sf << 4) & 0xF0))
+            if self._profiles: self._updateProfiles()
 
 
     def setLDRO(self, ldro):
         """set Low Data Rate Optimisation (LoRa)"""
         if self._mode == 0:
+            self._ldro = ldro
             self.writeReg(REG_MODEM_CONFIG_3, # `LowDataRateOptimize`
-                          (self.readReg(REG_MODEM_CONFIG_3) & ~0x08) | 0x08 if ldro else 0)
+                          (self.readReg(REG_MODEM_CONFIG_3) & ~0x08) | (0x08 if ldro else 0))
+            if self._profiles: self._updateProfiles()
+
+
+    def getLDRO(self):
+        """get Low Data Rate Optimisation (LoRa)"""
+        return self._ldro if self._mode == 0 else None
+
+
+    def setCachedSF(self, sf, ldro):
+        """update cached SF and LDRO (getSF(), airtime()) after caller wrote
+           `RegModemConfig2/3` itself (fast SF hopping, look "multisf.py")"""
+        if self._mode == 0:
+            self._sf, self._ldro = sf, ldro
+            if self._profiles: self._updateProfiles()
 
     def setBW(self, sbw):
         """set signal Band Width 7.8-500 kHz (LoRa)"""
@@ -700,23 +1055,35 @@ class RADIO:
                 if sbw <= BW_TABLE[i]:
                     bw = i
                     break
+            self._bw = BW_TABLE[bw]
             self.writeReg(REG_MODEM_CONFIG_1, \
                                (self.readReg(REG_MODEM_CONFIG_1) & 0x0F) | (bw << 4))
+            if self._profiles: self._updateProfiles()
 
 
     def setCR(self, denominator):
         """set Coding Rate [5..8] (LoRa)"""
         if self._mode == 0:
             denominator = min(max(denominator, 5), 8)        
+            self._cr = denominator
+            self._profile = None
             cr = denominator - 4
             self.writeReg(REG_MODEM_CONFIG_1, (self.readReg(REG_MODEM_CONFIG_1) & 0xF1) | (cr << 1))
         
 
     def setPreamble(self, length):
-        """set preamble length [6...65535] (LoRa)"""
-        if self._mode == 0:
-            self.writeReg(REG_PREAMBLE_MSB, (length >> 8) & 0xFF)
-            self.writeReg(REG_PREAMBLE_LSB, (length     ) & 0xFF)
+        """set preamble length [6...65535] (LoRa) or [0...65535] bytes (FSK/OOK)"""
+        self._preamble = length
+        if self._mode == 0: # LoRa mode
+            self.writeRegs(REG_PREAMBLE_MSB, putBE(self._code2, length, 2))
+        else: # FSK/OOK mode
+            self.writeRegs(REG_PREAMBLE_L_MSB, putBE(self._code2, length, 2))
+        if self._profiles: self._updateProfiles()
+
+
+    def getPreamble(self):
+        """get preamble length [symbols (LoRa) or bytes (FSK/OOK)]"""
+        return self._preamble
         
         
     def setSW(self, sw): # LoRa mode only
@@ -725,29 +1092,177 @@ class RADIO:
             self.writeReg(REG_SYNC_WORD, sw)
          
     
+    def setSyncWord(self, sync=FSK_SYNC_WORD):
+        """set Sync Word 1...8 bytes, empty -> no sync word (FSK/OOK)"""
+        if self._mode:
+            size = min(len(sync), 8)
+            self._syncSize = size
+            if size:
+                self.writeRegs(REG_SYNC_VALUE_1, sync[:size])
+            reg = self.readReg(REG_SYNC_CONFIG) & ~0x17
+            if size:
+                reg |= 0x10 | (size - 1) # `SyncOn`, `SyncSize`
+            self.writeReg(REG_SYNC_CONFIG, reg)
+            if self._profiles: self._updateProfiles()
+
+
+    def setAddress(self, node=None, broadcast=None):
+        """set node/broadcast address filtering, None -> off (LoRa/FSK/OOK);
+           packets begin with destination address byte (look `addr` in send())"""
+        self._nodeAddr = node
+        self._broadcastAddr = broadcast
+        if node is None:
+            self._addrFilter = ADDR_FILTER_OFF
+        elif broadcast is None:
+            self._addrFilter = ADDR_FILTER_NODE
+        else:
+            self._addrFilter = ADDR_FILTER_BROADCAST
+        if self._mode: # FSK/OOK mode: filter by hardware
+            if node is not None:
+                self.writeReg(REG_NODE_ADRS, node)
+            if broadcast is not None:
+                self.writeReg(REG_BROADCAST_ADRS, broadcast)
+            reg = self.readReg(REG_PACKET_CONFIG_1)
+            reg = (reg & ~0x06) | (self._addrFilter << 1) # bits 2-1 `AddressFiltering`
+            self.writeReg(REG_PACKET_CONFIG_1, reg)
+        if self._profiles: self._updateProfiles()
+
+
+    def getRxAddr(self):
+        """get destination address of last received packet (or None)"""
+        return self._rxAddr
+
+
+    def getRejected(self):
+        """get number of packets rejected by address (LoRa)"""
+        return self._rejected
+
+
     def setImplicitHeaderMode(self, implicitHeaderMode=True):
         """set ImplicitHeaderModeOn (LoRa)"""
         if self._mode == 0:
             if self._implicitHeaderMode != implicitHeaderMode: # set value only if different
                 self._implicitHeaderMode = implicitHeaderMode
+                self._profile = None
                 modem_config_1 = self.readReg(REG_MODEM_CONFIG_1)
                 config = modem_config_1 | 0x01 if implicitHeaderMode else \
                          modem_config_1 & 0xFE
                 self.writeReg(REG_MODEM_CONFIG_1, config)
+
+
+    def addProfile(self, name, size, cr=None, crc=None):
+        """register fixed length message type `name`: payload `size` bytes,
+           CR denominator `cr` (LoRa only) and CRC `crc` (None - current);
+           packets of profile are sent/received in implicit header mode
+           (LoRa) or fixed length (FSK/OOK) by precomputed registers (look
+           useProfile()); return time on air of packet [us]"""
+        if self._mode: # FSK/OOK mode
+            if cr is not None:
+                raise ValueError('No CR in FSK/OOK mode')
+        else:
+            cr = min(max(self._cr if cr is None else cr, 5), 8)
+        if crc is None: crc = self._crc
+        if self._profile == name:
+            self.useProfile(None) # registers of old profile
+        prof = self._makeProfile(min(max(size, 1), MAX_PKT_LENGTH), cr, crc)
+        self._profiles[name] = prof
+        return prof[6]
+
+
+    def _makeProfile(self, size, cr, crc):
+        # (size, CR, CRC, `RegModemConfig1` (LoRa) or `RegPacketConfig1`
+        #  (FSK/OOK), `RegModemConfig2` (LoRa), `RegPayloadLength`, airtime)
+        length = min(size + (1 if self._addrFilter else 0), MAX_PKT_LENGTH)
+        cfg2 = None
+        if self._mode == 0: # LoRa mode
+            cfg1, cfg2 = self.readRegs(REG_MODEM_CONFIG_1, 2)
+            cfg1 = (cfg1 & 0xF0) | ((cr - 4) << 1) | 0x01 # `ImplicitHeaderModeOn`
+            cfg2 = (cfg2 & ~0x04) | (0x04 if crc else 0)  # `RxPayloadCrcOn`
+        else: # FSK/OOK mode: `PacketFormat` -> fixed, `CrcOn`
+            cfg1 = (self.readReg(REG_PACKET_CONFIG_1) & ~0x90) | (0x10 if crc else 0)
+        return (size, cr, crc, cfg1, cfg2, length,
+                self.airtime(length, True, cr, crc))
+
+
+    def _updateProfiles(self):
+        # modem settings are changed: recompute profiles
+        for name in self._profiles:
+            prof = self._profiles[name]
+            self._profiles[name] = self._makeProfile(prof[0], prof[1], prof[2])
+
+
+    def _baseRegs(self, prof):
+        # `RegModemConfig1/2` of modem settings (BW/SF bits from profile),
+        # `RegPacketConfig1` in FSK/OOK mode
+        if self._mode:
+            return ((prof[3] & ~0x90) | (0 if self._fixedLen else 0x80) |
+                    (0x10 if self._crc else 0)), None
+        return ((prof[3] & 0xF0) | ((self._cr - 4) << 1) |
+                (0x01 if self._implicitHeaderMode else 0),
+                (prof[4] & ~0x04) | (0x04 if self._crc else 0))
+
+
+    def useProfile(self, name=None):
+        """switch registers to profile `name` (look addProfile()), None - back
+           to CR/CRC/header mode of modem settings; write changed registers
+           only, no register reads (called by send()/receive())"""
+        cur = self._profile
+        if name == cur:
+            return
+        if cur is None:
+            c1, c2 = self._baseRegs(self._profiles[name])
+            self._base = (self._crc, self._fixedLen) if self._mode else \
+                         (self._crc, self._cr, self._implicitHeaderMode)
+        else:
+            c1, c2 = self._profiles[cur][3:5]
+        if name is None:
+            if self._mode:
+                self._crc, self._fixedLen = self._base
+            else:
+                self._crc, self._cr, self._implicitHeaderMode = self._base
+            cfg1, cfg2 = self._baseRegs(self._profiles[cur])
+        else:
+            size, cr, crc, cfg1, cfg2, length, t = self._profiles[name]
+            self._crc = crc
+            if self._mode: # FSK/OOK mode: fixed length
+                self._fixedLen = True
+            else: # LoRa mode: implicit header
+                self._cr, self._implicitHeaderMode = cr, True
+            self._profileLen = length
+        if cfg1 != c1:
+            self.writeReg(REG_MODEM_CONFIG_1 if self._mode == 0 else
+                          REG_PACKET_CONFIG_1, cfg1)
+        if cfg2 != c2: self.writeReg(REG_MODEM_CONFIG_2, cfg2)
+        if name is not None:
+            self._writeLength(length)
+        self._profile = name
+
+
+    def _writeLength(self, length):
+        # write payload length register (LoRa/FSK/OOK) if value is changed
+        if length != self._length:
+            self._length = length
+            self.writeReg(REG_PAYLOAD_LENGTH if self._mode == 0 else
+                          REG_PAYLOAD_LEN, length)
+
+
+    def getProfile(self):
+        """get name of current profile (None - modem settings)"""
+        return self._profile
        
         
     def setBitrate(self, bitrate=4800.):
         """set bitrate [bit/s] (FSK/OOK)"""
+        if self._mode: self._bitrate = bitrate
         if self._mode == 1: # FSK
             code = int(round((FXOSC * 16.) / bitrate)) # bit/s -> code/frac
-            self.writeReg(REG_BITRATE_MSB,  (code >> 12) & 0xFF)
-            self.writeReg(REG_BITRATE_LSB,  (code >> 4)  & 0xFF)
-            self.writeReg(REG_BITRATE_FRAC,  code        & 0x0F)
+            self.writeRegs(REG_BITRATE_MSB, putBE(self._code2, code >> 4, 2))
+            self.writeReg(REG_BITRATE_FRAC, code & 0x0F)
         elif self._mode == 2: # OOK
             code = int(round(FXOSC / bitrate)) # bit/s -> code
-            self.writeReg(REG_BITRATE_MSB,  (code >> 8) & 0xFF)
-            self.writeReg(REG_BITRATE_LSB,   code       & 0xFF)
+            self.writeRegs(REG_BITRATE_MSB, putBE(self._code2, code, 2))
             self.writeReg(REG_BITRATE_FRAC, 0)
+        if self._profiles: self._updateProfiles()
 
 
     def setFdev(self, fdev=5000.):
@@ -755,8 +1270,7 @@ class RADIO:
         if self._mode:
             code = int(round(fdev / FSTEP)) # Hz -> code
             code = min(max(code, 0), 0x3FFF)
-            self.writeReg(REG_FDEV_MSB, (code >> 8) & 0xFF)
-            self.writeReg(REG_FDEV_LSB,  code       & 0xFF)
+            self.writeRegs(REG_FDEV_MSB, putBE(self._code2, code, 2))
 
 
     def setRxBW(self, bw=10.4):
@@ -787,6 +1301,7 @@ class RADIO:
         if self._mode:
             if self._fixedLen != fixed: # set value only if different
                 self._fixedLen = fixed
+                self._profile = None
                 reg = self.readReg(REG_PACKET_CONFIG_1)
                 if fixed: reg &= ~0x80 # bit 7: PacketFormat -> 0 (fixed size)
                 else:     reg |=  0x80 # bit 7: PacketFormat -> 1 (variable size)
@@ -799,6 +1314,7 @@ class RADIO:
             reg = self.readReg(REG_PACKET_CONFIG_1)
             reg = (reg & 0x9F) | ((mode & 3) << 5) # bit 6-5 `DcFree`
             self.writeReg(REG_PACKET_CONFIG_1, reg)
+            if self._profiles: self._updateProfiles()
 
 
     def continuous(self, on=True):
@@ -810,14 +1326,100 @@ class RADIO:
             self.writeReg(REG_PACKET_CONFIG_2, reg)
     
 
+    def _fskModem(self):
+        # switch LoRa to FSK modem (standby); return `RegOpMode` to restore
+        op = self.readReg(REG_OP_MODE)
+        if op & MODE_LONG_RANGE: # modem is changed in sleep only
+            lf = op & MODE_LOW_FREQ_MODE_ON
+            self._writeOpMode((op & ~MODES_MASK) | MODE_SLEEP)
+            self._writeOpMode(lf | MODE_SLEEP)
+            self._writeOpMode(lf | MODE_STDBY)
+        return op
+
+
+    def _restoreModem(self, op):
+        # restore modem and mode saved by _fskModem() (RX single/CAD -> standby)
+        mode = op & MODES_MASK
+        if mode not in (MODE_SLEEP, MODE_STDBY, MODE_RX_CONTINUOUS):
+            mode = MODE_STDBY
+        if op & MODE_LONG_RANGE:
+            self._writeOpMode((op & MODE_LOW_FREQ_MODE_ON) | MODE_SLEEP)
+            self._writeOpMode((op & ~MODES_MASK) | MODE_SLEEP)
+        self.setMode(mode)
+
+
+    def _temp(self, raw):
+        # `RegTemp`/`RegFormerTemp` code -> [C] (-1 C per LSB)
+        return -(raw - 256 if raw & 0x80 else raw) + self.temp_offset
+
+
+    def getTemp(self):
+        """get chip temperature [C] (add `temp_offset` for absolute value);
+           sensor runs in FSRx/RX of FSK modem: LoRa is switched for 150 us"""
+        op = self._fskModem()
+        mode = op & MODES_MASK
+        switch = op & MODE_LONG_RANGE or mode not in (MODE_FS_RX, MODE_RX_CONTINUOUS)
+        if switch:
+            self.setMode(MODE_FS_RX)
+            sleep_us(150)
+        raw = self.readReg(REG_TEMP)
+        if switch:
+            self._restoreModem(op)
+        return self._temp(raw)
+
+
+    def getCalTemp(self):
+        """get chip temperature of last image calibration [C] (or None)"""
+        return self._calTemp
+
+
+    def startCalibrate(self):
+        """start image (RSSI and IQ) calibration, not blocking (LoRa/FSK/OOK);
+           LoRa: FSK modem until calibrated() returns True"""
+        op = self._fskModem()
+        if not op & MODE_LONG_RANGE:
+            self.setMode(MODE_STDBY)
+        self._calOp = op
+        self.writeReg(REG_IMAGE_CAL, self.readReg(REG_IMAGE_CAL) | 0x40) # `ImageCalStart`
+        self._calT = ticks_us()
+
+
+    def calibrated(self):
+        """check end of calibration (look startCalibrate()), restore modem and
+           mode if finished; radio is recovered on timeout"""
+        op = self._calOp
+        if op is None:
+            return True
+        if self.readReg(REG_IMAGE_CAL) & 0x20: # `ImageCalRunning`
+            if ticks_diff(ticks_us(), self._calT) < CAL_TIMEOUT:
+                return False
+            self.faults['cal'] += 1
+            self._calOp = None
+            self._restoreModem(op)
+            self.recover()
+            return True
+        self._calTemp = self._temp(self.readReg(REG_FORMER_TEMP))
+        self._calOp = None
+        self._restoreModem(op)
+        return True
+
+
     def rxCalibrate(self):
-        """RSSI and IQ callibration (FSK/OOK)"""
-        if self._mode:
-            reg = self.readReg(REG_IMAGE_CAL)
-            reg |= 0x40 # `ImageCalStart` bit
-            self.writeReg(REG_IMAGE_CAL, reg)
-            while (self.readReg(REG_IMAGE_CAL) & 0x20): # `ImageCalRunning`
-                pass # FIXME: check timeout
+        """RSSI and IQ callibration (LoRa/FSK/OOK); return False on timeout"""
+        faults = self.faults['cal']
+        self.startCalibrate()
+        while not self.calibrated():
+            pass
+        return self.faults['cal'] == faults
+
+
+    def rxActive(self):
+        """check packet reception in progress (LoRa: modem status, FSK/OOK:
+           preamble or sync word detected)"""
+        if self._mode == 0: # LoRa mode
+            return bool(self.readReg(REG_MODEM_STAT) & STAT_RX_BUSY)
+        return bool(self.readReg(REG_IRQ_FLAGS_1) &
+                    (IRQ1_PREAMBLE_DETECT | IRQ1_SYNC_ADDRESS_MATCH))
 
 
     def setPllBW(self, bw=3):
@@ -836,73 +1438,154 @@ class RADIO:
             self.writeReg(REG_PLL_HOP, reg)
 
 
-    #def aquire_lock(self, lock=False):        
-    #    if not MICROPYTHON: # MicroPython is single threaded, doesn't need lock.
-    #        if lock:
-    #            while self._lock: pass
-    #            self._lock = True
-    #        else:
-    #            self._lock = False
-    
-            
-    def send(self, string, fixed=False):
-        """send packet (LoRa/FSK/OOK)"""
-        #self.aquire_lock(True)  # wait until RX_Done, lock and begin writing.
+    def airtime(self, size, fixed=None, cr=None, crc=None):
+        """get time on air of packet with `size` bytes payload (with address
+           byte if it is sent, look `addr` in send()) [us] (LoRa/FSK/OOK);
+           `cr`/`crc` - other than current CR denominator/CRC"""
+        if crc is None: crc = self._crc
+        if self._mode == 0: # LoRa mode (look "LoRa Modem Designer's Guide" AN1200.13)
+            if fixed is None: fixed = self._implicitHeaderMode
+            if cr is None: cr = self._cr
+            sf = self._sf
+            tsym = (1 << sf) * 1000. / self._bw # symbol time [us]
+            n = 8 * size - 4 * sf + 28 + (16 if crc else 0) - (20 if fixed else 0)
+            d = 4 * (sf - (2 if self._ldro else 0))
+            n = max(-(-n // d) * cr, 0) # ceil(n / d) * (CR + 4)
+            return int((self._preamble + 4.25 + 8 + n) * tsym)
+        else: # FSK/OOK mode
+            if fixed is None: fixed = self._fixedLen
+            n = self._preamble + self._syncSize + size
+            if not fixed:  n += 1 # length byte
+            if crc:        n += 2 # CRC-16
+            return int(n * 8e6 / self._bitrate)
+
+
+    def send(self, string, fixed=False, ticks=None, addr=None, profile=None,
+             defer=True):
+        """send packet (LoRa/FSK/OOK); start TX at `ticks_us()` value `ticks` if set,
+           prepend destination address byte `addr` if set (look setAddress()),
+           send as fixed length message type `profile` if set (payload is cut
+           or padded by zeros, look addProfile());
+           after receive() radio is back in RX at once after TX (configuration
+           of last receive()); packet on air is received before TX if `defer`,
+           else TX is aborted;
+           return True, None if aborted or False on timeout (radio is
+           recovered, look recover())"""
+        if self._listen is not None and self.rxActive(): # packet on air
+            if not defer:
+                self.arbitration['aborted'] += 1
+                return None
+            self.arbitration['deferred'] += 1
+            t0 = ticks_us() # DIO0 handler receives packet while waiting
+            timeout = self.airtime(MAX_PKT_LENGTH, False) + TX_TIMEOUT_MARGIN
+            while self.rxActive() and ticks_diff(ticks_us(), t0) < timeout:
+                pass
+        self._txBusy = True
+        try:
+            ok = self._send(string, fixed, ticks, addr, profile)
+        finally:
+            self._txBusy = self._txData = False
+        if self._listen is not None:
+            self.receive(*self._listen) # changed registers only
+        return ok
+
+
+    def _send(self, string, fixed, ticks, addr, profile):
         self.setMode(MODE_STDBY)
-        buf = string.encode()
+        if self._rxPending is not None: # RX end after check of packet on air
+            self._readPending()
+        self.useProfile(profile) # None -> modem settings
+        buf = string.encode() if isinstance(string, str) else string
         size = len(buf)
+        add = 0 if addr is None else 1 # address byte
+        if profile is not None: # implicit header / fixed length of profile
+            fixed = True
+            n = self._profiles[profile][0]
+            if size < n:
+                buf = bytes(buf) + bytes(n - size)
+            size = n
         
         if self._mode == 0: # LoRa mode
             self.setImplicitHeaderMode(fixed)
+            if self._rxPending is not None: # DIO0 edge deferred after check
+                self._readPending()
+                self.useProfile(profile)
+                self.setImplicitHeaderMode(fixed)
+            self._txData = True # next DIO0 edge is TX end
 
             # set FIFO TX base address
             self.writeReg(REG_FIFO_ADDR_PTR, FIFO_TX_BASE_ADDR)
 
             # check size
-            size = min(size, MAX_PKT_LENGTH)
+            size = min(size, MAX_PKT_LENGTH - add)
 
             # write data
-            for i in range(size):
-                self.writeReg(REG_FIFO, buf[i])
+            if add:
+                self.writeReg(REG_FIFO, addr)
+            self.writeRegs(REG_FIFO, buf if size == len(buf) else buf[:size])
         
-            # set length
-            self.writeReg(REG_PAYLOAD_LENGTH, size)
+            # set length (same for profile with address byte)
+            self._writeLength(size + add)
+
+            # wait TX slot
+            if ticks is not None:
+                while ticks_diff(ticks, ticks_us()) > 0:
+                    pass
 
             # start TX packet
             self.setMode(MODE_TX) # put in TX mode
 
             # wait for TX done, standby automatically on TX_DONE
-            while (self.readReg(REG_IRQ_FLAGS) & IRQ_TX_DONE) == 0:
-                pass # FIXME: check timeout
+            if not waitFlags(self.readReg, REG_IRQ_FLAGS, IRQ_TX_DONE,
+                             2 * self._txAirtime(size + add, fixed, profile) +
+                             TX_TIMEOUT_MARGIN):
+                self.faults['tx'] += 1
+                self.recover()
+                return False
             
             # clear IRQ's
             self.writeReg(REG_IRQ_FLAGS, IRQ_TX_DONE)
+            if self.energy:
+                self.energy.mode(MODE_STDBY) # standby automatically
            
         else: # FSK/OOK mode
             self.setFixedLen(fixed)
-            size = min(size, MAX_PKT_LENGTH) # limit size
+            size = min(size, MAX_PKT_LENGTH - add) # limit size
+            if self._rxPending is not None: # DIO0 edge deferred after check
+                self._readPending()
+                self.useProfile(profile)
+                self.setFixedLen(fixed)
 
             # set TX start FIFO condition
             #self.writeReg(REG_FIFO_THRESH, TX_START_FIFO_NOEMPTY)
             
             # wait while FIFO is no empty
-            while ((self.readReg(REG_IRQ_FLAGS_2) & IRQ2_FIFO_EMPTY) == 0):
-                pass # FIXME: check timeout
+            if not waitFlags(self.readReg, REG_IRQ_FLAGS_2, IRQ2_FIFO_EMPTY,
+                             self.airtime(FSK_FIFO_SIZE, True) + TX_TIMEOUT_MARGIN):
+                self.faults['fifo'] += 1
+                self.recover()
+                return False
+            self._txData = True # next DIO0 edge is TX end
 
             if self._fixedLen:
-                self.writeReg(REG_PAYLOAD_LEN, size) # fixed length
-                #add = 0
-            else:
-                self.writeReg(REG_FIFO, size) # variable length
-                #add = 1
+                self._writeLength(size + add) # fixed length
+                head = bytes((addr,)) if add else b''
+            else: # variable length
+                head = bytes((size + add, addr)) if add else bytes((size,))
             
             # set TX start FIFO condition
             #self.writeReg(REG_FIFO_THRESH, TX_START_FIFO_LEVEL | (size + add))
             
             # write data to FIFO
-            for i in range(size):
-                self.writeReg(REG_FIFO, buf[i])
+            if head:
+                self.writeRegs(REG_FIFO, head) # length and/or address
+            self.writeRegs(REG_FIFO, buf if size == len(buf) else buf[:size])
             
+            # wait TX slot
+            if ticks is not None:
+                while ticks_diff(ticks, ticks_us()) > 0:
+                    pass
+
             # start TX packet
             self.setMode(MODE_TX)
             
@@ -911,14 +1594,87 @@ class RADIO:
             #    pass # FIXME: check timeout
 
             # wait `PacketSent` (bit 3 in `RegIrqFlags2`)
-            while ((self.readReg(REG_IRQ_FLAGS_2) & IRQ2_PACKET_SENT) == 0):
-                pass # FIXME: check timeout
+            if not waitFlags(self.readReg, REG_IRQ_FLAGS_2, IRQ2_PACKET_SENT,
+                             2 * self._txAirtime(size + add, fixed, profile) +
+                             TX_TIMEOUT_MARGIN):
+                self.faults['tx'] += 1
+                self.recover()
+                return False
             
-            # switch to standby mode
-            self.setMode(MODE_STDBY)
+            # switch to standby mode (TX -> RX by send() if listening)
+            if self._listen is None:
+                self.setMode(MODE_STDBY)
 
         self.collect()
-        #self.aquire_lock(False) # unlock when done writing
+        return True
+
+
+    def _readPending(self):
+        # read packet of DIO0 edge deferred by send() by RX configuration of
+        # last receive() before TX data is written to FIFO
+        ticks, self._rxPending = self._rxPending, None
+        self.arbitration['pending'] += 1
+        if self._listen is not None:
+            self._rxConfig(*self._listen) # changed registers only
+        self._rxDone(ticks)
+
+
+    def _txAirtime(self, size, fixed, profile):
+        # time on air of `size` bytes sent by send() [us]
+        if profile is None:
+            return self.airtime(size, fixed)
+        prof = self._profiles[profile]
+        if size == prof[5]:
+            return prof[6] # precomputed
+        return self.airtime(size, True, prof[1], prof[2])
+
+
+    def _snapshot(self):
+        # config registers: 0x01...0x3F (page of current modem), DIO mapping,
+        # `RegPllHop`, `RegTcxo`, `RegPaDac`, `RegPll`
+        return (self.readRegs(REG_OP_MODE, 0x3F),
+                self.readRegs(REG_DIO_MAPPING_1, 2),
+                bytes((self.readReg(REG_PLL_HOP), self.readReg(REG_TCXO),
+                       self.readReg(REG_PA_DAC), self.readReg(REG_PLL))))
+
+
+    def saveConfig(self):
+        """save config registers for recover() (called by init()); call it
+           after configuration is changed to keep it on recovery"""
+        self._shadow = self._snapshot() + \
+            (tuple(getattr(self, name, None) for name in CONFIG_ATTRS),)
+
+
+    def recover(self):
+        """reset chip and restore config registers saved by init()/saveConfig()
+           by few burst writes (registers of faulty chip are never read back);
+           return False if chip does not answer"""
+        self.faults['recover'] += 1
+        if self._calOp is not None: # calibration in FSK modem
+            op, self._calOp = self._calOp, None
+            self._restoreModem(op)
+        self.reset(1, 5) # 5 ms after reset (datasheet)
+        self._length = None
+        if self.version() != 0x12:
+            self.faults['spi'] += 1
+            return False
+        if self._shadow is None:
+            self.init()
+            return True
+        page, dio, regs, attrs = self._shadow
+        for name, value in zip(CONFIG_ATTRS, attrs):
+            setattr(self, name, value)
+        op = page[0] & ~MODES_MASK
+        self._writeOpMode(MODE_SLEEP) # modem is changed in sleep only
+        self._writeOpMode(op | MODE_SLEEP)
+        self.writeRegs(REG_OP_MODE + 1, memoryview(page)[1:])
+        self.writeRegs(REG_DIO_MAPPING_1, dio)
+        self.writeReg(REG_PLL_HOP, regs[0])
+        self.writeReg(REG_TCXO,    regs[1])
+        self.writeReg(REG_PA_DAC,  regs[2])
+        self.writeReg(REG_PLL,     regs[3])
+        self.setMode(MODE_STDBY)
+        return True
 
     
     def onReceive(self, callback):
@@ -930,20 +1686,37 @@ class RADIO:
             self.pin_dio0.irq(trigger=0, handler=None)
         
 
-    def receive(self, size=0):
-        """go to RX mode; wait callback by interrupt (LoRa/FSK/OOK)"""
-        size = min(size, MAX_PKT_LENGTH)
-        if self._mode == 0: # LoRa mode
-            self.setImplicitHeaderMode(size > 0)
-            if size > 0:
-                self.writeReg(REG_PAYLOAD_LENGTH, size) # implicit header
-        else: # FSK/OOK mode
-            self.setFixedLen(size > 0)
-            if size > 0:
-                self.writeReg(REG_PAYLOAD_LEN, size) # fixed length
-            else:
-                self.writeReg(REG_PAYLOAD_LEN, MAX_PKT_LENGTH) # variable length
+    def getRxTicks(self):
+        """get `ticks_us()` captured on DIO0 edge of last received packet"""
+        return self._rxTicks
+
+
+    def receive(self, size=0, profile=None):
+        """go to RX mode; wait callback by interrupt (LoRa/FSK/OOK);
+           `profile` - receive fixed length message type (look addProfile());
+           configuration is restored after each send() (look standby())"""
+        self._listen = (size, profile)
+        self._rxConfig(size, profile)
         self.setMode(MODE_RX_CONTINUOUS)
+
+
+    def _rxConfig(self, size, profile):
+        # RX configuration of receive(): write changed registers only
+        self.useProfile(profile) # None -> modem settings
+        if profile is None:
+            if size > 0 and self._addrFilter:
+                size += 1 # address byte
+            size = min(size, MAX_PKT_LENGTH)
+            if self._mode == 0: # LoRa mode
+                self.setImplicitHeaderMode(size > 0)
+                if size > 0:
+                    self._writeLength(size) # implicit header
+            else: # FSK/OOK mode
+                self.setFixedLen(size > 0)
+                if size > 0:
+                    self._writeLength(size) # fixed length
+                else:
+                    self._writeLength(MAX_PKT_LENGTH) # variable length
                  
                  
     def collect(self):
@@ -954,49 +1727,84 @@ class RADIO:
             
 
     def _handleOnReceive(self, event_source):
-        #self.aquire_lock(True)
+        ticks = ticks_us() # timestamp DIO0 edge before any SPI traffic
+        if self._txBusy: # send() owns SPI and FIFO
+            if not self._txData: # else TX end (polled by send())
+                self._rxPending = ticks # packet is read by send()
+            return
+        reg = self._reg
+        self._reg = self._regIsr # IRQ may come inside readReg()/writeReg()
+        if self.energy:
+            self.energy.rxDone() # RX single -> standby automatically
+        try:
+            self._rxDone(ticks)
+        finally:
+            self._reg = reg
+
+
+    def _rxDone(self, ticks):
         if self._mode == 0: # LoRa mode 
-            irqFlags = self.readReg(REG_IRQ_FLAGS) # should be 0x50
-            self.writeReg(REG_IRQ_FLAGS, irqFlags)
+            irqFlags, rxBytes = self.readRegs(REG_IRQ_FLAGS, 2) # should be 0x50
+            self.writeReg(REG_IRQ_FLAGS, irqFlags & ~IRQ_TX_DONE) # `TxDone` polled by send()
 
             if (irqFlags & IRQ_RX_DONE) == 0: # check `RxDone`
-                #self.aquire_lock(False)
                 return # `RxDone` is not set
 
-            print("DIO0 interrupt in LoRa mode by `RxDone` (RegIrqFlags=0x%02X)" % irqFlags)
-
-            # check `PayloadCrcError` bit
-            crcOk = not bool (irqFlags & IRQ_PAYLOAD_CRC_ERROR)
-            
             # set FIFO address to current RX address
             self.writeReg(REG_FIFO_ADDR_PTR, self.readReg(REG_FIFO_RX_CURRENT_ADDR))
             
             # read packet length
-            packetLen = self.readReg(REG_PAYLOAD_LENGTH) if self._implicitHeaderMode else \
-                        self.readReg(REG_RX_NB_BYTES)
+            if self._profile is not None:
+                packetLen = self._profileLen # implicit header of profile
+            else:
+                packetLen = self.readReg(REG_PAYLOAD_LENGTH) if self._implicitHeaderMode else \
+                            rxBytes # `RegRxNbBytes`
+
+            # early reject foreign packet by first (address) byte
+            if self._addrFilter:
+                addr = self.readReg(REG_FIFO) if packetLen else None
+                if addr is None or (addr != self._nodeAddr and \
+                                    addr != self._broadcastAddr):
+                    self._rejected += 1
+                    return
+                packetLen -= 1
+
+            if DEBUG:
+                print("DIO0 interrupt in LoRa mode by `RxDone` (RegIrqFlags=0x%02X)" % irqFlags)
+
+            # check `PayloadCrcError` bit
+            crcOk = not bool (irqFlags & IRQ_PAYLOAD_CRC_ERROR)
+            self._rxTicks = ticks
                            
         else: # FSK/OOK mode
             irqFlags = self.readReg(REG_IRQ_FLAGS_2) # should be 0x26/0x24
             if (irqFlags & IRQ2_PAYLOAD_READY) == 0:
-                #self.aquire_lock(False)
                 return # `PayloadReady` is not set
             
-            print("DIO0 interrupt in FSK/OOK mode by `PayloadReady` (RegIrqFlags2=0x%02X)" % irqFlags)
+            if DEBUG:
+                print("DIO0 interrupt in FSK/OOK mode by `PayloadReady` (RegIrqFlags2=0x%02X)" % irqFlags)
             
             # check `CrcOk` bit
             crcOk = bool(irqFlags & IRQ2_CRC_OK)
+            self._rxTicks = ticks
             
             # read packet length
-            if self.readReg(REG_PACKET_CONFIG_1) & 0x80: # `PacketFormat`
+            if self._profile is not None:
+                packetLen = self._profileLen # fixed length of profile
+            elif self.readReg(REG_PACKET_CONFIG_1) & 0x80: # `PacketFormat`
                 packetLen = self.readReg(REG_FIFO) # variable length
             else:
                 packetLen = self.readReg(REG_PAYLOAD_LEN) # fixed length
 
+            # address byte (checked by hardware)
+            if self._addrFilter:
+                addr = self.readReg(REG_FIFO)
+                packetLen -= 1
+
+        self._rxAddr = addr if self._addrFilter else None
+
         # read FIFO
-        payload = bytearray(packetLen)
-        for i in range(packetLen):
-            payload[i] = self.readReg(REG_FIFO)
-        payload = bytes(payload)
+        payload = self.readRegs(REG_FIFO, packetLen)
         self.collect()
 
         # run callback
@@ -1004,11 +1812,12 @@ class RADIO:
             self._onReceive(self, payload, crcOk if self._crc else None)
         self.collect()
 
-        #self.aquire_lock(False)
         
     def dump(self):
-        for i in range(128):
-            print("Reg[0x%02X] = 0x%02X" % (i, self.readReg(i)))
+        print("Reg[0x00] = 0x%02X" % self.readReg(REG_FIFO))
+        regs = self.readRegs(REG_OP_MODE, 127)
+        for i in range(127):
+            print("Reg[0x%02X] = 0x%02X" % (i + 1, regs[i]))
             
 
 #*** end of "sx127x.py" module ***#
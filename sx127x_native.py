@@ -0,0 +1,48 @@
+# -*- coding: UTF8 -*-
+# Native/viper versions of "sx127x" driver hot paths
+# Licenced by GPLv3
+#
+# Imported by "sx127x.py" in try/except: on CPython (no `micropython`
+# module) or on port without native code emitter (SyntaxError) pure
+# Python versions from "sx127x.py" are used. Functions here must
+# behave exactly as `*_py` functions in "sx127x.py".
+
+import micropython
+from time import ticks_us, ticks_diff
+
+
+@micropython.viper
+def putBE(buf, value: int, size: int):
+    """put `value` to `buf` as `size` bytes big endian; return buf"""
+    p = ptr8(buf)
+    i = size - 1
+    while i >= 0:
+        p[i] = value
+        value >>= 8
+        i -= 1
+    return buf
+
+
+@micropython.native
+def xfer(write_readinto, cs, buf, address, value):
+    """one register SPI transaction by 2 bytes buffer; return read value"""
+    buf[0] = address
+    buf[1] = value
+    cs(0)
+    write_readinto(buf, buf)
+    value = buf[1]
+    cs(1)
+    return value
+
+
+@micropython.native
+def waitFlags(read, reg, mask, timeout_us):
+    """poll register until any of `mask` bits set; return False on timeout"""
+    t = ticks_us()
+    while not (read(reg) & mask):
+        if timeout_us >= 0 and ticks_diff(ticks_us(), t) >= timeout_us:
+            return False
+    return True
+
+
+#*** end of "sx127x_native.py" module ***#
@@ -0,0 +1,132 @@
+# -*- coding: UTF8 -*-
+# TDMA slot scheduler on top of "sx127x" driver (beacon synchronized)
+# Licenced by GPLv3
+#
+# Frame layout (slot 0 is the gateway beacon, slots 1...N belong to nodes):
+#
+#   | beacon | slot 1 | slot 2 | ... | slot N | beacon | slot 1 | ...
+#   ^ frame start (t0)
+#
+# Every slot is `airtime(size) + guard` microseconds long. The gateway
+# starts beacon TX exactly on the frame start. A node takes `ticks_us()`
+# captured on the DIO0 edge (`RxDone`) of the beacon, subtracts beacon
+# airtime and gets the frame start in its own clock. Node TX begins
+# `guard/2` after the start of its own slot.
+
+from sx127x import ticks_us, ticks_diff, ticks_add, sleep_ms
+
+BEACON      = 0xBE # first byte of beacon packet
+BEACON_SIZE = 6    # [BEACON, seq, slots, slot_us(MSB), slot_us(MID), slot_us(LSB)]
+
+LEAD_US   = 3000 # time reserved to load FIFO before slot start [us]
+MAX_LOST  = 8    # node loses sync after so many frames without beacon
+
+
+class TDMA:
+    def __init__(self, radio,
+                 slot      = 0,    # 0 - gateway (send beacons), 1...slots - node
+                 slots     = 8,    # number of node slots in frame
+                 size      = 32,   # max payload size [bytes] to fit in slot
+                 guard_us  = 2000, # guard time between slots [us]
+                 onReceive = None): # receive callback for non beacon packets
+        self.radio = radio
+        self.slot  = slot
+        self.slots = slots
+        self.guard = guard_us
+        self._onReceive = onReceive
+        self._beacon = bytearray(BEACON_SIZE)
+        self._seq = 0
+        self._t0 = None # frame start [ticks_us]
+        self.setSize(size)
+        radio.onReceive(self._handleOnReceive)
+
+
+    def setSize(self, size):
+        """set slot length by airtime of `size` bytes payload plus guard time"""
+        size = max(size, BEACON_SIZE)
+        self._slot = self.radio.airtime(size, False) + self.guard
+        self._frame = (self.slots + 1) * self._slot
+
+
+    def slotTime(self):
+        """get slot length [us]"""
+        return self._slot
+
+
+    def frameTime(self):
+        """get frame length [us]"""
+        return self._frame
+
+
+    def isSynced(self):
+        """check node is synchronized by fresh beacon"""
+        if self._t0 is None:
+            return False
+        return ticks_diff(ticks_us(), self._t0) < self._frame * MAX_LOST
+
+
+    def poll(self):
+        """send beacon if frame start is near (gateway only); call it often"""
+        if self.slot:
+            return False
+        now = ticks_us()
+        if self._t0 is None:
+            start = ticks_add(now, LEAD_US)
+        else:
+            start = ticks_add(self._t0, self._frame)
+            if ticks_diff(start, now) > LEAD_US:
+                return False # not yet
+            if ticks_diff(start, now) < 0: # missed frame(s)
+                start = ticks_add(now, LEAD_US)
+        b = self._beacon
+        b[0] = BEACON
+        b[1] = self._seq & 0xFF
+        b[2] = self.slots
+        b[3] = (self._slot >> 16) & 0xFF
+        b[4] = (self._slot >>  8) & 0xFF
+        b[5] =  self._slot        & 0xFF
+        self._seq += 1
+        self._t0 = start
+        self.radio.send(b, False, start)
+        self.radio.receive(0) # listen nodes
+        return True
+
+
+    def send(self, string, fixed=False):
+        """wait own slot and send packet (node only); False if not synced,
+           slot is out of frame (look beacon) or packet does not fit in slot,
+           else result of send() of radio"""
+        if not self.slot or not self.isSynced() or self.slot > self.slots:
+            return False
+        size = len(string.encode() if isinstance(string, str) else string)
+        if self.radio.airtime(size, fixed) > self._slot - self.guard:
+            return False # TX would run into next slot
+        now = ticks_us()
+        k = ticks_diff(now, self._t0) // self._frame # frames since beacon
+        start = ticks_add(self._t0,
+                          k * self._frame + self.slot * self._slot + self.guard // 2)
+        if ticks_diff(start, now) < LEAD_US:
+            start = ticks_add(start, self._frame) # too late, use next frame
+        wait_ms = (ticks_diff(start, ticks_us()) - LEAD_US) // 1000
+        if wait_ms > 0:
+            sleep_ms(wait_ms)
+        ok = self.radio.send(string, fixed, start)
+        self.radio.receive(0) # listen beacons
+        return ok
+
+
+    def _handleOnReceive(self, radio, payload, crcOk):
+        if len(payload) == BEACON_SIZE and payload[0] == BEACON and \
+           crcOk is not False:
+            if self.slot: # node: synchronize by beacon
+                self.slots = payload[2]
+                self._slot = (payload[3] << 16) | (payload[4] << 8) | payload[5]
+                self._frame = (self.slots + 1) * self._slot
+                self._t0 = ticks_add(radio.getRxTicks(),
+                                     -radio.airtime(BEACON_SIZE, False))
+                self._seq = payload[1]
+        elif self._onReceive:
+            self._onReceive(radio, payload, crcOk)
+
+
+#*** end of "tdma.py" module ***#
@@ -0,0 +1,76 @@
+# -*- coding: UTF8 -*-
+# Temperature tracking image recalibration on top of "sx127x" driver
+# Licenced by GPLv3
+#
+# Image (RSSI and IQ) calibration of SX127x is done on init() only, but
+# receiver sensitivity drifts with chip temperature. poll() samples chip
+# temperature every `period_ms` (getTemp(): few SPI transactions, LoRa
+# modem is switched to FSK for 150 us) and starts calibration if
+# temperature differs from temperature of last calibration (chip
+# `RegFormerTemp`) by `threshold` or more. Calibration (about 10 ms) is
+# not blocking: poll() restores modem and mode when it is finished.
+# Sampling and calibration run between packets only (standby, sleep or
+# RX continuous without packet in progress, look rxActive()).
+
+from sx127x import ticks_ms, ticks_diff, ticks_add, MODE_SLEEP, MODE_STDBY, \
+                   MODE_RX_CONTINUOUS
+
+RETRY_MS = 100 # retry delay if radio is busy [ms]
+
+
+class TempCal:
+    def __init__(self, radio,
+                 threshold   = 5,     # temperature drift to recalibrate [C]
+                 period_ms   = 60000, # sampling period [ms]
+                 onCalibrate = None): # callback(tempcal, temp) after calibration
+        self.radio = radio
+        self.threshold = threshold
+        self.period = period_ms
+        self.onCalibrate = onCalibrate
+        self.temp = None      # last sample [C]
+        self.samples = 0      # temperature samples
+        self.calibrations = 0 # calibrations started
+        self.deferred = 0     # samples deferred by busy radio
+        self._due = ticks_ms() # first sample on first poll()
+        self._busy = False    # calibration in progress
+
+
+    def poll(self):
+        """sample temperature and recalibrate on drift; call it often from
+           main loop; return True while calibration runs (radio is off)"""
+        radio = self.radio
+        if self._busy:
+            if not radio.calibrated():
+                return True
+            self._busy = False
+            if self.onCalibrate:
+                self.onCalibrate(self, radio.getCalTemp())
+            return False
+        now = ticks_ms()
+        if ticks_diff(now, self._due) < 0:
+            return False
+        if radio.getMode() not in (MODE_SLEEP, MODE_STDBY, MODE_RX_CONTINUOUS) \
+           or radio.rxActive(): # TX, RX single, CAD or packet on air
+            self.deferred += 1
+            self._due = ticks_add(now, RETRY_MS)
+            return False
+        self._due = ticks_add(now, self.period)
+        self.temp = radio.getTemp()
+        self.samples += 1
+        cal = radio.getCalTemp()
+        if cal is not None and abs(self.temp - cal) < self.threshold:
+            return False
+        self.calibrations += 1
+        radio.startCalibrate()
+        self._busy = True
+        return True
+
+
+    def report(self):
+        """print temperature and counters"""
+        print("temp=%s C  calibrated at %s C  samples=%d  calibrations=%d  deferred=%d" % (
+              self.temp, self.radio.getCalTemp(), self.samples,
+              self.calibrations, self.deferred))
+
+
+#*** end of "tempcal.py" module ***#
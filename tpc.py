@@ -0,0 +1,124 @@
+# -*- coding: UTF8 -*-
+# Closed-loop transmit power control (TPC) per peer on top of "sx127x"
+# driver
+# Licenced by GPLv3
+#
+# Two feedback sources (any or both):
+#  * link margin - SNR (LoRa) or RSSI (FSK/OOK) of our packet reported
+#    by peer (or measured on its ACK if link is symmetric): power is set
+#    to keep `margin_db` above demodulation limit
+#  * delivery    - ACK received/lost: if packet error rate (PER) over
+#    `window` packets exceeds `target_per` power goes up by `step_db`;
+#    clean window lets power go down by `step_db` (probing)
+#
+# Register codes of every level are precomputed (look powerCodes() in
+# "sx127x.py"), so power change per packet is one cached register write.
+
+from math import floor
+from sx127x import powerCodes
+
+# LoRa demodulator SNR limit per SF [dB] (SX1276/77/78/79 datasheet)
+SNR_LIMIT = {6: -5., 7: -7.5, 8: -10., 9: -12.5, 10: -15., 11: -17.5, 12: -20.}
+
+
+class TPC:
+    def __init__(self, radio,
+                 min_dBm     = 2,      # minimum TX power [dBm]
+                 max_dBm     = 17,     # maximum TX power [dBm] (20 - high power)
+                 PA_BOOST    = True,   # PA_BOOST pin (or RFO)
+                 margin_db   = 6.,     # target link margin [dB]
+                 target_per  = 0.1,    # target packet error rate
+                 window      = 16,     # PER window [packets]
+                 step_db     = 2,      # PER driven step [dB]
+                 sensitivity = -110.,  # RSSI limit for FSK/OOK margin [dBm]
+                 peers       = 32):    # maximum tracked peers
+        self.radio = radio
+        self.min = min_dBm
+        self.max = max_dBm
+        self._codes = [powerCodes(level, PA_BOOST)
+                       for level in range(min_dBm, max_dBm + 1)]
+        self.margin = margin_db
+        self.target_per = target_per
+        self.window = window
+        self.step = step_db
+        self.sensitivity = sensitivity
+        self.peers = peers
+        self._peer = {} # peer -> [level dBm, sent, lost]
+
+
+    def _state(self, peer):
+        st = self._peer.get(peer)
+        if st is None:
+            st = [self.max, 0, 0] # unknown peer: full power
+            if len(self._peer) < self.peers:
+                self._peer[peer] = st
+        return st
+
+
+    def _set(self, st, level, decision=False):
+        # new PER window on level change or PER decision (also at limits)
+        level = min(max(level, self.min), self.max)
+        if decision or level != st[0]:
+            st[0] = level
+            st[1] = st[2] = 0 # new PER window
+        return level
+
+
+    def power(self, peer):
+        """get TX power level for peer [dBm]"""
+        return self._state(peer)[0]
+
+
+    def apply(self, peer):
+        """set TX power of radio for peer (cached codes); return level [dBm]"""
+        level = self._state(peer)[0]
+        self.radio.setPowerCodes(self._codes[level - self.min])
+        return level
+
+
+    def send(self, peer, payload, fixed=False, ticks=None, addr=None):
+        """set TX power for peer and send packet; return result of send()
+           of radio (True, None if aborted or False on timeout)"""
+        self.apply(peer)
+        return self.radio.send(payload, fixed, ticks, addr)
+
+
+    def onReport(self, peer, snr=None, rssi=None):
+        """link margin feedback: SNR [dB] (LoRa) or RSSI [dBm] of our packet
+           at peer; return new level [dBm]"""
+        st = self._state(peer)
+        sf = self.radio.getSF()
+        if snr is not None and sf is not None:
+            margin = snr - SNR_LIMIT[sf]
+        elif rssi is not None:
+            margin = rssi - self.sensitivity
+        else:
+            return st[0]
+        # keep target margin (fractional excess is kept as reserve)
+        return self._set(st, st[0] - int(floor(margin - self.margin)))
+
+
+    def onAck(self, peer, ok=True):
+        """delivery feedback (ACK received or lost); return new level [dBm]"""
+        st = self._state(peer)
+        st[1] += 1
+        if not ok:
+            st[2] += 1
+            if st[2] > self.target_per * self.window: # PER too high
+                return self._set(st, st[0] + self.step, True)
+        if st[1] >= self.window:
+            if st[2] <= self.target_per * self.window / 2: # clean window
+                return self._set(st, st[0] - self.step, True)
+            st[1] = st[2] = 0 # new PER window
+        return st[0]
+
+
+    def report(self):
+        """print TX power and PER counters per peer"""
+        for peer in self._peer:
+            level, sent, lost = self._peer[peer]
+            print("peer=%-4s power=%2d dBm  sent=%-3d lost=%d" % (
+                  peer, level, sent, lost))
+
+
+#*** end of "tpc.py" module ***#